@@ -0,0 +1,17 @@
+(module
+  (export "exported_main" (func $main))
+  (func $main (result i32)
+    i32.const 1
+    i32.const 3
+    i32.const 5
+    i32.mul
+    i32.add
+    i32.const 4
+    i32.const 2
+    i32.div_s
+    i32.sub
+    i32.const 3
+    i32.rem_s
+    return
+  )
+)
\ No newline at end of file
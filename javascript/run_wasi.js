@@ -1,7 +1,7 @@
 // run_wasi.js
 //  refer https://nodejs.org/api/wasi.html
 //
-// node --experimental-wasi-unstable-preview0 run_wasi.js your_wasi.wasm
+// node run_wasi.js your_wasi.wasm
 
 "use strict";
 
@@ -12,13 +12,17 @@ console.warn("Loading wasm/wasi file: " + filename);
 
 const { WASI } = require("wasi");
 const wasi = new WASI({
+  version: "preview1",
   args: process.argv,
   env: process.env,
   preopens: {
     //'/sandbox': '/some/real/path/that/wasm/can/access'
   },
 });
-const importObject = { wasi_unstable: wasi.wasiImport };
+const importObject = {
+  wasi_snapshot_preview1: wasi.wasiImport,
+  wasi_unstable: wasi.wasiImport,
+};
 
 (async () => {
   const wasm = await WebAssembly.compile(fs.readFileSync(filename)).catch(
@@ -0,0 +1,154 @@
+"""
+Batch compilation over a process pool.
+
+`compile_many()` compiles independent sources in parallel, in chunks,
+and returns one `BatchResult` per source, in input order. A source that
+fails to compile gets its error recorded in its result; the rest of the
+batch goes on. It goes on too when a worker dies: the sources not
+compiled yet are compiled in a new pool, the first of them on its own,
+which tells whether it is the one that killed the worker.
+
+The CLI writes each output at the path of its input relative to their
+common directory, under the output directory.
+
+Usage:
+    python -m py2wasm_sandbox.step6.batch -j 4 -o build/ a.py b.py ...
+    python -m py2wasm_sandbox.step6.batch --binary --target wasi a.py
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import NamedTuple
+
+from .compiler import compile, compile_binary
+from .layout import TARGETS
+
+
+class BatchResult(NamedTuple):
+    output: str | bytes | None
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def compile_one(source: str, binary: bool, options: dict) -> BatchResult:
+    try:
+        if binary:
+            return BatchResult(compile_binary(source, **options))
+        return BatchResult(compile(source, **options))
+    except Exception as e:
+        return BatchResult(None, f"{type(e).__name__}: {e}")
+
+
+def _compile_one(args) -> BatchResult:
+    return compile_one(*args)
+
+
+def _compile_chunk(tasks) -> list[BatchResult]:
+    return [compile_one(*args) for args in tasks]
+
+
+def compile_alone(task) -> BatchResult:
+    """Compile `task` in a process of its own; record its death as an error."""
+    with ProcessPoolExecutor(1) as executor:
+        try:
+            return executor.submit(_compile_one, task).result()
+        except BrokenProcessPool as e:
+            return BatchResult(None, f"{type(e).__name__}: {e}")
+
+
+def compile_many(
+    sources,
+    workers: int | None = None,
+    chunksize: int | None = None,
+    binary: bool = False,
+    stream: bool = False,
+    **options,
+):
+    """Compile `sources` on `workers` processes (default: one per CPU).
+
+    Returns a list of `BatchResult`, in the order of `sources`, or, if
+    `stream` is true, an iterator yielding them as they are ready (still
+    in order). Other keyword arguments are passed to the compiler.
+    """
+    sources = list(sources)
+    workers = workers or os.cpu_count() or 1
+    tasks = [(source, binary, options) for source in sources]
+
+    if workers == 1:
+        results = map(_compile_one, tasks)
+        return results if stream else list(results)
+
+    if chunksize is None:
+        # A few chunks per worker, to balance uneven sources
+        chunksize = max(1, len(tasks) // (workers * 4))
+
+    def run():
+        done = 0
+        alone = False
+        while done < len(tasks):
+            if alone:
+                yield compile_alone(tasks[done])
+                done += 1
+                alone = False
+                continue
+            with ProcessPoolExecutor(workers) as executor:
+                futures = [
+                    executor.submit(_compile_chunk, tasks[start : start + chunksize])
+                    for start in range(done, len(tasks), chunksize)
+                ]
+                try:
+                    for future in futures:
+                        for result in future.result():
+                            yield result
+                            done += 1
+                except BrokenProcessPool:
+                    # Every pending chunk fails with it, whichever killed the worker
+                    alone = True
+
+    return run() if stream else list(run())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compile Python files to WebAssembly.")
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("-o", "--output", type=Path, default=Path("."), help="output directory")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=None)
+    parser.add_argument("--binary", action="store_true", help="write .wasm instead of .wat")
+    parser.add_argument("--target", choices=TARGETS, default="js")
+    args = parser.parse_args(argv)
+
+    sources = [path.read_text() for path in args.files]
+    # Inputs with the same name in different directories get different outputs
+    paths = [path.resolve() for path in args.files]
+    root = Path(os.path.commonpath([path.parent for path in paths]))
+    results = compile_many(
+        sources, args.workers, args.chunksize, binary=args.binary, stream=True, target=args.target
+    )
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    suffix = ".wasm" if args.binary else ".wat"
+    failures = 0
+    for path, resolved, result in zip(args.files, paths, results):
+        if not result.ok:
+            failures += 1
+            print(f"{path}: {result.error}", file=sys.stderr)
+            continue
+        output = args.output / resolved.relative_to(root).with_suffix(suffix)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        if args.binary:
+            output.write_bytes(result.output)
+        else:
+            output.write_text(result.output)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""
+Benchmark: batch compilation with 1, 2, 4 and 8 workers.
+
+Usage: python -m py2wasm_sandbox.step6.bench_batch [PROGRAMS] [STATEMENTS]
+"""
+import os
+import sys
+import time
+
+from .batch import compile_many
+from .synth import synthesize
+
+
+def main(programs: int = 400, statements: int = 200):
+    sources = [synthesize(statements=statements, seed=seed) for seed in range(programs)]
+    print(f"{programs} programs of {statements} statements, {os.cpu_count()} CPUs")
+
+    baseline = None
+    for workers in (1, 2, 4, 8):
+        start = time.perf_counter()
+        results = compile_many(sources, workers=workers, binary=True)
+        elapsed = time.perf_counter() - start
+        assert all(result.ok for result in results)
+
+        baseline = baseline or elapsed
+        print(
+            f"{workers} workers: {elapsed:7.2f} s  {programs / elapsed:8.1f} programs/s"
+            f"  speedup {baseline / elapsed:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,52 @@
+"""
+Benchmark: `compile()` + `wat2wasm` subprocess vs. `compile_binary()`.
+
+Usage: python -m py2wasm_sandbox.step6.bench_binary [N]
+"""
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .compiler import compile, compile_binary
+from .test_step6 import PROG
+
+
+def via_wat2wasm(source: str, workdir: Path) -> bytes:
+    wat = workdir / "generated.wat"
+    wasm = workdir / "generated.wasm"
+    wat.write_text(compile(source))
+    subprocess.check_call(["wat2wasm", "-o", str(wasm), str(wat)])
+    return wasm.read_bytes()
+
+
+def timeit(func, n: int) -> float:
+    func()  # warm up
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - start) / n
+
+
+def main(n: int = 200):
+    binary = timeit(lambda: compile_binary(PROG), n)
+    print(f"compile_binary:     {binary * 1e6:10.1f} us/module")
+
+    if not shutil.which("wat2wasm"):
+        text = timeit(lambda: compile(PROG), n)
+        print(f"compile (text):     {text * 1e6:10.1f} us/module")
+        print("wat2wasm not found, comparison skipped")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        assert via_wat2wasm(PROG, workdir) == compile_binary(PROG)
+        subprocess_time = timeit(lambda: via_wat2wasm(PROG, workdir), n)
+    print(f"compile + wat2wasm: {subprocess_time * 1e6:10.1f} us/module")
+    print(f"speedup:            {subprocess_time / binary:10.1f}x")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,58 @@
+"""
+Benchmark: rendering of large and deeply nested programs.
+
+Usage: python -m py2wasm_sandbox.step6.bench_block
+"""
+import ast
+import time
+import tracemalloc
+
+from .compiler import compile_tree
+
+
+def flat_program(n: int) -> ast.Module:
+    """`x = 0` followed by `n` statements `x = x + 1`."""
+    return ast.parse("x = 0\n" + "x = x + 1\n" * n)
+
+
+def nested_program(depth: int) -> ast.Module:
+    """`depth` nested `if x:` statements around `putn(x)`.
+
+    Built directly as an AST: the Python tokenizer refuses more than 100
+    indentation levels.
+    """
+    body = ast.parse("putn(x)").body
+    for _ in range(depth):
+        body = [ast.If(test=ast.Name("x", ast.Load()), body=body, orelse=[])]
+    return ast.Module(body=ast.parse("x = 1").body + body, type_ignores=[])
+
+
+def measure(tree: ast.Module) -> tuple[float, int, int]:
+    start = time.perf_counter()
+    wat = compile_tree(tree)
+    elapsed = time.perf_counter() - start
+
+    # Separate run: tracing allocations distorts timings
+    tracemalloc.start()
+    compile_tree(tree)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak, len(wat)
+
+
+def main():
+    cases = {
+        "10k statements": flat_program(10_000),
+        "5000-deep nesting": nested_program(5_000),
+    }
+    for label, tree in cases.items():
+        elapsed, peak, size = measure(tree)
+        print(
+            f"{label:18} {elapsed * 1e3:8.1f} ms"
+            f"  peak {peak / 1e6:7.2f} MB  output {size / 1e3:8.1f} kB"
+        )
+
+
+if __name__ == "__main__":
+    main()
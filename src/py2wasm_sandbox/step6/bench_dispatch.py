@@ -0,0 +1,92 @@
+"""
+Microbenchmark: per-node cost of dispatching in `generate()`.
+
+Compares a lookup in the `GENERATORS` registry with the structural
+`match` it replaced (same patterns, same order), over every node
+`generate()` visits in a large synthetic program, then reports the
+whole of `generate()` per node.
+
+Usage: python -m py2wasm_sandbox.step6.bench_dispatch [STATEMENTS]
+"""
+import ast
+import sys
+import time
+
+from . import compiler
+from .compiler import GENERATORS, generate, generate_node
+from .synth import synthesize
+
+
+def match_dispatch(tree):
+    """The dispatch of the former `generate()`; returns the case number."""
+    match tree:
+        case ast.Module(body):
+            return 0
+        case [*nodes]:
+            return 1
+        case ast.Expr(value):
+            return 2
+        case ast.Constant(value):
+            return 3
+        case ast.BinOp(left, op, right):
+            return 4
+        case ast.Compare(left, ops, comparators):
+            return 5
+        case int(n):
+            return 6
+        case ast.Call(func, args):
+            return 7
+        case ast.Assign(targets, value):
+            return 8
+        case ast.Name(id):
+            return 9
+        case ast.If(test, body, orelse):
+            return 10
+        case ast.While(test, body, orelse):
+            return 11
+
+
+def registry_dispatch(tree):
+    return GENERATORS[type(tree)]
+
+
+def visited(tree) -> list:
+    """Every node `generate()` is called on, lists and ints included."""
+    nodes = []
+
+    def record(node, lctx):
+        nodes.append(node)
+        return generate_node(node, lctx)
+
+    compiler.generate_node = record
+    try:
+        generate(tree, {})
+    finally:
+        compiler.generate_node = generate_node
+    return nodes
+
+
+def per_node(func, nodes, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for node in nodes:
+            func(node)
+        best = min(best, time.perf_counter() - start)
+    return best / len(nodes)
+
+
+def main(statements: int = 10_000):
+    tree = ast.parse(synthesize(statements=statements))
+    nodes = visited(tree)
+    print(f"{len(nodes)} nodes")
+    print(f"match     {per_node(match_dispatch, nodes) * 1e9:8.1f} ns/node")
+    print(f"registry  {per_node(registry_dispatch, nodes) * 1e9:8.1f} ns/node")
+
+    start = time.perf_counter()
+    generate(tree, {})
+    print(f"generate  {(time.perf_counter() - start) / len(nodes) * 1e9:8.1f} ns/node")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,75 @@
+"""
+Microbenchmark: `for` loops over `range()`, against the equivalent `while`.
+
+Each kernel is written both ways, compiled with the AST code generator
+and through the IR, and run in Node. The time spent in `exported_main`
+and the size of the module are reported: the `for` loop should be as
+fast as the `while` loop, with a counter of its own (see `loops.py`).
+
+Usage: python -m py2wasm_sandbox.step6.bench_for [N]
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+from .bench_loop import run
+from .compiler import compile_binary
+
+KERNELS = {
+    "sum": (
+        """
+total = 0
+for i in range({n}):
+    total = total + i
+putn(total)
+0
+""",
+        """
+total = 0
+i = 0
+while i < {n}:
+    total = total + i
+    i = i + 1
+putn(total)
+0
+""",
+    ),
+    # The sign of the step is only known at runtime: the test selects a comparison
+    "step": (
+        """
+total = 0
+step = 3
+for i in range({n}, 0, 0 - step):
+    total = total + i % 7
+putn(total)
+0
+""",
+        """
+total = 0
+step = 3
+i = {n}
+while i > 0:
+    total = total + i % 7
+    i = i - step
+putn(total)
+0
+""",
+    ),
+}
+
+
+def main(n: int = 10**7):
+    print(f"{'kernel':8} {'loop':>6} {'code':>5} {'size':>8} {'time':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for name, kernels in KERNELS.items():
+            for loop, kernel in zip(("for", "while"), kernels):
+                for ir in (False, True):
+                    wasm = compile_binary(kernel.format(n=n), ir=ir)
+                    elapsed = run(wasm, workdir)
+                    label = "ir" if ir else "ast"
+                    print(f"{name:8} {loop:>6} {label:>5} {len(wasm):6d} B {elapsed:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,84 @@
+"""
+Microbenchmark: call-heavy kernels, with and without inlining.
+
+Each kernel calls small functions from a hot loop; it is compiled through
+the IR with and without `inline` (see `inline.py`), and run in Node. The
+time spent in `exported_main` and the size of the module are reported.
+
+Usage: python -m py2wasm_sandbox.step6.bench_inline [N]
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+from .bench_loop import run
+from .compiler import compile_binary
+
+KERNELS = {
+    # A leaf function with an expression body
+    "add": """
+def add(a, b):
+    return a + b
+
+i = 0
+total = 0
+while i < {n}:
+    total = add(total, i)
+    i = add(i, 1)
+putn(total)
+0
+""",
+    # Several returns: the copy merges them with a phi
+    "clamp": """
+def clamp(x, lo, hi):
+    if x < lo:
+        return lo
+    if x > hi:
+        return hi
+    return x
+
+i = 0
+total = 0
+while i < {n}:
+    total = total + clamp(i % 100, 10, 90)
+    i = i + 1
+putn(total)
+0
+""",
+    # Functions that become leaves once their own calls are inlined
+    "nested": """
+def square(x):
+    return x * x
+
+def twice(x):
+    return x + x
+
+def mix(x):
+    return square(x) - twice(x)
+
+i = 0
+total = 0
+while i < {n}:
+    total = total + mix(i % 1000)
+    i = i + 1
+putn(total)
+0
+""",
+}
+
+
+def main(n: int = 10**7):
+    print(f"{'kernel':10} {'inlining':>10} {'size':>8} {'time':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for name, kernel in KERNELS.items():
+            source = kernel.format(n=n)
+            for inline in (False, True):
+                wasm = compile_binary(source, ir=True, inline=inline)
+                elapsed = run(wasm, workdir)
+                label = "on" if inline else "off"
+                print(f"{name:10} {label:>10} {len(wasm):6d} B {elapsed:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
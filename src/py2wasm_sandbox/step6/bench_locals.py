@@ -0,0 +1,33 @@
+"""
+Report: locals of `$main` and module size, without and with local
+allocation (see `liveness.py`), on the benchmark suite's programs.
+
+Usage: python -m py2wasm_sandbox.step6.bench_locals
+"""
+import time
+from collections import Counter
+
+from .bench_suite import CASES
+from .compiler import compile, compile_binary
+
+
+def main():
+    print(f"{'case':16} {'locals':>15} {'wasm bytes':>19} {'copies':>7} {'time':>8}")
+    for name, make in CASES.items():
+        source = make()
+        before = compile(source, allocate=False).count("(local ")
+        size_before = len(compile_binary(source, allocate=False))
+
+        stats = Counter()
+        start = time.perf_counter()
+        wasm = compile_binary(source, stats=stats)
+        elapsed = time.perf_counter() - start
+        after = compile(source).count("(local ")
+        print(
+            f"{name:16} {before:6d} -> {after:5d}  {size_before:8d} -> {len(wasm):7d}"
+            f"  {stats['coalesced_copies']:6d}  {elapsed:6.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Microbenchmark: rotated `while` loops vs. the former `loop`/`if`/`br` form.
+
+Runs `while i < N: i = i + 1` (the loop of test_step6, scaled up) in Node
+and reports the time spent in `exported_main`.
+
+Usage: python -m py2wasm_sandbox.step6.bench_loop [N]
+"""
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from .binary import encode_module
+from .compiler import compile_binary
+
+PROG = """
+i = 0
+while i < {n}:
+    i = i + 1
+putn(i)
+0
+"""
+
+# What step6 generated for PROG before loop rotation
+UNROTATED = """
+i32.const 0
+local.set $i
+loop
+  local.get $i
+  i32.const {n}
+  i32.lt_s
+  if
+    local.get $i
+    i32.const 1
+    i32.add
+    local.set $i
+    br 1
+  end
+end
+local.get $i
+call $putn
+i32.const 0
+return
+"""
+
+# language=javascript
+JS = """
+const fs = require("fs");
+const bytes = fs.readFileSync(process.argv[2]);
+const importObject = { env: { js_putn: (n) => {} } };
+
+(async () => {
+  const { instance } = await WebAssembly.instantiate(bytes, importObject);
+  const main = instance.exports.exported_main;
+  main(); // warm up
+  const start = performance.now();
+  main();
+  console.log(performance.now() - start);
+})();
+"""
+
+
+def run(wasm: bytes, workdir: Path) -> float:
+    """Return the runtime of `exported_main`, in ms."""
+    (workdir / "bench.wasm").write_bytes(wasm)
+    (workdir / "bench.js").write_text(JS)
+    output = subprocess.check_output(
+        ["node", str(workdir / "bench.js"), str(workdir / "bench.wasm")]
+    )
+    return float(output)
+
+
+def main(n: int = 10**8):
+    before = encode_module(["$i"], UNROTATED.format(n=n).split("\n"))
+    # Rotation alone, then with the unrolling that follows it by default
+    after = compile_binary(PROG.format(n=n), unroll=False)
+    unrolled = compile_binary(PROG.format(n=n))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        before_time = run(before, workdir)
+        after_time = run(after, workdir)
+        unrolled_time = run(unrolled, workdir)
+
+    print(f"loop/if/br:       {before_time:8.1f} ms")
+    print(f"block/loop/br_if: {after_time:8.1f} ms")
+    print(f"speedup:          {before_time / after_time:8.2f}x")
+    print(f"unrolled:         {unrolled_time:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,83 @@
+"""
+Benchmark: a loop printing 10^6 values, with one host call per value
+("call" output) vs through the buffer in linear memory ("buffer").
+
+Two hosts, in Node: one adding up the values it receives (timing
+`exported_main` only), and the test harness, which prints them (timing
+the whole run). Printing is where per-value calls hurt: `console.log()`
+is called once per value instead of once per flush.
+
+Usage: python -m py2wasm_sandbox.step6.bench_output [COUNT]
+"""
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .compiler import compile_binary
+from .test_step6 import run_node
+
+# language=javascript
+JS = """
+const fs = require("fs");
+const bytes = fs.readFileSync(process.argv[2]);
+let memory = null;
+let total = 0;
+const importObject = {
+  env: {
+    js_putn: (n) => { total += n; },
+    js_flush: (address, count) => {
+      for (const n of new Int32Array(memory.buffer, address, count)) total += n;
+    },
+  },
+};
+
+const instance = new WebAssembly.Instance(new WebAssembly.Module(bytes), importObject);
+memory = instance.exports.memory;
+let best = Infinity;
+for (let i = 0; i < 5; i++) {
+  total = 0;
+  const start = performance.now();
+  instance.exports.exported_main();
+  best = Math.min(best, performance.now() - start);
+}
+console.log(best, total);
+"""
+
+
+def main(count: int = 1_000_000):
+    source = f"""
+i = 0
+while i < {count}:
+    putn(i)
+    i = i + 1
+0
+"""
+    with tempfile.TemporaryDirectory() as tmp:
+        script = Path(tmp) / "bench.js"
+        script.write_text(JS)
+        times = {}
+        for output in ("call", "buffer"):
+            wasm = compile_binary(source, output=output)
+            path = Path(tmp) / f"{output}.wasm"
+            path.write_bytes(wasm)
+            milliseconds, total = subprocess.check_output(["node", script, path]).split()
+
+            start = time.perf_counter()
+            assert len(run_node(wasm, Path(tmp))) == count
+            printing = time.perf_counter() - start
+
+            times[output] = float(milliseconds), printing
+            print(
+                f"{output:8} sum {float(milliseconds):8.2f} ms (total {int(total)})"
+                f"  print {printing:6.2f} s"
+            )
+    print(
+        f"speedup  sum {times['call'][0] / times['buffer'][0]:8.2f}x"
+        f"  print {times['call'][1] / times['buffer'][1]:6.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
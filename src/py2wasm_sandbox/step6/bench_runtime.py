@@ -0,0 +1,68 @@
+"""
+Benchmark: running compiled programs in-process (pywasm), in a new Node
+process each, and in a pool of persistent Node workers.
+
+A new Node pays its startup for each program, then runs fast; pywasm
+starts instantly and interprets slowly. Small programs (the tests) favour
+pywasm, loop-heavy ones favour Node; persistent workers get both.
+
+Usage: python -m py2wasm_sandbox.step6.bench_runtime [PROGRAMS]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .compiler import compile_binary
+from .node import NodePool
+from .runtime import run
+from .synth import kernel, synthesize
+from .test_step6 import run_node
+
+CASES = {
+    "small": lambda programs: [
+        synthesize(statements=50, loops=0, seed=seed) for seed in range(programs)
+    ],
+    "loops": lambda programs: [
+        synthesize(statements=100, loops=0.2, seed=seed) for seed in range(programs)
+    ],
+    "kernel": lambda programs: [kernel(100, 100)] * max(1, programs // 10),
+}
+
+
+def timed(func, modules) -> float:
+    start = time.perf_counter()
+    for wasm in modules:
+        func(wasm)
+    return time.perf_counter() - start
+
+
+def main(programs: int = 20):
+    with tempfile.TemporaryDirectory() as tmp, NodePool() as pool:
+        for name, make in CASES.items():
+            modules = [compile_binary(source) for source in make(programs)]
+            node = timed(lambda wasm: run_node(wasm, Path(tmp)), modules)
+            cold = timed(run, modules)
+            warm = timed(run, modules)  # parsed modules are cached
+            workers = timed(pool.run, modules)
+            workers_warm = timed(pool.run, modules)
+            print(
+                f"{name:8} {len(modules):4d} programs"
+                f"  node {node * 1e3 / len(modules):8.2f} ms"
+                f"  pywasm {cold * 1e3 / len(modules):8.2f} ms"
+                f" (cached {warm * 1e3 / len(modules):8.2f} ms)"
+                f"  workers {workers * 1e3 / len(modules):8.2f} ms"
+                f" (cached {workers_warm * 1e3 / len(modules):8.2f} ms)"
+            )
+
+        modules = [compile_binary(source) for source in CASES["small"](programs)]
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 1:
+            pool.map(modules)
+            count += len(modules)
+        print(f"workers: {count / (time.perf_counter() - start):.0f} executions/s")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
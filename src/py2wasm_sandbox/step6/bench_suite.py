@@ -0,0 +1,188 @@
+"""
+Compiler benchmark suite, on synthetic programs.
+
+For each case, measures compile throughput (statements/s), peak memory
+during compilation, output size and, when Node is available, the
+execution time of the compiled module. Results are saved as JSON;
+`--compare` checks them against a previous run and exits with status 1
+when a metric regressed by more than the threshold.
+
+Usage:
+    python -m py2wasm_sandbox.step6.bench_suite -o results.json
+    python -m py2wasm_sandbox.step6.bench_suite --compare baseline.json
+    python -m py2wasm_sandbox.step6.bench_suite --ir --compare baseline.json
+
+`--no-unroll` and `--unroll-factor` show what loop unrolling trades:
+compare the wasm size and run time of `unroll-kernel` with and without.
+"""
+import argparse
+import ast
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from .compiler import compile, compile_binary
+from .synth import kernel, synthesize
+
+CASES = {
+    "statements-1k": lambda: synthesize(statements=1_000),
+    "statements-10k": lambda: synthesize(statements=10_000),
+    "nesting-50": lambda: synthesize(statements=2_000, depth=50, loops=0),
+    "variables-500": lambda: synthesize(statements=2_000, variables=500),
+    "chains-50": lambda: synthesize(statements=500, chain=50),
+    "while-kernel": lambda: kernel(iterations=10_000, inner=1_000),
+    # An inner loop of a constant, small trip count
+    "unroll-kernel": lambda: kernel(iterations=1_000_000, inner=8),
+}
+
+# Metrics where larger is better; for the others, smaller is better
+HIGHER_IS_BETTER = {"statements_per_second"}
+
+# language=javascript
+JS = """
+const fs = require("fs");
+const bytes = fs.readFileSync(process.argv[2]);
+const importObject = { env: { js_putn: (n) => {} } };
+
+(async () => {
+  const { instance } = await WebAssembly.instantiate(bytes, importObject);
+  const start = performance.now();
+  instance.exports.exported_main();
+  console.log(performance.now() - start);
+})();
+"""
+
+
+def count_statements(source: str) -> int:
+    return sum(isinstance(node, ast.stmt) for node in ast.walk(ast.parse(source)))
+
+
+def best_time(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def peak_memory(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def execution_time(wasm: bytes) -> float:
+    """Time spent in `exported_main`, in seconds."""
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        (workdir / "bench.wasm").write_bytes(wasm)
+        (workdir / "bench.js").write_text(JS)
+        output = subprocess.check_output(
+            ["node", str(workdir / "bench.js"), str(workdir / "bench.wasm")]
+        )
+    return float(output) / 1000
+
+
+def measure(source: str, repeat: int = 3, **options) -> dict:
+    seconds = best_time(lambda: compile_binary(source, **options), repeat)
+    wasm = compile_binary(source, **options)
+    result = {
+        "statements": count_statements(source),
+        "compile_seconds": seconds,
+        "statements_per_second": count_statements(source) / seconds,
+        "peak_memory_bytes": peak_memory(lambda: compile_binary(source, **options)),
+        "wat_bytes": len(compile(source, **options)),
+        "wasm_bytes": len(wasm),
+    }
+    if shutil.which("node"):
+        result["execution_seconds"] = execution_time(wasm)
+    return result
+
+
+def run(cases: list[str], repeat: int = 3, **options) -> dict:
+    results = {}
+    for name in cases:
+        results[name] = measure(CASES[name](), repeat, **options)
+        print(f"{name:16} " + format_result(results[name]), file=sys.stderr)
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "options": options,
+        "results": results,
+    }
+
+
+def format_result(result: dict) -> str:
+    text = (
+        f"{result['statements_per_second']:10.0f} stmt/s"
+        f"  peak {result['peak_memory_bytes'] / 1e6:7.2f} MB"
+        f"  wasm {result['wasm_bytes']:8d} B"
+    )
+    if "execution_seconds" in result:
+        text += f"  run {result['execution_seconds'] * 1e3:8.2f} ms"
+    return text
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Return a description of every metric that regressed by more than `threshold`."""
+    regressions = []
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        for metric, value in result.items():
+            if metric == "statements" or metric not in old or not old[metric]:
+                continue
+            ratio = value / old[metric]
+            if metric in HIGHER_IS_BETTER:
+                ratio = 1 / ratio if ratio else float("inf")
+            if ratio > 1 + threshold:
+                regressions.append(f"{name}: {metric} {old[metric]:.4g} -> {value:.4g}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("cases", nargs="*", help=f"cases to run (default: all of {', '.join(CASES)})")
+    parser.add_argument("-o", "--output", help="save results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ir", action="store_true", help="compile through the IR")
+    parser.add_argument("--no-unroll", action="store_true", help="don't unroll loops")
+    parser.add_argument("--unroll-factor", type=int, help="copies per iteration of partially unrolled loops")
+    args = parser.parse_args(argv)
+    for name in args.cases:
+        if name not in CASES:
+            parser.error(f"unknown case {name!r}")
+
+    options = {"ir": True} if args.ir else {}
+    if args.no_unroll:
+        options["unroll"] = False
+    if args.unroll_factor is not None:
+        options["unroll_factor"] = args.unroll_factor
+    current = run(args.cases or list(CASES), args.repeat, **options)
+    if args.output:
+        Path(args.output).write_text(json.dumps(current, indent=2))
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(baseline, current, args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Microbenchmark: dispatch on an integer, with and without jump tables.
+
+Each kernel runs an `if`/`elif` ladder on a value that changes at every
+iteration. It is compiled from the AST and through the IR, as a jump
+table or a binary search (see `switch.py`), and as the chain of
+comparisons it is written as, by raising `switch.MIN_CASES` past its
+number of values. The time spent in `exported_main` and the size of the
+module are reported.
+
+Usage: python -m py2wasm_sandbox.step6.bench_switch [N]
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+from . import switch
+from .bench_loop import run
+from .compiler import compile_binary
+
+CASES = 16
+
+
+def kernel(values: list[int]) -> str:
+    arms = "\n    el".join(
+        f"if k == {value}:\n        total = total + {i + 1}" for i, value in enumerate(values)
+    )
+    return f"""
+i = 0
+total = 0
+while i < {{n}}:
+    k = i % {CASES * 2}
+    {arms}
+    else:
+        total = total - 1
+    i = i + 1
+putn(total)
+0
+"""
+
+
+KERNELS = {
+    # Consecutive values: a `br_table`
+    "dense": kernel(list(range(CASES))),
+    # Spread out: a binary search
+    "sparse": kernel([value * 2 + value % 3 for value in range(CASES)]),
+}
+
+
+def main(n: int = 10**7):
+    print(f"{'kernel':8} {'dispatch':>9} {'code':>5} {'size':>8} {'time':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for name, source in KERNELS.items():
+            source = source.format(n=n)
+            for label, min_cases in (("ladder", CASES + 1), ("switch", switch.MIN_CASES)):
+                for ir in (False, True):
+                    default, switch.MIN_CASES = switch.MIN_CASES, min_cases
+                    try:
+                        wasm = compile_binary(source, ir=ir)
+                    finally:
+                        switch.MIN_CASES = default
+                    elapsed = run(wasm, workdir)
+                    code = "ir" if ir else "ast"
+                    print(f"{name:8} {label:>9} {code:>5} {len(wasm):6d} B {elapsed:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
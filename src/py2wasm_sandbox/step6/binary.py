@@ -0,0 +1,315 @@
+"""
+Binary encoder for the modules laid out by the compiler (see `module.py`).
+
+Turns the textual instructions held in a `Block` directly into the
+WebAssembly binary format, so no `wat2wasm` round-trip is needed. The
+output matches what `wat2wasm` produces for the equivalent `.wat` text
+(canonical LEB128s, no custom sections).
+"""
+
+from .block import Block
+from .module import Export, Function, Import, Module
+
+MAGIC = b"\x00asm"
+VERSION = b"\x01\x00\x00\x00"
+
+# Value and block types
+I32 = 0x7F
+FUNC_TYPE = 0x60
+EMPTY_BLOCK = 0x40
+
+# Section ids
+TYPE_SECTION = 1
+IMPORT_SECTION = 2
+FUNCTION_SECTION = 3
+MEMORY_SECTION = 5
+GLOBAL_SECTION = 6
+EXPORT_SECTION = 7
+CODE_SECTION = 10
+
+# External kinds
+FUNC_KIND = 0x00
+MEMORY_KIND = 0x02
+EXPORT_KINDS = {"func": FUNC_KIND, "memory": MEMORY_KIND}
+
+MUTABLE = 0x01
+
+OPCODES = {
+    # Control
+    "unreachable": 0x00,
+    "nop": 0x01,
+    "block": 0x02,
+    "loop": 0x03,
+    "if": 0x04,
+    "else": 0x05,
+    "end": 0x0B,
+    "br": 0x0C,
+    "br_if": 0x0D,
+    "br_table": 0x0E,
+    "return": 0x0F,
+    "call": 0x10,
+    # Parametric
+    "drop": 0x1A,
+    "select": 0x1B,
+    # Variables
+    "local.get": 0x20,
+    "local.set": 0x21,
+    "local.tee": 0x22,
+    "global.get": 0x23,
+    "global.set": 0x24,
+    # Memory
+    "i32.load": 0x28,
+    "i32.load8_u": 0x2D,
+    "i32.store": 0x36,
+    "i32.store8": 0x3A,
+    # Constants
+    "i32.const": 0x41,
+    "i64.const": 0x42,
+    # Comparisons
+    "i32.eqz": 0x45,
+    "i32.eq": 0x46,
+    "i32.ne": 0x47,
+    "i32.lt_s": 0x48,
+    "i32.lt_u": 0x49,
+    "i32.gt_s": 0x4A,
+    "i32.gt_u": 0x4B,
+    "i32.le_s": 0x4C,
+    "i32.le_u": 0x4D,
+    "i32.ge_s": 0x4E,
+    "i32.ge_u": 0x4F,
+    # Arithmetic
+    "i32.clz": 0x67,
+    "i32.ctz": 0x68,
+    "i32.popcnt": 0x69,
+    "i32.add": 0x6A,
+    "i32.sub": 0x6B,
+    "i32.mul": 0x6C,
+    "i32.div_s": 0x6D,
+    "i32.div_u": 0x6E,
+    "i32.rem_s": 0x6F,
+    "i32.rem_u": 0x70,
+    "i32.and": 0x71,
+    "i32.or": 0x72,
+    "i32.xor": 0x73,
+    "i32.shl": 0x74,
+    "i32.shr_s": 0x75,
+    "i32.shr_u": 0x76,
+    "i32.rotl": 0x77,
+    "i32.rotr": 0x78,
+    "i64.mul": 0x7E,
+    "i64.shl": 0x86,
+    "i64.shr_s": 0x87,
+    "i64.shr_u": 0x88,
+    # Conversions
+    "i32.wrap_i64": 0xA7,
+    "i64.extend_i32_s": 0xAC,
+    "i64.extend_i32_u": 0xAD,
+}
+
+BLOCK_OPS = {"block", "loop", "if"}
+LABEL_OPS = {"br", "br_if"}
+LOCAL_OPS = {"local.get", "local.set", "local.tee"}
+GLOBAL_OPS = {"global.get", "global.set"}
+# Natural alignment (log2 of the access size), the default `align=`
+MEMORY_OPS = {"i32.load": 2, "i32.load8_u": 0, "i32.store": 2, "i32.store8": 0}
+
+
+# --- LEB128 ---
+def uleb128(n: int) -> bytes:
+    assert n >= 0
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def sleb128(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if (n == 0 and not byte & 0x40) or (n == -1 and byte & 0x40):
+            out.append(byte)
+            return bytes(out)
+        out.append(byte | 0x80)
+
+
+def int_immediate(text: str, bits: int = 32) -> int:
+    """Parse an `iNN.const` immediate, accepting the unsigned range like wat2wasm."""
+    n = int(text, 0)
+    if not -(2 ** (bits - 1)) <= n < 2**bits:
+        raise ValueError(f"Constant out of i{bits} range: {text}")
+    if n >= 2 ** (bits - 1):
+        n -= 2**bits
+    return n
+
+
+# --- Structure ---
+def vector(items) -> bytes:
+    items = list(items)
+    return uleb128(len(items)) + b"".join(items)
+
+
+def name(s: str) -> bytes:
+    data = s.encode("utf-8")
+    return uleb128(len(data)) + data
+
+
+def section(section_id: int, payload: bytes) -> bytes:
+    return bytes([section_id]) + uleb128(len(payload)) + payload
+
+
+def func_type(params, results) -> bytes:
+    return bytes([FUNC_TYPE]) + vector(bytes([t]) for t in params) + vector(bytes([t]) for t in results)
+
+
+# --- Instructions ---
+def encode_instructions(lines, local_index: dict, func_index: dict, global_index=None) -> bytes:
+    out = bytearray()
+    for line in lines:
+        line = line.split(";;", 1)[0].strip()
+        if not line:
+            continue
+
+        op, *args = line.split()
+        if op not in OPCODES:
+            raise NotImplementedError(f"Unknown instruction {op!r}")
+        out.append(OPCODES[op])
+
+        if op in BLOCK_OPS:
+            out.append(EMPTY_BLOCK)
+        elif op in LABEL_OPS:
+            out += uleb128(int(args[0]))
+        elif op == "br_table":
+            # The labels, then the default one
+            labels = [uleb128(int(arg)) for arg in args]
+            out += vector(labels[:-1]) + labels[-1]
+        elif op in LOCAL_OPS:
+            out += uleb128(resolve(args[0], local_index))
+        elif op in GLOBAL_OPS:
+            out += uleb128(resolve(args[0], global_index or {}))
+        elif op in MEMORY_OPS:
+            out += memarg(args, MEMORY_OPS[op])
+        elif op == "call":
+            out += uleb128(resolve(args[0], func_index))
+        elif op == "i32.const":
+            out += sleb128(int_immediate(args[0]))
+        elif op == "i64.const":
+            out += sleb128(int_immediate(args[0], 64))
+        elif args:
+            raise ValueError(f"Unexpected immediate in {line!r}")
+
+    return bytes(out)
+
+
+def resolve(ref: str, index: dict) -> int:
+    if ref.startswith("$"):
+        if ref not in index:
+            raise ValueError(f"Unknown identifier {ref!r}")
+        return index[ref]
+    return int(ref)
+
+
+def memarg(args, align: int) -> bytes:
+    """Encode `offset=N align=N` (both optional), like wat2wasm."""
+    offset = 0
+    for arg in args:
+        key, _, value = arg.partition("=")
+        if key == "offset":
+            offset = int(value, 0)
+        elif key == "align":
+            align = int(value, 0).bit_length() - 1
+        else:
+            raise ValueError(f"Unexpected memory immediate {arg!r}")
+    return uleb128(align) + uleb128(offset)
+
+
+def encode_locals(local_names) -> bytes:
+    # wat2wasm run-length encodes consecutive locals of the same type
+    count = len(local_names)
+    if not count:
+        return vector([])
+    return vector([uleb128(count) + bytes([I32])])
+
+
+# --- Module ---
+def encode(module: Module) -> bytes:
+    signatures = [(imp.params, imp.results) for imp in module.imports]
+    signatures += [(len(func.params), func.results) for func in module.functions]
+    type_index = {}
+    for sig in signatures:
+        type_index.setdefault(sig, len(type_index))
+
+    names = [imp.func for imp in module.imports] + [func.name for func in module.functions]
+    func_index = {name: i for i, name in enumerate(names)}
+    global_index = {glob.name: i for i, glob in enumerate(module.globals)}
+
+    types = vector(func_type([I32] * params, [I32] * results) for params, results in type_index)
+    imports = vector(
+        name(imp.module)
+        + name(imp.name)
+        + bytes([FUNC_KIND])
+        + uleb128(type_index[imp.params, imp.results])
+        for imp in module.imports
+    )
+    functions = vector(
+        uleb128(type_index[len(func.params), func.results]) for func in module.functions
+    )
+    exports = vector(
+        name(export.name)
+        + bytes([EXPORT_KINDS[export.kind]])
+        + uleb128(resolve(export.ref, func_index))
+        for export in module.exports
+    )
+
+    bodies = []
+    for func in module.functions:
+        local_index = {local: i for i, local in enumerate(func.params + func.locals)}
+        lines = (line for _, line in func.body.flatten())
+        body = encode_locals(func.locals)
+        body += encode_instructions(lines, local_index, func_index, global_index)
+        body += bytes([OPCODES["end"]])
+        bodies.append(uleb128(len(body)) + body)
+
+    out = MAGIC + VERSION + section(TYPE_SECTION, types)
+    if module.imports:
+        out += section(IMPORT_SECTION, imports)
+    out += section(FUNCTION_SECTION, functions)
+    if module.memory is not None:
+        # Limits without a maximum
+        out += section(MEMORY_SECTION, vector([b"\x00" + uleb128(module.memory)]))
+    if module.globals:
+        out += section(
+            GLOBAL_SECTION,
+            vector(
+                bytes([I32, MUTABLE, OPCODES["i32.const"]])
+                + sleb128(glob.value)
+                + bytes([OPCODES["end"]])
+                for glob in module.globals
+            ),
+        )
+    out += section(EXPORT_SECTION, exports)
+    out += section(CODE_SECTION, vector(bodies))
+    return out
+
+
+def encode_module(local_names, instructions) -> bytes:
+    """Encode a module with only `$main`, importing `env.js_putn` as `$putn`.
+
+    `local_names` are the `$name` locals of `$main`, in declaration order;
+    `instructions` is the body of `$main` (without the closing `end`).
+    """
+    main = Function("$main", [], 1, list(local_names), Block(instructions))
+    return encode(
+        Module(
+            [Import("env", "js_putn", "$putn", 1)],
+            [main],
+            [Export("exported_main", "func", "$main")],
+            [],
+        )
+    )
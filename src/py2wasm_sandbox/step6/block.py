@@ -0,0 +1,89 @@
+"""
+The tree of instruction lines built by the code generator.
+"""
+
+
+class Block:
+    """A tree of instruction lines and child blocks.
+
+    Children are stored by reference; nothing is copied or re-indented
+    until the whole tree is rendered, in a single pass. `items` holds
+    lines, child blocks and, whenever it changes, the indentation (an
+    int, relative to this block) that applies to the items after it.
+    """
+
+    __slots__ = ("items", "indentation", "_recorded")
+
+    INDENT = "  "
+
+    def __init__(self, lines=None):
+        self.items: list[str | Block | int] = []
+        self.indentation: int = 0
+        self._recorded: int = 0
+        for line in lines or ():
+            self << line
+
+    def __lshift__(self, other):
+        match other:
+            case str():
+                pass
+            case Block():
+                assert other.indentation == 0
+            case _:
+                raise ValueError(f"Unknown type: {type(other)}")
+
+        if self.indentation != self._recorded:
+            self.items.append(self.indentation)
+            self._recorded = self.indentation
+        self.items.append(other)
+
+    @classmethod
+    def from_flat(cls, lines) -> "Block":
+        """Inverse of `flatten()`: build a block from `(indentation, line)` pairs."""
+        block = cls()
+        for indentation, line in lines:
+            block.indentation = indentation
+            block << line
+        block.indentation = 0
+        return block
+
+    def indent(self):
+        self.indentation += 1
+
+    def dedent(self):
+        self.indentation -= 1
+
+    def flatten(self):
+        """Yield `(indentation, line)` for every line, depth first."""
+        # Frames are [base indentation, items iterator, relative indentation]
+        stack = [[0, iter(self.items), 0]]
+        while stack:
+            frame = stack[-1]
+            base, items, _ = frame
+            for item in items:
+                if isinstance(item, int):
+                    frame[2] = item
+                elif isinstance(item, Block):
+                    stack.append([base + frame[2], iter(item.items), 0])
+                    break
+                else:
+                    yield base + frame[2], item
+            else:
+                stack.pop()
+
+    @property
+    def lines(self) -> list[str]:
+        return [self.INDENT * indentation + line for indentation, line in self.flatten()]
+
+    def write(self, out):
+        """Render into a text stream (file, `io.StringIO`...)."""
+        first = True
+        for indentation, line in self.flatten():
+            if not first:
+                out.write("\n")
+            out.write(self.INDENT * indentation)
+            out.write(line)
+            first = False
+
+    def __str__(self):
+        return "\n".join(self.INDENT * indentation + line for indentation, line in self.flatten())
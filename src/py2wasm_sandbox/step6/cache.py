@@ -0,0 +1,159 @@
+"""
+Content-addressed on-disk cache for compiled modules.
+
+Artifacts are keyed by a hash of the source text, the compiler version and
+the compile options, and stored as `<dir>/<key[:2]>/<key>.wat|.wasm`.
+Writes go through a temporary file and `os.replace()`, so several
+processes can share a cache directory. The least recently used artifacts
+(by mtime, refreshed on every hit) are evicted once the directory grows
+past `max_size` bytes.
+
+The options must be JSON values (like `passes`, a list of names), except
+`stats`, which is not part of the key: it only counts the rewrites of
+the compilations that miss the cache, and is left alone by the hits.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+from . import compiler
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+@lru_cache
+def compiler_version() -> str:
+    """Fingerprint of the compiler sources, so any change invalidates the cache."""
+    digest = hashlib.sha256()
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        if not path.name.startswith(("test_", "bench_")):
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def default_directory() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "py2wasm_sandbox"
+
+
+class CompileCache:
+    def __init__(self, directory=None, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = Path(directory) if directory else default_directory()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None
+
+    def key(self, source: str, binary: bool = False, **options) -> str:
+        options.pop("stats", None)
+        for name, value in options.items():
+            try:
+                json.dumps(value)
+            except (TypeError, ValueError):
+                raise TypeError(f"Option {name}={value!r} can't be part of a cache key") from None
+        data = json.dumps(
+            {
+                "source": source,
+                "version": compiler_version(),
+                "binary": binary,
+                "options": options,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def path(self, key: str, binary: bool = False) -> Path:
+        suffix = ".wasm" if binary else ".wat"
+        return self.directory / key[:2] / (key + suffix)
+
+    def compile(self, source: str, binary: bool = False, **options) -> str | bytes:
+        """Same as `compiler.compile()` (or `compile_binary()`), through the cache."""
+        path = self.path(self.key(source, binary, **options), binary)
+
+        data = self._read(path)
+        if data is not None:
+            self.hits += 1
+            return data if binary else data.decode()
+
+        self.misses += 1
+        if binary:
+            data = compiler.compile_binary(source, **options)
+        else:
+            data = compiler.compile(source, **options).encode()
+        self._write(path, data)
+        return data if binary else data.decode()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def clear(self):
+        for path in self._entries():
+            path.unlink(missing_ok=True)
+        self._size = 0
+
+    # --- storage ---
+    def _entries(self):
+        return [
+            path
+            for path in self.directory.glob("*/*")
+            if path.suffix in (".wat", ".wasm")
+        ]
+
+    def _read(self, path: Path) -> bytes | None:
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            # Never written, or evicted by another process
+            return None
+        return data
+
+    def _write(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._scan())
+        else:
+            self._size += len(data)
+        if self._size > self.max_size:
+            self._evict()
+
+    def _scan(self) -> list:
+        """Return `(mtime, size, path)` for every entry, oldest first."""
+        entries = []
+        for path in self._entries():
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, path))
+        entries.sort()
+        return entries
+
+    def _evict(self):
+        # Rescan: other processes may have added or removed entries
+        entries = self._scan()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_size:
+                break
+            try:
+                path.unlink()
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        self._size = size
@@ -20,205 +20,733 @@
 
 import ast
 from ast import AST
+from collections.abc import Callable, Generator
+from types import GeneratorType
+from typing import NamedTuple
+
+from . import profiling
+from .binary import encode
+from .block import Block
+from .dce import eliminate_dead_code
+from .emit import emit
+from .fold import fold_constants, is_pure
+from .functions import definitions, parameters
+from .inline import inline_calls, remove_unused
+from .layout import build_module
+from .liveness import allocate_locals
+from .logic import Stored, comparisons, is_boolean, is_logical
+from .loops import counted_range, is_invariant
+from .lower import lower, lower_function
+from .module import Function, to_wat
+from .operators import BINARY_OPS, COMPARE_OPS, operator
+from .passes import DEFAULT_PASSES, PassManager
+from .peephole import optimize
+from .profiling import phase
+from .strength import reduce_strength
+from .switch import Comparisons, Split, Switch, Table, ladder, match_switch, plan
+from .unroll import UNROLL_FACTOR, unroll_loops
+
+
+def compile(source: str, **options) -> str:
+    with phase("parse"):
+        root = ast.parse(source)
+    wat = compile_tree(root, **options)
+    return wat
+
 
-from devtools import debug
+def compile_binary(
+    source: str, output: str = "call", target: str = "js", **options
+) -> bytes:
+    with phase("parse"):
+        root = ast.parse(source)
+    main_block, lctx, functions = generate_main(root, **options)
+    with phase("layout"):
+        module = build_module(main_block, lctx, output, target, functions)
+    with phase("encode"):
+        return encode(module)
+
+
+def compile_tree(tree, output: str = "call", target: str = "js", **options) -> str:
+    """Compile `tree` to text, for `target` with the `output` mode (see `layout.py`)."""
+    main_block, lctx, functions = generate_main(tree, **options)
+    with phase("layout"):
+        module = build_module(main_block, lctx, output, target, functions)
+    with phase("render"):
+        return str(to_wat(module))
+
+
+def generate_main(
+    tree,
+    fold: bool = True,
+    dce: bool = True,
+    strength: bool = True,
+    peephole: bool = True,
+    allocate: bool = True,
+    ir: bool = False,
+    passes=DEFAULT_PASSES,
+    inline: bool = True,
+    unroll: bool = True,
+    unroll_factor: int = UNROLL_FACTOR,
+    stats=None,
+) -> tuple[Block, dict, list[Function]]:
+    """Run the AST passes over `tree`, then generate the body of `$main`,
+    and the functions defined with `def` (see `functions.py`).
+
+    - fold: fold constant expressions (see `fold.py`)
+    - dce: remove dead branches and unused variables (see `dce.py`)
+    - strength: replace multiplications and divisions by constants with
+      cheaper instructions (see `strength.py`)
+    - peephole: rewrite the generated instructions (see `peephole.py`)
+    - allocate: share locals whose live ranges don't overlap (see
+      `liveness.py`)
+    - ir: go through the IR (see `ir.py`) instead of generating code from
+      the AST, running the IR `passes` (see `passes.py`)
+    - inline: with `ir`, inline the calls to small functions (see
+      `inline.py`)
+    - unroll: unroll the loops with a constant trip count, fully or by
+      `unroll_factor` (see `unroll.py`)
+    - stats: a `Counter` receiving the number of rewrites made by each rule
+    """
+    if fold:
+        with phase("fold"):
+            tree = fold_constants(tree)
+    if dce:
+        with phase("dce"):
+            tree = eliminate_dead_code(tree)
+    if unroll:
+        with phase("unroll"):
+            tree = unroll_loops(tree, unroll_factor, stats)
+    with phase("functions"):
+        defined = definitions(tree)
+
+    # (name, parameters, body, lctx) of each function, `$main` first
+    bodies = []
+    if ir:
+        with phase("lower"):
+            funcs = [lower(tree)] + [lower_function(node) for node in defined.values()]
+        manager = PassManager(passes, stats=stats)
+        for func in funcs:
+            manager.run(func)
+        if inline and len(funcs) > 1:
+            with phase("inline"):
+                changed = inline_calls(funcs, stats=stats)
+                funcs = remove_unused(funcs)
+            for func in funcs:
+                if func in changed:
+                    manager.run(func)
+        with phase("emit"):
+            for func in funcs:
+                body, lctx = emit(func, fallthrough=func is funcs[0])
+                bodies.append((func.name, func.params, body, lctx))
+    else:
+        with phase("generate"):
+            lctx = {}
+            bodies.append(("$main", [], generate(tree, lctx), lctx))
+            for node in defined.values():
+                lctx = {param: "$" + param for param in parameters(node)}
+                bodies.append(("$" + node.name, list(lctx.values()), generate(node, lctx), lctx))
+
+    functions = []
+    for name, params, body, lctx in bodies:
+        body, lctx = optimize_body(body, lctx, strength, peephole, allocate, stats)
+        # Several variables can share a local (see `liveness.py`)
+        local_names = [local for local in dict.fromkeys(lctx.values()) if local not in params]
+        functions.append((Function(name, params, 1, local_names, body), lctx))
+    (main, main_lctx), *others = functions
+    return main.body, main_lctx, [func for func, _ in others]
+
+
+def optimize_body(
+    body: Block, lctx: dict, strength: bool, peephole: bool, allocate: bool, stats
+) -> tuple[Block, dict]:
+    """Run the passes over the instructions of a function, and update its `lctx`."""
+    if strength or peephole or allocate:
+        code = list(body.flatten())
+        if strength:
+            with phase("strength"):
+                code = reduce_strength(code, lambda: scratch_variable(lctx), stats)
+        if peephole:
+            with phase("peephole"):
+                code = optimize(code, stats)
+        if allocate:
+            with phase("allocate"):
+                code, slots = allocate_locals(code, stats)
+            lctx = {name: slots[local] for name, local in lctx.items() if local in slots}
+        body = Block.from_flat(code)
+    return body, lctx
+
+
+# Code generators, by node type. Use `register()` to add or replace one.
+#
+# A generator is called with the node and `lctx`. It either returns a
+# `Block`, or another node to generate in its place, or is a generator
+# function: it then yields the child nodes it needs, receives their
+# `Block`, and returns its own. `generate()` runs them with an explicit
+# stack, so deep trees don't hit the recursion limit.
+GENERATORS: dict[type, Callable[[AST, dict], Block | AST | Generator]] = {}
+
+
+def register(node_type: type):
+    """Decorator registering a code generator for `node_type` nodes."""
+
+    def decorator(generator):
+        GENERATORS[node_type] = generator
+        return generator
+
+    return decorator
 
 
-class Block:
-    def __init__(self, lines=None):
-        if lines:
-            self.lines = list(lines)
+def generate(tree: AST | list[AST], lctx) -> Block:
+    if profiling.hooks:
+        return generate_measured(tree, lctx)
+
+    # Generators waiting for the block of the child they yielded
+    stack: list[Generator] = []
+    node = tree
+    while True:
+        result = generate_node(node, lctx)
+        if isinstance(result, Block):
+            block = result
+        elif isinstance(result, GeneratorType):
+            stack.append(result)
+            block = None
         else:
-            self.lines = []
-        self.indentation: int = 0
-
-    def __lshift__(self, other):
-        match other:
-            case str(line):
-                self.lines += ["  " * self.indentation + line]
-            case Block():
-                block = other
-                assert block.indentation == 0
-                for line in block.lines:
-                    self << line
-            case _:
-                raise ValueError(f"Unknown type: {type(other)}")
-
-    def indent(self):
-        self.indentation += 1
-
-    def dedent(self):
-        self.indentation -= 1
-
-    def __str__(self):
-        return "\n".join(self.lines)
-
-
-def compile(source: str) -> str:
-    root = ast.parse(source)
-    wat = compile_tree(root)
-    return wat
+            node = result
+            continue
+
+        # Send the block to the parent, until one yields a new child
+        while stack:
+            try:
+                node = stack[-1].send(block)
+                break
+            except StopIteration as stop:
+                stack.pop()
+                block = stop.value
+        else:
+            return block
 
 
-def compile_tree(tree) -> str:
-    lctx = {}
-    main_block = generate(tree, lctx)
-    var_block = generate_variable_block(tree, lctx)
+def generate_measured(tree: AST | list[AST], lctx) -> Block:
+    """`generate()`, reporting each node to the profiling hooks."""
+    stack: list[tuple[Generator, str]] = []
+    node = tree
+    with profiling.measuring_nodes():
+        while True:
+            profiling.start_node()
+            result = generate_node(node, lctx)
+            if isinstance(result, Block):
+                block = result
+                profiling.finish_node(type(node).__name__)
+            else:
+                if not isinstance(result, GeneratorType):
+                    result = forward(result)
+                stack.append((result, type(node).__name__))
+                block = None
+
+            while stack:
+                generator, name = stack[-1]
+                try:
+                    node = generator.send(block)
+                    break
+                except StopIteration as stop:
+                    stack.pop()
+                    block = stop.value
+                    profiling.finish_node(name)
+            else:
+                return block
+
+
+def forward(node):
+    return (yield node)
+
+
+def generate_node(tree: AST | list[AST], lctx) -> Block | Generator:
+    generator = GENERATORS.get(type(tree))
+    if generator is None:
+        generator = lookup(type(tree))
+    return generator(tree, lctx)
+
+
+def lookup(node_type: type):
+    """Find the generator of a subclass of a registered type (`bool`...)."""
+    for base in node_type.__mro__[1:]:
+        if base in GENERATORS:
+            return GENERATORS[base]
+    raise NotImplementedError(f"Unknown node type {node_type.__name__}")
+
+
+@register(ast.Module)
+def generate_module(tree: ast.Module, lctx):
+    # The functions are generated separately, by `generate_function()`
+    body = [node for node in tree.body if not isinstance(node, ast.FunctionDef)]
+    # The value of the last statement is the result of `$main`
+    if body and isinstance(body[-1], ast.Expr):
+        body[-1] = body[-1].value
+    return body
+
+
+@register(ast.FunctionDef)
+def generate_function(tree: ast.FunctionDef, lctx):
+    body_block = yield tree.body
 
     block = Block()
-    block << "(module"
-    block.indent()
-    block << '(import "env" "js_putn" (func $putn (param i32)))'
-    block << '(export "exported_main" (func $main))'
-    block << "(func $main (result i32)"
-    block.indent()
-    block << var_block
-    block << main_block
-    block << "return"
-    block.dedent()
-    block << ")"
-    block.dedent()
-    block << ")"
+    block << body_block
+    if not (tree.body and isinstance(tree.body[-1], ast.Return)):
+        block << "i32.const 0 ;; no return statement"
+    return block
 
-    return str(block)
 
+@register(list)
+def generate_list(nodes: list[AST], lctx):
+    block = Block()
+    for node in nodes:
+        block << (yield node)
+    return block
 
-def generate(tree: AST | list[AST], lctx) -> Block:
-    match tree:
-        case ast.Module(body):
-            return generate(body, lctx)
-
-        case [*nodes]:
-            return Block(generate(node, lctx) for node in nodes)
-
-        case ast.Expr(value):
-            return generate(value, lctx)
-
-        case ast.Constant(value):
-            return generate(value, lctx)
-
-        case ast.BinOp(left, op, right):
-            left_block = generate(left, lctx)
-            right_block = generate(right, lctx)
-            match op:
-                case ast.Add():
-                    wasm_op = "i32.add"
-                case ast.Sub():
-                    wasm_op = "i32.sub"
-                case ast.Mult():
-                    wasm_op = "i32.mul"
-                case ast.Div():
-                    wasm_op = "i32.div_s"
-                case ast.Mod():
-                    wasm_op = "i32.rem_s"
-                case _:
-                    raise NotImplementedError(f"Unknown operator {op!r}")
 
-            block = Block()
-            block << left_block
-            block << right_block
-            block << wasm_op
-            return block
+@register(ast.Expr)
+def generate_expr(tree: ast.Expr, lctx):
+    match tree.value:
+        case ast.Call(func=ast.Name(id=name)) if name != "putn":
+            # The result of a user-defined function is unused
+            return generate_dropped(tree.value)
+    return tree.value
+
+
+def generate_dropped(node: AST):
+    block = Block()
+    block << (yield node)
+    block << "drop"
+    return block
+
+
+@register(ast.Constant)
+def generate_constant(tree: ast.Constant, lctx):
+    return tree.value
+
+
+@register(int)
+def generate_int(n: int, lctx) -> Block:
+    return Block([f"i32.const {int(n)}"])
+
+
+@register(ast.BinOp)
+def generate_binop(tree: ast.BinOp, lctx):
+    left_block = yield tree.left
+    right_block = yield tree.right
+    wasm_op = operator(BINARY_OPS, tree.op)
+
+    block = Block()
+    block << left_block
+    block << right_block
+    block << wasm_op
+    return block
+
+
+@register(ast.UnaryOp)
+def generate_unaryop(tree: ast.UnaryOp, lctx):
+    operand_block = yield tree.operand
+
+    block = Block()
+    match tree.op:
+        case ast.Not():
+            block << operand_block
+            block << "i32.eqz"
+        case ast.USub():
+            block << "i32.const 0"
+            block << operand_block
+            block << "i32.sub"
+        case ast.UAdd():
+            block << operand_block
+        case ast.Invert():
+            block << operand_block
+            block << "i32.const -1"
+            block << "i32.xor"
+        case _:
+            raise NotImplementedError(f"Unknown operator {tree.op!r}")
+    return block
 
-        case ast.Compare(left, ops, comparators):
-            left_block = generate(left, lctx)
-            op = ops[0]
-            right = comparators[0]
-            right_block = generate(right, lctx)
-            match op:
-                case ast.Eq():
-                    wasm_op = "i32.eq"
-                case ast.NotEq():
-                    wasm_op = "i32.ne"
-                case ast.Lt():
-                    wasm_op = "i32.lt_s"
-                case ast.LtE():
-                    wasm_op = "i32.le_s"
-                case ast.Gt():
-                    wasm_op = "i32.gt_s"
-                case ast.GtE():
-                    wasm_op = "i32.ge_s"
-                case _:
-                    raise NotImplementedError(f"Unknown operator {op!r}")
 
+@register(ast.BoolOp)
+def generate_boolop(tree: ast.BoolOp, lctx):
+    # See `logic.py`: the value so far is kept in a hidden local, to pick it
+    # or the next operand
+    block = yield tree.values[0]
+    local = None
+    both_boolean = is_boolean(tree.values[0])
+    for value in tree.values[1:]:
+        value_block = yield value
+        acc, block = block, Block()
+        both_boolean = both_boolean and is_boolean(value)
+        if both_boolean and is_pure(value):
+            # 0 or 1 each: no need to pick
+            block << acc
+            block << value_block
+            block << ("i32.and" if isinstance(tree.op, ast.And) else "i32.or")
+            continue
+
+        local = local or hidden_variable(lctx, "bool")
+        block << acc
+        block << f"local.tee {local}"
+        if is_pure(value):
+            block << value_block
+            block << f"local.get {local}"
+            if isinstance(tree.op, ast.And):
+                block << "i32.eqz"
+            block << "select ;; the value so far, if it decides"
+            continue
+
+        if isinstance(tree.op, ast.Or):
+            block << "i32.eqz"
+        block << "if"
+        block.indent()
+        block << value_block
+        block << f"local.set {local}"
+        block.dedent()
+        block << "end"
+        block << f"local.get {local}"
+    return block
+
+
+@register(Stored)
+def generate_stored(tree: Stored, lctx):
+    value_block = yield tree.value
+
+    block = Block()
+    block << value_block
+    block << f"local.tee {lctx.setdefault(tree.name, '$' + tree.name)}"
+    return block
+
+
+class Branch(NamedTuple):
+    """A conditional branch to the label at `depth`, taken when `test` is `when`."""
+
+    test: ast.expr
+    when: bool
+    depth: int
+
+
+@register(Branch)
+def generate_branch(tree: Branch, lctx):
+    test, when, depth = tree
+    match test:
+        case ast.UnaryOp(op=ast.Not(), operand=operand):
+            return (yield Branch(operand, not when, depth))
+        case ast.Compare(ops=ops) if len(ops) > 1:
+            chain = comparisons(test, lambda: hidden_variable(lctx, "cmp")[1:])
+            return (yield Branch(chain, when, depth))
+        case ast.BoolOp(op=op, values=values) if isinstance(op, ast.Or) == when:
+            # Each operand can decide to branch
+            block = Block()
+            for value in values:
+                block << (yield Branch(value, when, depth))
+            return block
+        case ast.BoolOp(values=values):
+            # Each operand but the last can decide not to branch, skipping the others
             block = Block()
+            block << "block"
             block.indent()
-            block << left_block
-            block << right_block
-            block << wasm_op
+            for value in values[:-1]:
+                block << (yield Branch(value, not when, 0))
+            block << (yield Branch(values[-1], when, depth + 1))
             block.dedent()
+            block << "end"
             return block
 
-        case int(n):
-            return Block([f"i32.const {n}"])
+    block = Block()
+    block << (yield test)
+    if not when:
+        block << "i32.eqz"
+    block << f"br_if {depth}"
+    return block
 
-        case ast.Call(func, args):
-            match func:
-                case ast.Name(id="putn"):
-                    return generateCallPutn(args, lctx)
-                case _:
-                    raise ValueError(f"Unknown function {func!r}")
 
-        case ast.Assign(targets, value):
-            assert len(targets) == 1
-            target = targets[0]
-            assert isinstance(target, ast.Name)
-            name = target.id
-            return assign_variable(name, value, lctx)
+@register(ast.Compare)
+def generate_compare(tree: ast.Compare, lctx):
+    if len(tree.ops) > 1:
+        return (yield comparisons(tree, lambda: hidden_variable(lctx, "cmp")[1:]))
+    left_block = yield tree.left
+    right_block = yield tree.comparators[0]
+    wasm_op = operator(COMPARE_OPS, tree.ops[0])
 
-        case ast.Name(id):
-            return refer_variable(id, lctx)
+    block = Block()
+    block.indent()
+    block << left_block
+    block << right_block
+    block << wasm_op
+    block.dedent()
+    return block
 
-        case ast.If(test, body, orelse):
-            test_block = generate(test, lctx)
-            body_block = generate(body, lctx)
 
-            block = Block()
-            block << test_block
-            block << "if"
-            block.indent()
-            block << body_block
-            block.dedent()
+@register(ast.Call)
+def generate_call(tree: ast.Call, lctx):
+    # Calls were checked by `functions.definitions()`
+    match tree.func:
+        case ast.Name(id="putn"):
+            return (yield from generateCallPutn(tree.args, lctx))
+        case ast.Name(id=name):
+            return (yield from generate_direct_call(name, tree.args, lctx))
+        case _:
+            raise ValueError(f"Unknown function {tree.func!r}")
 
-            if orelse:
-                orelse_block = generate(orelse, lctx)
-                block << "else"
-                block.indent()
-                block << orelse_block
-                block.dedent()
 
-            block << "end"
+@register(ast.Assign)
+def generate_assign(tree: ast.Assign, lctx):
+    assert len(tree.targets) == 1
+    target = tree.targets[0]
+    assert isinstance(target, ast.Name)
+    return (yield from assign_variable(target.id, tree.value, lctx))
 
-            return block
 
-        case ast.While(test, body, orelse):
-            test_block = generate(test, lctx)
-            body_block = generate(body, lctx)
+@register(ast.Name)
+def generate_name(tree: ast.Name, lctx) -> Block:
+    return refer_variable(tree.id, lctx)
 
-            debug(test_block.lines, test_block.indentation)
 
-            block = Block()
-            block << "loop ;; begin of while loop"
-            block << test_block
-            block.indent()
+@register(ast.Return)
+def generate_return(tree: ast.Return, lctx):
+    value_block = yield (tree.value if tree.value is not None else 0)
+
+    block = Block()
+    block << value_block
+    block << "return"
+    return block
+
+
+@register(ast.If)
+def generate_if(tree: ast.If, lctx):
+    switch = ladder(tree)
+    if switch is not None:
+        return (yield switch)
+    if is_logical(tree.test):
+        return (yield from generate_logical_if(tree, lctx))
+    test_block = yield tree.test
+    body_block = yield tree.body
+
+    block = Block()
+    block << test_block
+    block << "if"
+    block.indent()
+    block << body_block
+    block.dedent()
+
+    if tree.orelse:
+        orelse_block = yield tree.orelse
+        block << "else"
+        block.indent()
+        block << orelse_block
+        block.dedent()
+
+    block << "end"
+
+    return block
+
+
+def generate_logical_if(tree: ast.If, lctx):
+    # The test branches past the body when it is false (see `logic.py`)
+    skip_block = yield Branch(tree.test, False, 0)
+    body_block = yield tree.body
+
+    block = Block()
+    if tree.orelse:
+        block << "block"
+        block.indent()
+    block << "block"
+    block.indent()
+    block << skip_block
+    block << body_block
+    if tree.orelse:
+        block << "br 1"
+    block.dedent()
+    block << "end"
+    if tree.orelse:
+        block << (yield tree.orelse)
+        block.dedent()
+        block << "end"
+    return block
+
+
+@register(ast.Match)
+def generate_match(tree: ast.Match, lctx):
+    return match_switch(tree)
+
+
+@register(Switch)
+def generate_switch(tree: Switch, lctx):
+    # A `block` for each arm, the first one innermost: the dispatch branches
+    # out of the block of an arm to run it (see `switch.py`). Without a
+    # default arm, its block is the end of the statement
+    block = Block()
+    if isinstance(tree.subject, ast.Name):
+        subject = refer_variable(tree.subject.id, lctx)
+    else:
+        local = hidden_variable(lctx, "switch")
+        block << (yield tree.subject)
+        block << f"local.set {local}"
+        subject = Block([f"local.get {local}"])
+
+    n = len(tree.cases)
+    end = n + 1 if tree.default else n
+    for arm in range(end, -1, -1):
+        block << ("block ;; default" if arm == n else "block")
+        block.indent()
+    block << dispatch(plan(tree), subject, n, 0)
+    for arm, (_, body) in enumerate(tree.cases):
+        block.dedent()
+        block << "end"
+        block << (yield body)
+        if arm < end - 1 and not (body and isinstance(body[-1], ast.Return)):
+            block << f"br {end - 1 - arm} ;; end of the dispatch"
+    if tree.default:
+        block.dedent()
+        block << "end"
+        block << (yield tree.default)
+    block.dedent()
+    block << "end"
+    return block
+
+
+def dispatch(plan: Table | Split | Comparisons, subject: Block, default: int, depth: int) -> Block:
+    """Branch to the label of the arm of the value of `subject`, from `depth` blocks in."""
+    # The recursion is as deep as the binary search
+    block = Block()
+    match plan:
+        case Table(low, arms):
+            block << subject
+            if low:
+                block << f"i32.const {low}"
+                block << "i32.sub"
+            labels = " ".join(str(arm + depth) for arm in [*arms, default])
+            block << f"br_table {labels}"
+        case Split(pivot, below, above):
+            block << subject
+            block << f"i32.const {pivot}"
+            block << "i32.lt_s"
             block << "if"
             block.indent()
-            block << body_block
-            block << "br 1 ;; jump to head of while loop"
+            block << dispatch(below, subject, default, depth + 1)
             block.dedent()
-            block << "end ;; end of if-then"
+            block << "else"
+            block.indent()
+            block << dispatch(above, subject, default, depth + 1)
             block.dedent()
-            block << "end ;; end of while loop"
+            block << "end"
+        case Comparisons(values):
+            for value, arm in values:
+                block << subject
+                block << f"i32.const {value}"
+                block << "i32.eq"
+                block << f"br_if {arm + depth}"
+            block << f"br {default + depth}"
+    return block
 
-            return block
 
-        case _:
-            raise NotImplementedError(f"Unknown node {tree!r}")
+@register(ast.While)
+def generate_while(tree: ast.While, lctx):
+    # Rotated loop: the test is duplicated so that each iteration
+    # only runs one conditional branch, at the bottom of the loop.
+    # `and`/`or` tests are branches too, see `generate_branch()`.
+    skip_block = yield Branch(tree.test, False, 0)
+    body_block = yield tree.body
+
+    block = Block()
+    block << "block ;; begin of while loop"
+    block.indent()
+    block << skip_block
+    block << "loop"
+    block.indent()
+    block << body_block
+    block << (yield Branch(tree.test, True, 0))
+    block.dedent()
+    block << "end"
+    block.dedent()
+    block << "end ;; end of while loop"
+    # Without `break`, the `else` arm runs whenever the loop ends
+    block << (yield tree.orelse)
+
+    return block
+
+
+@register(ast.For)
+def generate_for(tree: ast.For, lctx):
+    # Rotated like `generate_while()`, with a counter of its own (see `loops.py`)
+    bounds = counted_range(tree)
+    counter = hidden_variable(lctx, "for")
+    block = Block()
+    block << (yield bounds.start)
+    block << f"local.set {counter}"
+    # The other bounds are read again by each test: from a local, unless
+    # they keep their value anyway
+    stop, step = bounds.stop, bounds.step
+    if not is_invariant(stop, tree):
+        stop = yield from evaluate_once(stop, block, lctx)
+    if not is_invariant(step, tree):
+        step = yield from evaluate_once(step, block, lctx)
+    if bounds.sign is None:
+        # Python raises ValueError; the loop would never end
+        block << (yield step)
+        block << "i32.eqz"
+        block << "if ;; range() arg 3 must not be zero"
+        block.indent()
+        block << "unreachable"
+        block.dedent()
+        block << "end"
+    target = lctx.setdefault(tree.target.id, "$" + tree.target.id)
+
+    block << "block ;; begin of for loop"
+    block.indent()
+    block << (yield from range_test(counter, stop, step, bounds.sign))
+    block << "i32.eqz"
+    block << "br_if 0 ;; skip the loop"
+    block << "loop"
+    block.indent()
+    block << f"local.get {counter}"
+    block << f"local.set {target}"
+    block << (yield tree.body)
+    block << f"local.get {counter}"
+    block << (yield step)
+    block << "i32.add"
+    block << f"local.set {counter}"
+    block << (yield from range_test(counter, stop, step, bounds.sign))
+    block << "br_if 0 ;; next iteration"
+    block.dedent()
+    block << "end"
+    block.dedent()
+    block << "end ;; end of for loop"
+    block << (yield tree.orelse)
+    return block
+
+
+def evaluate_once(node: AST, block: Block, lctx):
+    """Store the value of `node` in a hidden local, at the end of `block`; return a read of it."""
+    local = hidden_variable(lctx, "for")
+    block << (yield node)
+    block << f"local.set {local}"
+    return ast.Name(id=local[1:], ctx=ast.Load())
+
 
+def range_test(counter: str, stop: AST, step: AST, sign: int | None):
+    block = Block()
+    if sign is not None:
+        block << f"local.get {counter}"
+        block << (yield stop)
+        block << ("i32.lt_s" if sign > 0 else "i32.gt_s")
+        return block
+
+    for compare in ("i32.lt_s", "i32.gt_s"):
+        block << f"local.get {counter}"
+        block << (yield stop)
+        block << compare
+    block << (yield step)
+    block << "i32.const 0"
+    block << "i32.gt_s"
+    block << "select ;; the first comparison for a positive step"
+    return block
 
-def generateCallPutn(args, lctx) -> Block:
+
+def generateCallPutn(args, lctx):
     """Debug function"""
-    value_block = generate(args, lctx)
+    value_block = yield args
     assert value_block
 
     block = Block()
@@ -228,6 +756,14 @@ def generateCallPutn(args, lctx) -> Block:
     return block
 
 
+def generate_direct_call(name: str, args: list[AST], lctx):
+    block = Block()
+    for arg in args:
+        block << (yield arg)
+    block << f"call ${name}"
+    return block
+
+
 # --- refer variable ---
 def refer_variable(name, lctx) -> Block:
     # -- check EXIST --
@@ -247,7 +783,7 @@ def assign_variable(name: str, value: AST, lctx: dict):
         var_name = "$" + name
         lctx[name] = var_name
 
-    value_block = generate(value, lctx)
+    value_block = yield value
     assert value_block
 
     block = Block()
@@ -257,10 +793,12 @@ def assign_variable(name: str, value: AST, lctx: dict):
     return block
 
 
-def generate_variable_block(tree, lctx) -> Block:
-    block = Block()
-    for key in lctx.keys():
-        var_name = lctx[key]
-        block << "(local " + var_name + " i32)"
+def hidden_variable(lctx, prefix: str) -> str:
+    """A new local for compiler-generated code, which can't clash with Python names."""
+    name = f".{prefix}{len(lctx)}"
+    return lctx.setdefault(name, "$" + name)
 
-    return block
+
+def scratch_variable(lctx) -> str:
+    """A local for compiler-generated code, which can't clash with Python names."""
+    return lctx.setdefault(".scratch", "$.scratch")
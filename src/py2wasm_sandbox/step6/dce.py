@@ -0,0 +1,62 @@
+"""
+Dead branch and unused variable elimination.
+
+Runs after constant folding: `if` statements with a constant test are
+replaced by the arm that is taken, `while` loops with a false constant
+test by their `else` arm, and assignments to variables that are never
+read are removed (so their locals are no longer declared).
+"""
+import ast
+
+from .fold import int_value, is_pure
+from .transform import Transformer
+
+
+class DeadBranchEliminator(Transformer):
+    statements_only = True
+
+    def visit_If(self, node: ast.If) -> ast.AST | list[ast.AST]:
+        test = int_value(node.test)
+        if test is None:
+            return node
+        return node.body if test else node.orelse
+
+    def visit_While(self, node: ast.While) -> ast.AST | list[ast.AST]:
+        if int_value(node.test) == 0:
+            return node.orelse
+        return node
+
+
+class UnusedAssignmentRemover(Transformer):
+    statements_only = True
+
+    def __init__(self, read: set[str]):
+        self.read = read
+        self.removed = 0
+
+    def visit_Assign(self, node: ast.Assign) -> ast.AST | None:
+        match node.targets:
+            case [ast.Name(id)] if id not in self.read and is_pure(node.value):
+                self.removed += 1
+                return None
+        return node
+
+
+def read_variables(tree: ast.AST) -> set[str]:
+    return {
+        node.id
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+    }
+
+
+def eliminate_dead_code(tree: ast.AST) -> ast.AST:
+    """Remove dead branches and unused assignments from `tree`, in place."""
+    tree = DeadBranchEliminator().visit(tree)
+
+    # Removing an assignment can leave other variables unread
+    while True:
+        remover = UnusedAssignmentRemover(read_variables(tree))
+        tree = remover.visit(tree)
+        if not remover.removed:
+            return tree
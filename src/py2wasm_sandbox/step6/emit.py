@@ -0,0 +1,523 @@
+"""
+Emission of the IR (see `ir.py`) as structured WebAssembly instructions.
+
+The control-flow graph is turned back into `block`/`loop`/`if`
+constructs following Ramsey, "Beyond Relooper" (ICFP 2022), which works
+on the dominator tree of any reducible graph:
+
+- a loop header is emitted in a `loop`, which back edges branch to;
+- a block with several forward predecessors (a "merge" node) is emitted
+  right after a `block` wrapping the code that branches to it, by its
+  immediate dominator;
+- any other block is emitted where its only predecessor branches to it.
+
+The targets of a `br_table` are merge nodes too, whatever their number of
+predecessors, since it only branches to labels; no phi is assigned on
+its edges.
+
+Branches to the code that follows anyway become fallthroughs, and the
+`block`s nothing branches to are left out.
+
+SSA values used once, by a later instruction of the same block, are
+left on the stack for it when nothing with side effects comes between
+them (see `Instr.has_effects`); constants are repeated at each use; the
+other values are stored in locals, named after their variable (the
+parameters are locals already), with a
+`local.tee` where they are first used when that is in their block, by a
+statement with nothing that has side effects in between. Phis are
+locals assigned on the edges to their block, with all the arguments
+read before any phi is assigned. When the phis assigned on one edge of a
+`br_if` are not read on the other edge, they are assigned before the
+branch, which can then stay a `br_if`.
+"""
+from .block import Block
+from .ir import BasicBlock, Function, Instr, dominators, reverse_postorder, trampoline
+
+# Local holding the result of `$main` when it is returned from a nested
+# construct, since `$main` must fall through its layout's epilogue
+RESULT = "$.result"
+
+
+class Label:
+    """A `block` or `loop`; left out if nothing branches to it."""
+
+    __slots__ = ("kind", "used")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.used = False
+
+
+class Emitter:
+    def __init__(self, func: Function, fallthrough: bool):
+        self.func = func
+        # Whether the function must end by falling through, with its result on the stack
+        self.fallthrough = fallthrough
+        self.order = reverse_postorder(func)
+        self.index = {block: i for i, block in enumerate(self.order)}
+        idom = dominators(self.order)
+
+        self.loop_headers = set()
+        self.merges = set()
+        for block in self.order:
+            # Unreachable blocks, like the code after a `return`, are left out
+            preds = [pred for pred in block.preds if pred in self.index]
+            forward = sum(1 for pred in preds if self.index[pred] < self.index[block])
+            if forward < len(preds):
+                self.loop_headers.add(block)
+            # Return blocks are emitted last, by their dominator (see `terminate()`)
+            if forward > 1 or (block.succs == [] and block is not self.order[0]):
+                self.merges.add(block)
+            if block.terminator.op == "br_table":
+                self.merges.update(block.succs)
+
+        # Blocks are emitted by their immediate dominator, except those outside of
+        # a loop dominated by a block inside: after the outermost such loop, so
+        # that the code following a loop doesn't end up nested in it
+        dominated: dict[BasicBlock, list[BasicBlock]] = {block: [] for block in self.order}
+        for block in self.order[1:]:
+            dominated[idom[block]].append(block)
+        parent = dict(idom)
+        self.bodies = {}
+        for header in self.order:
+            if header in self.loop_headers:
+                body = self.bodies[header] = self.loop_body(header)
+                for block in body:
+                    for child in dominated[block]:
+                        # Outer loops come first, in reverse postorder
+                        if child not in body and parent[child] is block:
+                            parent[child] = header
+                            self.merges.add(child)
+        self.children: dict[BasicBlock, list[BasicBlock]] = {block: [] for block in self.order}
+        for block in self.order[1:]:
+            self.children[parent[block]].append(block)
+
+        self.choose_inlined()
+        self.name_locals()
+        self.live_in = self.liveness()
+
+        # Items: ("line", text), ("open", kind, label), ("else",), ("close", label),
+        # ("br", op, label), ("br_table", labels)
+        self.code: list[tuple] = []
+        self.labels: dict[BasicBlock, Label] = {}  # of the open blocks and loops
+        self.depth = 0
+        self.exit = Label("block")
+        self.final_return: int | None = None
+        # Values of `teed` already computed
+        self.stored: set[Instr] = set()
+
+    # --- values ---
+    def choose_inlined(self):
+        """Find the values left on the stack for their only user."""
+        uses: dict[Instr, list[tuple[BasicBlock, int]]] = {}
+        for block in self.order:
+            for i, instr in enumerate(block.instrs):
+                for j, arg in enumerate(instr.args):
+                    if instr.op == "phi":
+                        pred = block.preds[j]
+                        if pred not in self.index:
+                            continue
+                        position = (pred, len(pred.instrs))  # on the edge, after the branch
+                    else:
+                        position = (block, i)
+                    uses.setdefault(arg, []).append(position)
+        self.uses = uses
+
+        self.inlined: set[Instr] = set()
+        for block in self.order:
+            effects = [i for i, instr in enumerate(block.instrs) if instr.has_effects]
+            end = len(block.instrs)
+            for i, instr in enumerate(block.instrs):
+                if instr.type is None or instr.op in ("phi", "param", "i32.const"):
+                    continue
+                positions = uses.get(instr, ())
+                if len(positions) != 1 or positions[0][0] is not block:
+                    continue
+                use = positions[0][1]
+                if any(i < effect < use for effect in effects):
+                    continue
+                # Phi arguments are computed on one edge only
+                if use == end and self.has_effects(instr):
+                    continue
+                self.inlined.add(instr)
+
+        # Values used several times are computed at their first use instead, and
+        # stored with `local.tee`, when it is a statement of their block
+        self.teed: set[Instr] = set()
+        for block in self.order:
+            effects = [i for i, instr in enumerate(block.instrs) if instr.has_effects]
+            end = len(block.instrs)
+            for i, instr in enumerate(block.instrs):
+                if instr.type is None or instr.op in ("phi", "param", "i32.const"):
+                    continue
+                if instr in self.inlined:
+                    continue
+                positions = uses.get(instr, ())
+                if len(positions) < 2:
+                    continue
+                # The uses in other blocks come after the end of this one
+                here = [position for user, position in positions if user is block]
+                if not here:
+                    continue
+                use = min(here)
+                if use == end or block.instrs[use] in self.inlined:
+                    continue
+                if any(i < effect < use for effect in effects):
+                    continue
+                self.teed.add(instr)
+
+    def has_effects(self, value: Instr) -> bool:
+        """Whether computing `value` where it is used has side effects,
+        including those of its inlined arguments."""
+        stack = [value]
+        while stack:
+            value = stack.pop()
+            if value.has_effects:
+                return True
+            stack.extend(arg for arg in value.args if arg in self.inlined)
+        return False
+
+    def name_locals(self):
+        self.locals: dict[Instr, str] = {}
+        # Number of locals named after each variable
+        versions: dict[str | None, int] = {}
+        for block in self.order:
+            for instr in block.instrs:
+                if (
+                    instr.type is None
+                    or instr.op == "i32.const"
+                    or instr in self.inlined
+                    or (instr not in self.uses and instr.op != "phi")
+                ):
+                    continue
+                version = versions.get(instr.name, 0)
+                versions[instr.name] = version + 1
+                if instr.op == "param":
+                    name = self.func.params[instr.imm]
+                elif instr.name is None:
+                    name = f"$.t{version}"
+                elif version:
+                    name = f"${instr.name}.{version}"
+                else:
+                    name = "$" + instr.name
+                self.locals[instr] = name
+
+    def read(self, value: Instr):
+        """The locals read by the code computing `value`, where it is used."""
+        stack = [value]
+        while stack:
+            value = stack.pop()
+            if value in self.inlined:
+                stack.extend(value.args)
+            elif value in self.locals:
+                yield value
+
+    def liveness(self) -> dict[BasicBlock, set[Instr]]:
+        """The values whose locals are live at the start of each block."""
+        live_in = {block: set() for block in self.order}
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(self.order):
+                live = set()
+                for succ in block.succs:
+                    live |= live_in[succ]
+                    live.update(self.edge_reads(block, succ))
+                for instr in reversed(block.instrs):
+                    if instr.op == "phi":
+                        live.discard(instr)
+                        continue
+                    live.discard(instr)
+                    if instr not in self.inlined:
+                        for arg in instr.args:
+                            live.update(self.read(arg))
+                if live != live_in[block]:
+                    live_in[block] = live
+                    changed = True
+        return live_in
+
+    def edge_reads(self, pred: BasicBlock, succ: BasicBlock) -> set[Instr]:
+        reads = set()
+        for source, _ in self.moves(pred, succ):
+            reads.update(self.read(source))
+        return reads
+
+    def moves(self, pred: BasicBlock, succ: BasicBlock) -> list[tuple[Instr, Instr]]:
+        """The (argument, phi) pairs assigned on the edge from `pred` to `succ`."""
+        index = succ.preds.index(pred)
+        return [(phi.args[index], phi) for phi in succ.phis if phi.args[index] is not phi]
+
+    # --- output ---
+    def line(self, text: str):
+        self.code.append(("line", text))
+
+    def open(self, kind: str, label: Label | None = None):
+        self.code.append(("open", kind, label))
+        self.depth += 1
+
+    def close(self, label: Label | None = None):
+        self.code.append(("close", label))
+        self.depth -= 1
+
+    def branch(self, op: str, label: Label):
+        label.used = True
+        self.code.append(("br", op, label))
+
+    def value(self, value: Instr):
+        """Push `value`, computing it here if it is inlined."""
+        # (instruction, whether its arguments are pushed)
+        stack = [(value, False)]
+        while stack:
+            instr, ready = stack.pop()
+            if instr.op == "i32.const":
+                self.line(f"i32.const {instr.imm}")
+            elif ready:
+                self.line(self.operation(instr))
+                if instr in self.teed:
+                    self.line(f"local.tee {self.locals[instr]}")
+                    self.stored.add(instr)
+            elif instr in self.inlined or (instr in self.teed and instr not in self.stored):
+                stack.append((instr, True))
+                stack.extend((arg, False) for arg in reversed(instr.args))
+            else:
+                self.line(f"local.get {self.locals[instr]}")
+
+    def operation(self, instr: Instr) -> str:
+        if instr.op == "call":
+            return f"call {instr.imm}"
+        return instr.op
+
+    def copy(self, pred: BasicBlock, succ: BasicBlock):
+        moves = self.moves(pred, succ)
+        for source, _ in moves:
+            self.value(source)
+        for _, phi in reversed(moves):
+            self.line(f"local.set {self.locals[phi]}")
+
+    def hoistable(self, pred: BasicBlock, succ: BasicBlock, other: BasicBlock) -> bool:
+        """Whether the moves to `succ` can be made before branching to `succ` or `other`."""
+        moves = self.moves(pred, succ)
+        if not moves:
+            return True
+        if any(source in self.inlined and self.has_effects(source) for source, _ in moves):
+            return False
+        other_reads = self.live_in[other] | self.edge_reads(pred, other)
+        return not any(phi in other_reads for _, phi in moves)
+
+    # --- control flow ---
+    def run(self) -> Block:
+        trampoline(self.do_tree(self.order[0], None), lambda generator: generator)
+        if self.final_return is None and not self.exit.used:
+            self.line("unreachable")
+
+        if self.exit.used:
+            if self.final_return is not None:
+                self.code.insert(self.final_return, ("line", f"local.set {RESULT}"))
+            self.code.insert(0, ("open", "block", self.exit))
+            self.code.append(("close", self.exit))
+            self.line(f"local.get {RESULT}")
+        return self.render()
+
+    def do_tree(self, block: BasicBlock, follow: BasicBlock | None):
+        """Emit `block` and the blocks it dominates; `follow` is the block after them."""
+        merges = [child for child in self.children[block] if child in self.merges]
+        # Innermost first: the last one emitted is the outermost block; return blocks last
+        merges.sort(key=lambda child: (not child.succs, self.index[child]))
+        if block not in self.loop_headers:
+            yield self.node_within(block, merges, follow)
+            return
+
+        # The merge nodes outside of the loop are emitted after it
+        body = self.bodies[block]
+        inside = [merge for merge in merges if merge in body]
+        outside = [merge for merge in merges if merge not in body]
+        yield self.node_within(block, outside, follow, inside)
+
+    def loop_body(self, header: BasicBlock) -> set[BasicBlock]:
+        body = {header}
+        work = [pred for pred in header.preds if self.index.get(pred, -1) >= self.index[header]]
+        while work:
+            block = work.pop()
+            if block not in body:
+                body.add(block)
+                work.extend(pred for pred in block.preds if pred in self.index)
+        return body
+
+    def node_within(self, block: BasicBlock, merges: list[BasicBlock], follow, loop=None):
+        """Emit `block` within `block`s for its `merges`, then in a `loop` for its `loop` merges."""
+        if merges:
+            *inner, last = merges
+            label = Label("block")
+            self.labels[last] = label
+            self.open("block", label)
+            yield self.node_within(block, inner, last, loop)
+            self.close(label)
+            yield self.do_tree(last, follow)
+            return
+
+        if loop is not None:
+            label = Label("loop")
+            self.labels[block] = label
+            self.open("loop", label)
+            yield self.node_within(block, loop, follow)
+            self.close(label)
+            return
+
+        for instr in block.instrs:
+            if instr.op in ("phi", "param") or instr.is_terminator:
+                continue
+            if instr in self.inlined or instr in self.teed:
+                continue
+            if instr.type is not None and instr.op == "i32.const":
+                continue
+            self.value_statement(instr)
+        yield self.terminate(block, block.terminator, follow)
+
+    def value_statement(self, instr: Instr):
+        # Compute the instruction itself, not just read its local
+        for arg in instr.args:
+            self.value(arg)
+        self.line(self.operation(instr))
+        if instr in self.locals:
+            self.line(f"local.set {self.locals[instr]}")
+        elif instr.type is not None:
+            self.line("drop")
+
+    def terminate(self, block: BasicBlock, terminator: Instr, follow):
+        match terminator.op:
+            case "return":
+                self.value(terminator.args[0])
+                if self.depth == 0:
+                    # The end of the function, see `Emitter.run()`
+                    self.final_return = len(self.code)
+                elif self.fallthrough:
+                    self.line(f"local.set {RESULT}")
+                    self.branch("br", self.exit)
+                else:
+                    self.line("return")
+            case "br":
+                yield self.jump(block, terminator.targets[0], follow)
+            case "br_if":
+                yield self.branch_if(block, terminator, follow)
+            case "br_table":
+                assert not any(self.moves(block, target) for target in block.succs)
+                self.value(terminator.args[0])
+                labels = [self.labels[target] for target in terminator.targets]
+                for label in labels:
+                    label.used = True
+                self.code.append(("br_table", labels))
+
+    def label(self, block: BasicBlock, target: BasicBlock) -> Label | None:
+        """The label to branch to `target` with, if it is not emitted in place."""
+        if self.index[target] <= self.index[block] or target in self.merges:
+            return self.labels[target]
+        return None
+
+    def jump(self, block: BasicBlock, target: BasicBlock, follow):
+        self.copy(block, target)
+        if target is follow and self.index[target] > self.index[block]:
+            return
+        label = self.label(block, target)
+        if label is not None:
+            self.branch("br", label)
+        else:
+            yield self.do_tree(target, follow)
+
+    def falls(self, block: BasicBlock, target: BasicBlock, follow) -> bool:
+        return target is follow and self.index[target] > self.index[block]
+
+    def branch_if(self, block: BasicBlock, terminator: Instr, follow):
+        then, else_ = terminator.targets
+        self.value(terminator.args[0])
+        hoisted = set()
+        for target, other in ((then, else_), (else_, then)):
+            if self.moves(block, target) and self.hoistable(block, target, other):
+                self.copy(block, target)
+                hoisted.add(target)
+
+        def plain(target):
+            return target in hoisted or not self.moves(block, target)
+
+        def jumps(target):
+            return plain(target) and self.label(block, target) is not None
+
+        falls_then = self.falls(block, then, follow) and plain(then)
+        falls_else = self.falls(block, else_, follow) and plain(else_)
+        if falls_then and falls_else:
+            self.line("drop")
+            return
+        # A branch to a label, unless the block falls through to it anyway
+        for target, negate, other in ((then, False, else_), (else_, True, then)):
+            if jumps(target) and not self.falls(block, target, follow):
+                if negate:
+                    self.line("i32.eqz")
+                self.branch("br_if", self.label(block, target))
+                yield self.edge(block, other, follow, hoisted)
+                return
+
+        # Both arms have code: the empty one, if any, is left out
+        if falls_then:
+            self.line("i32.eqz")
+            then, else_ = else_, then
+        self.open("if")
+        yield self.edge(block, then, follow, hoisted)
+        if not falls_else and not falls_then:
+            self.code.append(("else",))
+            yield self.edge(block, else_, follow, hoisted)
+        self.close()
+
+    def edge(self, block: BasicBlock, target: BasicBlock, follow, hoisted: set):
+        if target in hoisted:
+            if self.falls(block, target, follow):
+                return
+            label = self.label(block, target)
+            if label is not None:
+                self.branch("br", label)
+                return
+            yield self.do_tree(target, follow)
+        else:
+            yield self.jump(block, target, follow)
+
+    def render(self) -> Block:
+        body = Block()
+        # Labels of the constructs in the output, innermost last
+        stack: list[Label | None] = []
+        for item in self.code:
+            match item:
+                case ("line", text):
+                    body << text
+                case ("open", kind, label):
+                    if label is None or label.used:
+                        body << kind
+                        body.indent()
+                        stack.append(label)
+                case ("else",):
+                    body.dedent()
+                    body << "else"
+                    body.indent()
+                case ("close", label):
+                    if label is None or label.used:
+                        stack.pop()
+                        body.dedent()
+                        body << "end"
+                case ("br", op, label):
+                    depth = len(stack) - 1 - stack.index(label)
+                    body << f"{op} {depth}"
+                case ("br_table", labels):
+                    depths = [len(stack) - 1 - stack.index(label) for label in labels]
+                    body << "br_table " + " ".join(map(str, depths))
+        return body
+
+
+def emit(func: Function, fallthrough: bool = True) -> tuple[Block, dict[str, str]]:
+    """Emit the body of `func`, and the locals it uses, as a `lctx`-like dict.
+
+    With `fallthrough`, the result of the function is left on the stack at
+    the end of the body instead of being returned.
+    """
+    emitter = Emitter(func, fallthrough)
+    body = emitter.run()
+    lctx = {name[1:]: name for name in emitter.locals.values()}
+    if emitter.exit.used:
+        lctx[RESULT[1:]] = RESULT
+    return body, lctx
@@ -0,0 +1,154 @@
+"""
+Constant folding and algebraic simplification.
+
+Folds `ast.BinOp`, `ast.UnaryOp` and `ast.Compare` nodes whose operands
+are integer constants, using the semantics of the i32 instructions they
+compile to (wrap-around arithmetic, truncating `div_s`/`rem_s`), and
+applies simple identities such as `x * 1`, `x + 0` and `x * 0`.
+Operations that would trap at runtime (division by zero, overflowing
+division) are left alone. The constant operands of `and`/`or` are
+dropped, or decide the value when it doesn't depend on the next ones.
+"""
+import ast
+import operator
+
+from .transform import Transformer
+
+INT_MIN = -(2**31)
+
+
+def wrap(n: int) -> int:
+    """Reduce `n` to a signed 32-bit integer, like i32 arithmetic does."""
+    n &= 0xFFFFFFFF
+    return n - 2**32 if n >= 2**31 else n
+
+
+def div_s(a: int, b: int) -> int | None:
+    if b == 0 or (a == INT_MIN and b == -1):
+        return None  # traps
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def rem_s(a: int, b: int) -> int | None:
+    if b == 0:
+        return None  # traps
+    r = abs(a) % abs(b)
+    return r if a >= 0 else -r
+
+
+BINARY = {
+    ast.Add: lambda a, b: wrap(a + b),
+    ast.Sub: lambda a, b: wrap(a - b),
+    ast.Mult: lambda a, b: wrap(a * b),
+    ast.Div: div_s,
+    ast.Mod: rem_s,
+}
+
+UNARY = {
+    ast.Not: lambda a: int(a == 0),
+    ast.USub: lambda a: wrap(-a),
+    ast.UAdd: lambda a: a,
+    ast.Invert: lambda a: wrap(~a),
+}
+
+COMPARE = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+
+def int_value(node: ast.AST) -> int | None:
+    if isinstance(node, ast.Constant) and type(node.value) is int:
+        return wrap(node.value)
+    return None
+
+
+def is_pure(node: ast.AST) -> bool:
+    """True if evaluating `node` can be skipped: no calls, no possible traps."""
+    for child in ast.walk(node):
+        match child:
+            case ast.Call():
+                return False
+            case ast.BinOp(op=ast.Div() | ast.Mod()):
+                return False
+    return True
+
+
+def constant(value: int, node: ast.AST) -> ast.Constant:
+    return ast.copy_location(ast.Constant(value), node)
+
+
+class ConstantFolder(Transformer):
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        left, right = int_value(node.left), int_value(node.right)
+
+        if left is not None and right is not None:
+            evaluate = BINARY.get(type(node.op))
+            value = evaluate(left, right) if evaluate else None
+            return node if value is None else constant(value, node)
+
+        return self.simplify(node, left, right)
+
+    def simplify(self, node: ast.BinOp, left: int | None, right: int | None) -> ast.AST:
+        match node.op:
+            case ast.Add() if right == 0:
+                return node.left
+            case ast.Add() if left == 0:
+                return node.right
+            case ast.Sub() if right == 0:
+                return node.left
+            case ast.Mult() if right == 1:
+                return node.left
+            case ast.Mult() if left == 1:
+                return node.right
+            case ast.Mult() if right == 0 and is_pure(node.left):
+                return constant(0, node)
+            case ast.Mult() if left == 0 and is_pure(node.right):
+                return constant(0, node)
+            case ast.Div() if right == 1:
+                return node.left
+            case ast.Mod() if right in (1, -1) and is_pure(node.left):
+                return constant(0, node)
+        return node
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.AST:
+        operand = int_value(node.operand)
+        if operand is None or type(node.op) not in UNARY:
+            return node
+        return constant(UNARY[type(node.op)](operand), node)
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> ast.AST:
+        # A true constant doesn't decide `and`, a false one doesn't decide `or`
+        passes = isinstance(node.op, ast.And)
+        values = []
+        for i, value in enumerate(node.values):
+            n = int_value(value)
+            if n is not None and bool(n) == passes and i < len(node.values) - 1:
+                continue
+            values.append(value)
+            if n is not None:
+                break  # the following operands are not evaluated
+        if len(values) == 1:
+            return values[0]
+        node.values = values
+        return node
+
+    def visit_Compare(self, node: ast.Compare) -> ast.AST:
+        values = [int_value(operand) for operand in [node.left, *node.comparators]]
+        if None in values or not all(type(op) in COMPARE for op in node.ops):
+            return node
+
+        result = all(
+            COMPARE[type(op)](a, b) for op, a, b in zip(node.ops, values, values[1:])
+        )
+        return constant(int(result), node)
+
+
+def fold_constants(tree: ast.AST) -> ast.AST:
+    """Fold constant subexpressions of `tree`, in place."""
+    return ConstantFolder().visit(tree)
@@ -0,0 +1,71 @@
+"""
+User-defined functions: the `def` statements at the top level of the
+module.
+
+Parameters and results are i32, like every value: a function returns the
+value of its `return` statement, or 0 when it ends without one. A
+function sees its parameters and its own variables only, not those of
+the module, and can call any function of the module, including itself
+and the ones defined after it. The statements of the module around the
+`def`s make up `$main`.
+
+Each function `f` is compiled to a WebAssembly function `$f`, so the
+names of the module's own functions are reserved.
+"""
+import ast
+
+# Functions of the generated module (see `layout.py`)
+RESERVED = {"main", "putn", "_start"}
+
+
+def definitions(tree: ast.Module) -> dict[str, ast.FunctionDef]:
+    """The functions defined in `tree`, after checking how they are defined and called.
+
+    The code generators rely on these checks: any call to a name is a
+    call to `putn` or to one of these functions, with the right number
+    of arguments, or to `range()` as the iterable of a `for` loop.
+    """
+    functions = {}
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            check_definition(node)
+            if node.name in functions:
+                raise ValueError(f"Function {node.name!r} is defined twice")
+            functions[node.name] = node
+
+    arity = {"putn": 1} | {name: len(node.args.args) for name, node in functions.items()}
+    # `range()` is only a function for `for` loops (see `loops.py`)
+    ranges = set()
+    for statement in tree.body:
+        in_function = isinstance(statement, ast.FunctionDef)
+        for node in ast.walk(statement):
+            match node:
+                case ast.For(iter=ast.Call(func=ast.Name(id="range")) as call):
+                    ranges.add(call)
+                case ast.FunctionDef() | ast.AsyncFunctionDef() | ast.Lambda() if (
+                    node is not statement
+                ):
+                    raise ValueError("Nested functions are not supported")
+                case ast.Return() if not in_function:
+                    raise ValueError("'return' outside function")
+                case ast.Call(func=ast.Name(id=name), args=args) if node not in ranges:
+                    if name not in arity:
+                        raise ValueError(f"Unknown function {name!r}")
+                    if len(args) != arity[name] or node.keywords:
+                        count = len(args) + len(node.keywords)
+                        raise ValueError(f"{name}() takes {arity[name]} arguments, got {count}")
+    return functions
+
+
+def check_definition(node: ast.FunctionDef):
+    args = node.args
+    if args.posonlyargs or args.vararg or args.kwonlyargs or args.kwarg or args.defaults:
+        raise ValueError(f"{node.name}() can only have positional parameters")
+    if node.decorator_list:
+        raise ValueError(f"{node.name}() can't have decorators")
+    if node.name in RESERVED:
+        raise ValueError(f"Function name {node.name!r} is reserved")
+
+
+def parameters(node: ast.FunctionDef) -> list[str]:
+    return [arg.arg for arg in node.args.args]
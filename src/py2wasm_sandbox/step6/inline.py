@@ -0,0 +1,131 @@
+"""
+Inlining of small user-defined functions, on the IR (see `ir.py`).
+
+A call is replaced by a copy of the body of the function it calls when
+that function is a leaf, calling no user-defined function (so recursive
+functions are never inlined), and when the copy is small: its size, in
+instructions, minus the benefit of inlining must not exceed `budget`.
+The benefit is the cost of the call itself, of passing each argument
+and reading it as a parameter, and one more instruction per constant
+argument, which the `fold` pass can then propagate into the copy.
+
+Calls are inlined until none qualifies anymore: a function whose calls
+have all been inlined has become a leaf, and can be inlined in turn.
+The copy is spliced into the caller's control-flow graph, which the IR
+passes clean up afterwards. The functions that are no longer called
+from `$main` are removed.
+"""
+from collections import Counter
+
+from .ir import BasicBlock, Function, Instr, link, replace_uses
+
+# Maximum growth of the caller, in instructions, for each inlined call
+INLINE_BUDGET = 8
+# Cost of a `call` instruction, compared with the others
+CALL_COST = 2
+
+
+def inline_calls(
+    functions: list[Function], budget: int = INLINE_BUDGET, stats: Counter | None = None
+) -> set[Function]:
+    """Inline the calls to the small leaf functions; return the callers changed."""
+    by_name = {func.name: func for func in functions}
+    changed = set()
+    progress = True
+    while progress:
+        progress = False
+        for caller in functions:
+            calls = [
+                instr
+                for instr in caller.instructions()
+                if instr.op == "call" and instr.imm in by_name
+            ]
+            for call in calls:
+                callee = by_name[call.imm]
+                if callee is caller or not is_leaf(callee, by_name):
+                    continue
+                if size(callee) - benefit(call) > budget:
+                    continue
+                inline_call(caller, call, callee)
+                changed.add(caller)
+                progress = True
+                if stats is not None:
+                    stats["inline"] += 1
+    return changed
+
+
+def is_leaf(func: Function, by_name: dict[str, Function]) -> bool:
+    return not any(instr.op == "call" and instr.imm in by_name for instr in func.instructions())
+
+
+def size(func: Function) -> int:
+    """The number of instructions emitted for `func`, roughly."""
+    return sum(1 for instr in func.instructions() if instr.op not in ("phi", "param", "br"))
+
+
+def benefit(call: Instr) -> int:
+    constants = sum(1 for arg in call.args if arg.op == "i32.const")
+    return CALL_COST + len(call.args) + constants
+
+
+def inline_call(caller: Function, call: Instr, callee: Function):
+    """Replace `call`, in `caller`, by a copy of the body of `callee`."""
+    # The instructions after the call move to a new block, which the returns branch to
+    block = call.block
+    index = block.instrs.index(call)
+    after = caller.new_block()
+    for instr in block.instrs[index + 1 :]:
+        after.append(instr)
+    del block.instrs[index:]
+    for succ in after.succs:
+        succ.preds = [after if pred is block else pred for pred in succ.preds]
+
+    blocks = {original: caller.new_block() for original in callee.blocks}
+    values: dict[Instr, Instr] = {}
+    copies: list[tuple[Instr, Instr]] = []
+    returns: list[tuple[BasicBlock, Instr]] = []
+    for original, copy in blocks.items():
+        copy.preds = [blocks[pred] for pred in original.preds]
+        for instr in original.instrs:
+            if instr.op == "param":
+                values[instr] = call.args[instr.imm]
+            elif instr.op == "return":
+                returns.append((copy, instr.args[0]))
+                copy.append(caller.new_instr("br", type=None, targets=[after]))
+                after.preds.append(copy)
+            else:
+                targets = [blocks[target] for target in instr.targets]
+                new = caller.new_instr(instr.op, (), instr.imm, instr.type, targets)
+                new.name = instr.name
+                values[instr] = copy.append(new)
+                copies.append((instr, new))
+    # Phis can use values defined after them
+    for instr, new in copies:
+        new.args = [values[arg] for arg in instr.args]
+
+    block.append(caller.new_instr("br", type=None, targets=[blocks[callee.entry]]))
+    link(block, blocks[callee.entry])
+
+    if len(returns) == 1:
+        result = values[returns[0][1]]
+    else:
+        result = caller.new_instr("phi", [values[value] for _, value in returns])
+        result.block = after
+        after.instrs.insert(0, result)
+    if result.name is None:
+        result.name = call.name
+    replace_uses(caller, {call: result})
+
+
+def remove_unused(functions: list[Function]) -> list[Function]:
+    """The functions called from the first one, directly or not: the others are removed."""
+    by_name = {func.name: func for func in functions}
+    used = {functions[0]}
+    work = [functions[0]]
+    while work:
+        for instr in work.pop().instructions():
+            callee = by_name.get(instr.imm) if instr.op == "call" else None
+            if callee is not None and callee not in used:
+                used.add(callee)
+                work.append(callee)
+    return [func for func in functions if func in used]
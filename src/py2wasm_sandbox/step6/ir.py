@@ -0,0 +1,431 @@
+"""
+Intermediate representation between the AST and the instruction stream.
+
+A `Function` is a control-flow graph of `BasicBlock`s. Each block holds
+a list of `Instr`: its phis first, then its instructions, then one
+terminator (`br`, `br_if`, `br_table` or `return`). Instructions are in
+SSA form: an instruction *is* the value it computes, and is used by
+reference in the `args` of other instructions. Phi arguments are in the
+order of the block's `preds`, which have one edge to the block each.
+
+Instructions are typed: `type` is "i32", or None for instructions
+without a result (`call $putn`, terminators). The parameters of the
+function are `param` instructions of its entry block, which has no
+predecessors. Operations use the name of
+the WebAssembly instruction they compile to (`i32.add`, `i32.lt_s`...),
+see `OPS`.
+
+`dump()` renders a function as text, `verify()` checks its invariants:
+
+    func $main -> i32
+    block0:
+      %0 = i32.const 0  ; i
+      br block1
+    block1:  ; preds: block0, block2
+      %1 = phi [%0, block0], [%3, block2]  ; i
+    ...
+"""
+from collections.abc import Callable, Generator, Iterator
+from types import GeneratorType
+
+# Argument and result types of each operation, None when variable
+OPS: dict[str, tuple[tuple[str, ...] | None, str | None]] = {
+    "i32.const": ((), "i32"),
+    "i32.eqz": (("i32",), "i32"),
+    "select": (("i32", "i32", "i32"), "i32"),
+    "phi": (None, "i32"),
+    "param": ((), "i32"),
+    "call": (None, None),
+    "br": ((), None),
+    "br_if": (("i32",), None),
+    "br_table": (("i32",), None),
+    "return": (("i32",), None),
+}
+BINARY = (
+    "i32.add", "i32.sub", "i32.mul", "i32.div_s", "i32.rem_s",
+    "i32.eq", "i32.ne", "i32.lt_s", "i32.le_s", "i32.gt_s", "i32.ge_s",
+    "i32.and", "i32.or", "i32.xor",
+)  # fmt: skip
+for op in BINARY:
+    OPS[op] = (("i32", "i32"), "i32")
+
+TERMINATORS = {"br", "br_if", "br_table", "return"}
+# Instructions that can't be removed or moved across each other
+EFFECTS = {"call"}
+# ... unless their divisor is a constant other than 0 and -1
+TRAPS = {"i32.div_s", "i32.rem_s"}
+
+
+class Instr:
+    """An instruction, and the SSA value it defines."""
+
+    __slots__ = ("id", "op", "type", "args", "imm", "targets", "block", "name")
+
+    def __init__(self, id: int, op: str, args=(), imm=None, type="i32", targets=()):
+        self.id = id
+        self.op = op
+        self.type: str | None = type
+        self.args: list[Instr] = list(args)
+        # Constant of `i32.const`, function of `call`, index of `param`
+        self.imm: int | str | None = imm
+        # Successors of a terminator: one for `br`, (then, else) for `br_if`,
+        # the one of each index then the default one for `br_table`
+        self.targets: list[BasicBlock] = list(targets)
+        self.block: BasicBlock | None = None
+        # Python variable holding the value, if any
+        self.name: str | None = None
+
+    @property
+    def is_terminator(self) -> bool:
+        return self.op in TERMINATORS
+
+    @property
+    def has_effects(self) -> bool:
+        """Whether removing or reordering the instruction can be observed."""
+        if self.op in TRAPS:
+            divisor = self.args[1]
+            return divisor.op != "i32.const" or divisor.imm in (0, -1)
+        return self.op in EFFECTS
+
+    def __repr__(self):
+        return f"%{self.id}"
+
+
+class BasicBlock:
+    __slots__ = ("id", "instrs", "preds")
+
+    def __init__(self, id: int):
+        self.id = id
+        self.instrs: list[Instr] = []
+        self.preds: list[BasicBlock] = []
+
+    @property
+    def phis(self) -> Iterator[Instr]:
+        for instr in self.instrs:
+            if instr.op != "phi":
+                return
+            yield instr
+
+    @property
+    def terminator(self) -> Instr | None:
+        if self.instrs and self.instrs[-1].is_terminator:
+            return self.instrs[-1]
+        return None
+
+    @property
+    def succs(self) -> list["BasicBlock"]:
+        terminator = self.terminator
+        if terminator is None:
+            return []
+        if terminator.op == "br_table":
+            # Several indexes can branch to a block, on the same edge
+            return list(dict.fromkeys(terminator.targets))
+        return terminator.targets
+
+    def append(self, instr: Instr) -> Instr:
+        instr.block = self
+        self.instrs.append(instr)
+        return instr
+
+    def remove_pred(self, pred: "BasicBlock"):
+        """Remove the edge from `pred`, and its phi arguments."""
+        index = self.preds.index(pred)
+        del self.preds[index]
+        for phi in self.phis:
+            del phi.args[index]
+
+    def __repr__(self):
+        return f"block{self.id}"
+
+
+class Function:
+    __slots__ = ("name", "params", "results", "blocks", "_next_id", "_next_block")
+
+    def __init__(self, name: str, params: list[str] = (), results: int = 1):
+        self.name = name
+        self.params = list(params)
+        self.results = results
+        self.blocks: list[BasicBlock] = []
+        self._next_id = 0
+        self._next_block = 0
+
+    @property
+    def entry(self) -> BasicBlock:
+        return self.blocks[0]
+
+    def new_block(self) -> BasicBlock:
+        block = BasicBlock(self._next_block)
+        self._next_block += 1
+        self.blocks.append(block)
+        return block
+
+    def new_instr(self, op: str, args=(), imm=None, type="i32", targets=()) -> Instr:
+        instr = Instr(self._next_id, op, args, imm, type, targets)
+        self._next_id += 1
+        return instr
+
+    def instructions(self) -> Iterator[Instr]:
+        for block in self.blocks:
+            yield from block.instrs
+
+
+def link(pred: BasicBlock, succ: BasicBlock):
+    succ.preds.append(pred)
+
+
+def replace_uses(func: Function, replacements: dict[Instr, Instr]):
+    """Replace the uses of each key of `replacements` by its value."""
+    if not replacements:
+        return
+    for instr in func.instructions():
+        for i, arg in enumerate(instr.args):
+            if arg in replacements:
+                # Follow chains: a replacement can itself be replaced
+                while arg in replacements:
+                    arg = replacements[arg]
+                instr.args[i] = arg
+
+
+def remove_trivial_phis(func: Function) -> int:
+    """Remove the phis whose arguments are all the same value, or the phi itself."""
+    replacements: dict[Instr, Instr] = {}
+    changed = True
+    while changed:
+        changed = False
+        for block in func.blocks:
+            for phi in list(block.phis):
+                if phi in replacements:
+                    continue
+                values = set()
+                for arg in phi.args:
+                    while arg in replacements:
+                        arg = replacements[arg]
+                    if arg is not phi:
+                        values.add(arg)
+                if len(values) == 1:
+                    replacements[phi] = values.pop()
+                    changed = True
+    replace_uses(func, replacements)
+    for block in func.blocks:
+        block.instrs = [instr for instr in block.instrs if instr not in replacements]
+    return len(replacements)
+
+
+def uses(func: Function) -> dict[Instr, int]:
+    """Number of uses of each instruction that has some."""
+    counts: dict[Instr, int] = {}
+    for instr in func.instructions():
+        for arg in instr.args:
+            counts[arg] = counts.get(arg, 0) + 1
+    return counts
+
+
+def reverse_postorder(func: Function) -> list[BasicBlock]:
+    """Blocks reachable from the entry, each after its forward predecessors."""
+    order = []
+    seen = {func.entry}
+    # Successors are visited last to first, so that `then` comes before `else`
+    stack = [(func.entry, reversed(func.entry.succs))]
+    while stack:
+        block, succs = stack[-1]
+        for succ in succs:
+            if succ not in seen:
+                seen.add(succ)
+                stack.append((succ, reversed(succ.succs)))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    order.reverse()
+    return order
+
+
+def dominators(order: list[BasicBlock]) -> dict[BasicBlock, BasicBlock]:
+    """Immediate dominator of each block of `order`, a reverse postorder.
+
+    The entry is its own immediate dominator (Cooper, Harvey and Kennedy,
+    "A Simple, Fast Dominance Algorithm").
+    """
+    index = {block: i for i, block in enumerate(order)}
+    idom = {order[0]: order[0]}
+
+    def intersect(a: BasicBlock, b: BasicBlock) -> BasicBlock:
+        while a is not b:
+            while index[a] > index[b]:
+                a = idom[a]
+            while index[b] > index[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new = None
+            for pred in block.preds:
+                if pred in idom:
+                    new = pred if new is None else intersect(pred, new)
+            if idom.get(block) is not new:
+                idom[block] = new
+                changed = True
+    return idom
+
+
+def dominates(idom: dict, a: BasicBlock, b: BasicBlock) -> bool:
+    while b is not a:
+        parent = idom[b]
+        if parent is b:
+            return False
+        b = parent
+    return True
+
+
+def trampoline(root, expand: Callable[..., Generator | object]):
+    """Run recursive generator functions with an explicit stack.
+
+    A generator yields an item to compute, and receives `expand(item)`
+    when it is a plain value; when it is a generator, that generator is
+    run the same way and its return value is sent back instead.
+    """
+    stack: list[Generator] = []
+    result = expand(root)
+    while True:
+        if isinstance(result, GeneratorType):
+            stack.append(result)
+            value = None
+        else:
+            value = result
+            if not stack:
+                return value
+
+        while stack:
+            try:
+                item = stack[-1].send(value)
+                break
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+        else:
+            return value
+        result = expand(item)
+
+
+# --- debugging ---
+def format_instr(instr: Instr) -> str:
+    args = ", ".join(map(repr, instr.args))
+    match instr.op:
+        case "i32.const" | "param":
+            text = f"{instr.op} {instr.imm}"
+        case "phi":
+            pairs = zip(instr.args, instr.block.preds)
+            text = "phi " + ", ".join(f"[{arg!r}, {pred!r}]" for arg, pred in pairs)
+        case "call":
+            text = f"call {instr.imm}({args})"
+        case "br" | "br_if" | "br_table" | "return":
+            text = f"{instr.op} " + ", ".join(map(repr, instr.args + instr.targets))
+        case _:
+            text = f"{instr.op} {args}"
+    if instr.type is not None:
+        text = f"{instr!r} = {text}"
+    if instr.name is not None:
+        text += f"  ; {instr.name}"
+    return text
+
+
+def dump(func: Function) -> str:
+    params = ", ".join(func.params)
+    lines = [f"func {func.name}({params})" + " -> i32" * func.results]
+    for block in func.blocks:
+        preds = ", ".join(map(repr, block.preds))
+        lines.append(f"{block!r}:" + (f"  ; preds: {preds}" if preds else ""))
+        lines.extend("  " + format_instr(instr) for instr in block.instrs)
+    return "\n".join(lines)
+
+
+def verify(func: Function):
+    """Check the invariants of `func`, raise `ValueError` if one doesn't hold."""
+    errors = []
+    defined = {}  # instruction -> (block, index)
+    for block in func.blocks:
+        for i, instr in enumerate(block.instrs):
+            if instr in defined:
+                errors.append(f"{instr!r} appears twice")
+            defined[instr] = (block, i)
+            if instr.block is not block:
+                errors.append(f"{instr!r} in {block!r} belongs to {instr.block!r}")
+
+    blocks = set(func.blocks)
+    order = reverse_postorder(func) if func.blocks else []
+    idom = dominators(order) if order else {}
+    for block in func.blocks:
+        if block.terminator is None:
+            errors.append(f"{block!r} doesn't end with a terminator")
+        edges = block.succs
+        for succ in set(edges):
+            if succ not in blocks:
+                errors.append(f"{block!r} branches to {succ!r}, not in the function")
+            if succ.preds.count(block) != edges.count(succ):
+                errors.append(f"{succ!r} doesn't list {block!r} as a predecessor")
+        for pred in block.preds:
+            if block not in pred.succs:
+                errors.append(f"{pred!r} is a predecessor of {block!r} but doesn't branch to it")
+
+        phis_done = False
+        for i, instr in enumerate(block.instrs):
+            errors.extend(check_instr(instr, block, i, len(block.instrs), phis_done))
+            phis_done = phis_done or instr.op != "phi"
+            if instr.op == "param" and block is not func.entry:
+                errors.append(f"{instr!r}: param outside of the entry block")
+            if block not in idom:
+                continue  # unreachable: dominance doesn't apply
+            for j, arg in enumerate(instr.args):
+                if arg not in defined:
+                    errors.append(f"{instr!r} uses {arg!r}, not in the function")
+                    continue
+                arg_block, arg_index = defined[arg]
+                if instr.op == "phi":
+                    if j >= len(block.preds):
+                        continue  # reported by `check_instr()`
+                    user_block, user_index = block.preds[j], len(block.preds[j].instrs)
+                else:
+                    user_block, user_index = block, i
+                if user_block not in idom:
+                    continue
+                if arg_block is user_block:
+                    ok = arg_index < user_index
+                else:
+                    ok = arg_block in idom and dominates(idom, arg_block, user_block)
+                if not ok:
+                    errors.append(f"{instr!r} uses {arg!r}, which doesn't dominate it")
+
+    if errors:
+        raise ValueError(f"Invalid IR in {func.name}:\n" + "\n".join(errors))
+
+
+def check_instr(instr: Instr, block: BasicBlock, i: int, count: int, phis_done: bool):
+    if instr.op not in OPS:
+        yield f"{instr!r}: unknown operation {instr.op}"
+        return
+    arg_types, result = OPS[instr.op]
+    if instr.op == "phi":
+        if phis_done:
+            yield f"{instr!r}: phi after other instructions"
+        if len(instr.args) != len(block.preds):
+            yield f"{instr!r}: {len(instr.args)} arguments for {len(block.preds)} predecessors"
+    elif arg_types is not None and len(instr.args) != len(arg_types):
+        yield f"{instr!r}: {instr.op} takes {len(arg_types)} arguments"
+    if result is not None and instr.type != result:
+        yield f"{instr!r}: {instr.op} returns {result}, not {instr.type}"
+    for arg in instr.args:
+        if arg.type != "i32":
+            yield f"{instr!r}: argument {arg!r} has no value"
+    if instr.op == "i32.const" and not isinstance(instr.imm, int):
+        yield f"{instr!r}: constant {instr.imm!r} is not an int"
+    if instr.is_terminator and i != count - 1:
+        yield f"{instr!r}: terminator in the middle of {block!r}"
+    expected = {"br": 1, "br_if": 2}.get(instr.op, 0)
+    if instr.op == "br_table":
+        if not instr.targets:
+            yield f"{instr!r}: br_table has no default target"
+    elif len(instr.targets) != expected:
+        yield f"{instr!r}: {instr.op} has {len(instr.targets)} targets"
@@ -0,0 +1,247 @@
+"""
+The module around `$main` and the user-defined functions, for each
+target and output mode.
+
+The "js" target exports `$main` as `exported_main`, with two output modes:
+
+- "call": `$putn` is the `env.js_putn` import, called for every value.
+- "buffer": `$putn` appends the value to a buffer in the exported linear
+  memory; `env.js_flush(address, count)` is called when the buffer is
+  full and when `$main` returns, for the host to read the values in bulk.
+
+The "wasi" target exports `_start`, which runs `$main` and ignores its
+result. `$putn` writes the value in decimal, and a newline, to a buffer
+in memory, written to stdout with `fd_write` when it is full and at
+exit; a write error traps. The output mode does not apply.
+"""
+from .block import Block
+from .module import Export, Function, Global, Import, Module
+
+TARGETS = ("js", "wasi")
+OUTPUT_MODES = ("call", "buffer")
+
+# "buffer" output: the buffer fills the first page of memory
+BUFFER_ADDRESS = 0
+BUFFER_CAPACITY = 16384  # values
+
+# "wasi" target: a ciovec and `nwritten` for fd_write, then the text
+IOVEC_ADDRESS = 0
+NWRITTEN_ADDRESS = 8
+TEXT_ADDRESS = 16
+TEXT_CAPACITY = 65536 - TEXT_ADDRESS  # bytes
+# Longest line written by putn: "-2147483648\n"
+MAX_LINE = 12
+STDOUT = 1
+
+
+def buffered_putn() -> Function:
+    body = Block()
+    body << "global.get $.count"
+    body << "i32.const 2"
+    body << "i32.shl"
+    body << "local.get $n"
+    body << f"i32.store offset={BUFFER_ADDRESS}"
+    body << "global.get $.count"
+    body << "i32.const 1"
+    body << "i32.add"
+    body << "global.set $.count"
+    body << "global.get $.count"
+    body << f"i32.const {BUFFER_CAPACITY}"
+    body << "i32.eq"
+    body << "if"
+    body.indent()
+    body << "call $.flush"
+    body.dedent()
+    body << "end"
+    return Function("$putn", ["$n"], 0, [], body)
+
+
+def flush() -> Function:
+    body = Block()
+    body << f"i32.const {BUFFER_ADDRESS}"
+    body << "global.get $.count"
+    body << "call $.js_flush"
+    body << "i32.const 0"
+    body << "global.set $.count"
+    return Function("$.flush", [], 0, [], body)
+
+
+def wasi_putn() -> Function:
+    body = Block()
+    body << "global.get $.count"
+    body << f"i32.const {TEXT_CAPACITY - MAX_LINE}"
+    body << "i32.gt_u"
+    body << "if"
+    body.indent()
+    body << "call $.flush"
+    body.dedent()
+    body << "end"
+
+    body << "local.get $n"
+    body << "i32.const 0"
+    body << "i32.lt_s"
+    body << "if"
+    body.indent()
+    body << "global.get $.count"
+    body << 'i32.const 45 ;; "-"'
+    body << f"i32.store8 offset={TEXT_ADDRESS}"
+    body << "global.get $.count"
+    body << "i32.const 1"
+    body << "i32.add"
+    body << "global.set $.count"
+    body << "i32.const 0"
+    body << "local.get $n"
+    body << "i32.sub"
+    body << "local.set $n ;; read as unsigned from now on, for -2**31"
+    body.dedent()
+    body << "end"
+
+    body << "global.get $.count"
+    body << "local.set $end"
+    body << "local.get $n"
+    body << "local.set $u"
+    body << "loop ;; count the digits"
+    body.indent()
+    body << "local.get $end"
+    body << "i32.const 1"
+    body << "i32.add"
+    body << "local.set $end"
+    body << "local.get $u"
+    body << "i32.const 10"
+    body << "i32.div_u"
+    body << "local.tee $u"
+    body << "br_if 0"
+    body.dedent()
+    body << "end"
+
+    body << "local.get $end"
+    body << 'i32.const 10 ;; "\\n"'
+    body << f"i32.store8 offset={TEXT_ADDRESS}"
+    body << "local.get $end"
+    body << "i32.const 1"
+    body << "i32.add"
+    body << "global.set $.count"
+
+    body << "loop ;; write the digits, from the last one"
+    body.indent()
+    body << "local.get $end"
+    body << "i32.const 1"
+    body << "i32.sub"
+    body << "local.tee $end"
+    body << "local.get $n"
+    body << "i32.const 10"
+    body << "i32.rem_u"
+    body << 'i32.const 48 ;; "0"'
+    body << "i32.add"
+    body << f"i32.store8 offset={TEXT_ADDRESS}"
+    body << "local.get $n"
+    body << "i32.const 10"
+    body << "i32.div_u"
+    body << "local.tee $n"
+    body << "br_if 0"
+    body.dedent()
+    body << "end"
+    return Function("$putn", ["$n"], 0, ["$u", "$end"], body)
+
+
+def wasi_flush() -> Function:
+    # `fd_write` may write less than asked: the iovec is advanced past what
+    # it wrote until nothing is left. It traps on an error.
+    body = Block()
+    body << f"i32.const {IOVEC_ADDRESS}"
+    body << f"i32.const {TEXT_ADDRESS}"
+    body << "i32.store"
+    body << f"i32.const {IOVEC_ADDRESS}"
+    body << "global.get $.count"
+    body << "local.tee $left"
+    body << "i32.store offset=4"
+    body << "block"
+    body.indent()
+    body << "local.get $left"
+    body << "i32.eqz"
+    body << "br_if 0"
+    body << "loop"
+    body.indent()
+    body << f"i32.const {STDOUT}"
+    body << f"i32.const {IOVEC_ADDRESS}"
+    body << "i32.const 1 ;; one iovec"
+    body << f"i32.const {NWRITTEN_ADDRESS}"
+    body << "call $.fd_write"
+    body << "if ;; errno"
+    body.indent()
+    body << "unreachable"
+    body.dedent()
+    body << "end"
+    body << f"i32.const {IOVEC_ADDRESS}"
+    body << f"i32.const {IOVEC_ADDRESS}"
+    body << "i32.load"
+    body << f"i32.const {NWRITTEN_ADDRESS}"
+    body << "i32.load"
+    body << "i32.add"
+    body << "i32.store"
+    body << f"i32.const {IOVEC_ADDRESS}"
+    body << "local.get $left"
+    body << f"i32.const {NWRITTEN_ADDRESS}"
+    body << "i32.load"
+    body << "i32.sub"
+    body << "local.tee $left"
+    body << "i32.store offset=4"
+    body << "local.get $left"
+    body << "br_if 0"
+    body.dedent()
+    body << "end"
+    body.dedent()
+    body << "end"
+    body << "i32.const 0"
+    body << "global.set $.count"
+    return Function("$.flush", [], 0, ["$left"], body)
+
+
+def wasi_module(main: Function, functions: list[Function]) -> Module:
+    start = Block()
+    start << "call $main"
+    start << "drop"
+    start << "call $.flush"
+    return Module(
+        [Import("wasi_snapshot_preview1", "fd_write", "$.fd_write", 4, 1)],
+        [main, *functions, wasi_putn(), wasi_flush(), Function("$_start", [], 0, [], start)],
+        [Export("_start", "func", "$_start"), Export("memory", "memory", "0")],
+        [Global("$.count")],
+        memory=1,
+    )
+
+
+def build_module(
+    main_block: Block,
+    lctx: dict,
+    output: str = "call",
+    target: str = "js",
+    functions: list[Function] = (),
+) -> Module:
+    """Lay out the module whose `$main` runs `main_block`, and defines `functions`."""
+    if target not in TARGETS:
+        raise ValueError(f"Unknown target {target!r}")
+    if output not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode {output!r}")
+
+    body = Block()
+    body << main_block
+    if target == "js" and output == "buffer":
+        body << "call $.flush"
+    body << "return"
+    # Several variables can share a local (see `liveness.py`)
+    main = Function("$main", [], 1, list(dict.fromkeys(lctx.values())), body)
+    if target == "wasi":
+        return wasi_module(main, list(functions))
+
+    exports = [Export("exported_main", "func", "$main")]
+    if output == "call":
+        return Module([Import("env", "js_putn", "$putn", 1)], [main, *functions], exports, [])
+
+    return Module(
+        [Import("env", "js_flush", "$.js_flush", 2)],
+        [main, *functions, buffered_putn(), flush()],
+        exports + [Export("memory", "memory", "0")],
+        [Global("$.count")],
+        memory=1,
+    )
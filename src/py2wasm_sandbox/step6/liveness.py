@@ -0,0 +1,188 @@
+"""
+Liveness analysis and local allocation.
+
+Works on the flattened instruction list of a function, after the peephole
+optimizer. A backward dataflow analysis over the structured control flow
+(`block`/`loop`/`if`, branches) finds where each local is live; locals
+that are never live at the same time are then given the same slot,
+greedily, in order of first appearance. The slot is named after its
+first local.
+
+A copy (`local.get $a; local.set $b`) does not make `$a` and `$b`
+interfere, and `$b` prefers the slot of `$a`: when they share it, the
+copy is removed.
+
+Locals that may be read before being written rely on being zero-
+initialized by WebAssembly, or are parameters; they keep a slot of their
+own.
+"""
+from collections import Counter
+
+from .peephole import parse
+
+DEFS = {"local.set", "local.tee"}
+LOCAL_OPS = DEFS | {"local.get"}
+
+
+def successors(ops: list[tuple[str, ...]]) -> list[tuple[int, ...]]:
+    """Control-flow successors of each instruction; `len(ops)` is the exit."""
+    exit_ = len(ops)
+    # Index of the `block`/`loop`/`if` enclosing each instruction, innermost last
+    stack: list[int] = []
+    end_of: dict[int, int] = {}
+    else_of: dict[int, int] = {}
+    if_of: dict[int, int] = {}  # `else` -> its `if`
+    branches: list[tuple[int, list[int | None]]] = []
+
+    for i, op in enumerate(ops):
+        name = op[0] if op else ""
+        if name in ("block", "loop", "if"):
+            stack.append(i)
+        elif name == "else":
+            else_of[stack[-1]] = i
+            if_of[i] = stack[-1]
+        elif name == "end" and stack:
+            end_of[stack.pop()] = i
+        elif name in ("br", "br_if", "br_table"):
+            labels = [int(label) for label in op[1:]]
+            # None: the label of the function body
+            targets = [stack[-1 - label] if label < len(stack) else None for label in labels]
+            branches.append((i, targets))
+
+    def target(construct: int | None) -> int:
+        if construct is None:
+            return exit_
+        if ops[construct][0] == "loop":
+            return construct
+        return end_of[construct]
+
+    succ: list[tuple[int, ...]] = []
+    for i, op in enumerate(ops):
+        name = op[0] if op else ""
+        if name == "if":
+            skip = else_of[i] + 1 if i in else_of else end_of[i]
+            succ.append((i + 1, skip))
+        elif name == "else":
+            succ.append((end_of[if_of[i]],))
+        elif name in ("return", "unreachable"):
+            succ.append((exit_,) if name == "return" else ())
+        else:
+            succ.append((i + 1,))
+
+    for i, targets in branches:
+        jumps = tuple(target(construct) for construct in targets)
+        succ[i] = jumps + (i + 1,) if ops[i][0] == "br_if" else jumps
+    return succ
+
+
+def liveness(ops, index: dict[str, int]) -> tuple[list[int], list[int]]:
+    """Return the live-in and live-out bitsets (over `index`) of each instruction."""
+    count = len(ops)
+    succ = successors(ops)
+    use = [0] * count
+    define = [0] * count
+    for i, op in enumerate(ops):
+        if op and op[0] in LOCAL_OPS:
+            if op[0] == "local.get":
+                use[i] = 1 << index[op[1]]
+            else:
+                define[i] = 1 << index[op[1]]
+
+    live_in = [0] * (count + 1)  # the exit has nothing live
+    live_out = [0] * count
+    changed = True
+    while changed:
+        changed = False
+        for i in range(count - 1, -1, -1):
+            out = 0
+            for s in succ[i]:
+                out |= live_in[s]
+            live_out[i] = out
+            new = use[i] | (out & ~define[i])
+            if new != live_in[i]:
+                live_in[i] = new
+                changed = True
+    return live_in[:count], live_out
+
+
+def allocate_locals(code, stats: Counter | None = None) -> tuple[list[tuple[int, str]], dict]:
+    """Share slots between locals of the flattened `code`.
+
+    Returns the rewritten code and a mapping from each local name to the
+    name of its slot. Locals that don't appear in `code` aren't mapped.
+    """
+    code = list(code)
+    ops = [parse(line) for _, line in code]
+    names: dict[str, int] = {}
+    for op in ops:
+        if op and op[0] in LOCAL_OPS:
+            names.setdefault(op[1], len(names))
+    if not names:
+        return code, {}
+
+    live_in, live_out = liveness(ops, names)
+
+    # Interference, and copies: the local each copy reads from, by destination
+    interference = [0] * len(names)
+    copies: dict[int, int] = {}
+    for i, op in enumerate(ops):
+        if op and op[0] in DEFS:
+            x = names[op[1]]
+            live = live_out[i] & ~(1 << x)
+            if i > 0 and ops[i - 1][:1] == ("local.get",):
+                source = names[ops[i - 1][1]]
+                live &= ~(1 << source)
+                copies.setdefault(x, source)
+            interference[x] |= live
+    for x in range(len(names)):
+        bits = interference[x]
+        while bits:
+            low = bits & -bits
+            interference[low.bit_length() - 1] |= 1 << x
+            bits ^= low
+
+    # Zero-initialized locals, read before being written
+    reserved = live_in[0]
+
+    slots: list[int] = []  # members of each slot
+    slot_of = [0] * len(names)
+    for x in range(len(names)):
+        candidates = []
+        if not reserved >> x & 1:
+            if x in copies and copies[x] < x:
+                candidates.append(slot_of[copies[x]])
+            candidates += range(len(slots))
+        for slot in candidates:
+            members = slots[slot]
+            if not members & reserved and not members & interference[x]:
+                slots[slot] |= 1 << x
+                slot_of[x] = slot
+                break
+        else:
+            slot_of[x] = len(slots)
+            slots.append(1 << x)
+
+    order = list(names)
+    slot_names = [order[(members & -members).bit_length() - 1] for members in slots]
+    renaming = {name: slot_names[slot_of[x]] for name, x in names.items()}
+
+    result = []
+    removed = 0
+    for (indentation, line), op in zip(code, ops):
+        if op and op[0] in LOCAL_OPS:
+            name = renaming[op[1]]
+            if result and op[0] in DEFS and parse(result[-1][1]) == ("local.get", name):
+                # Copy to the same slot
+                removed += 1
+                if op[0] == "local.set":
+                    result.pop()
+                continue
+            line = f"{op[0]} {name}"
+        result.append((indentation, line))
+
+    if stats is not None:
+        if len(slots) < len(names):
+            stats["allocate_locals"] += len(names) - len(slots)
+        if removed:
+            stats["coalesced_copies"] += removed
+    return result, renaming
@@ -0,0 +1,75 @@
+"""
+Boolean operators and chained comparisons.
+
+Like in Python, `a and b` is `a` when it is false (0), `b` otherwise, and
+`a or b` is `a` when it is true, `b` otherwise: `b` is only evaluated
+when it is needed. `not a` is 1 when `a` is 0, and 0 otherwise. Chained
+comparisons are `and`s of comparisons: `a < b < c` is `a < b and b < c`,
+except that `b` is evaluated once.
+
+In the test of an `if` or `while` statement, these operators become
+conditional branches, and their values are never computed. Elsewhere,
+when the right operand can be evaluated anyway (see `fold.is_pure()`),
+`select` picks the value without branching (or `i32.and`/`i32.or`, when
+both operands are 0 or 1, like comparisons); otherwise the right operand
+is only evaluated in a conditional block.
+"""
+import ast
+from collections.abc import Callable
+
+from .fold import int_value
+
+
+class Stored(ast.expr):
+    """The value of `value`, also stored in the hidden variable `name`."""
+
+    _fields = ("value", "name")
+
+
+def is_logical(test: ast.expr) -> bool:
+    """Whether `test` is better compiled to branches than to a value."""
+    match test:
+        case ast.BoolOp():
+            return True
+        case ast.Compare(ops=ops):
+            return len(ops) > 1
+        case ast.UnaryOp(op=ast.Not(), operand=operand):
+            return is_logical(operand)
+    return False
+
+
+def is_boolean(node: ast.expr) -> bool:
+    """Whether the value of `node` is always 0 or 1."""
+    match node:
+        case ast.Compare() | ast.UnaryOp(op=ast.Not()):
+            return True
+        case ast.BoolOp(values=values):
+            return all(is_boolean(value) for value in values)
+    return int_value(node) in (0, 1)
+
+
+def comparisons(tree: ast.Compare, hidden: Callable[[], str]) -> ast.expr:
+    """`tree`, with one comparison for each operator, joined with `and`.
+
+    The operands between two comparisons are stored in a variable named
+    by `hidden()`, and read by the second one, unless they are variables
+    or constants already.
+    """
+    if len(tree.ops) == 1:
+        return tree
+    left = tree.left
+    values = []
+    for i, (op, right) in enumerate(zip(tree.ops, tree.comparators)):
+        if i < len(tree.ops) - 1 and not is_simple(right):
+            name = hidden()
+            values.append(ast.Compare(left, [op], [Stored(right, name)]))
+            left = ast.Name(id=name, ctx=ast.Load())
+        else:
+            values.append(ast.Compare(left, [op], [right]))
+            left = right
+    return ast.BoolOp(ast.And(), values)
+
+
+def is_simple(node: ast.expr) -> bool:
+    """Whether reading `node` again is as cheap as reading a variable."""
+    return isinstance(node, ast.Name) or int_value(node) is not None
@@ -0,0 +1,64 @@
+"""
+Counted loops: `for` statements over `range()`.
+
+`for i in range(start, stop, step)` runs like in Python: the bounds are
+evaluated once, in order, before the loop; `i` takes the values `start`,
+`start + step`... while they are below `stop` (above it for a negative
+step), and keeps the last one after the loop. Assigning to `i` in the
+body doesn't change the next value: the loop has a counter of its own.
+The `else` arm runs after the loop, which can't be left early.
+
+There is no iterator: the loop is rotated like `while` loops are, with a
+test before the loop and one at the end of each iteration. With a
+constant step, the test is a single comparison; otherwise, it selects
+the comparison for the sign of the step, and the loop traps before its
+first iteration when the step is 0. Like every value, the counter
+is an i32: going past the largest one wraps around.
+"""
+import ast
+from typing import NamedTuple
+
+from .fold import int_value
+
+
+class Range(NamedTuple):
+    start: ast.expr
+    stop: ast.expr
+    step: ast.expr
+    sign: int | None  # of the step, when it is a constant
+
+
+def counted_range(tree: ast.For) -> Range:
+    """The bounds of the `range()` iterated over by `tree`."""
+    match tree:
+        case ast.For(
+            target=ast.Name(),
+            iter=ast.Call(func=ast.Name(id="range"), args=args, keywords=[]),
+        ) if 1 <= len(args) <= 3:
+            pass
+        case _:
+            raise NotImplementedError("Only `for name in range(...)` loops are supported")
+
+    if len(args) == 1:
+        start, stop, step = ast.Constant(0), args[0], ast.Constant(1)
+    else:
+        start, stop, step = args[0], args[1], args[2] if len(args) == 3 else ast.Constant(1)
+    value = int_value(step)
+    if value == 0:
+        raise ValueError("range() arg 3 must not be zero")
+    sign = None if value is None else (1 if value > 0 else -1)
+    return Range(start, stop, step, sign)
+
+
+def is_invariant(node: ast.expr, tree: ast.For) -> bool:
+    """Whether `node` has the same value at each iteration of `tree`."""
+    if int_value(node) is not None:
+        return True
+    if not isinstance(node, ast.Name):
+        return False
+    assigned = {tree.target.id} | {
+        child.id
+        for child in ast.walk(ast.Module(tree.body, []))
+        if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store)
+    }
+    return node.id not in assigned
@@ -0,0 +1,546 @@
+"""
+Lowering of the AST to the IR (see `ir.py`).
+
+Variables are turned into SSA values while the control-flow graph is
+built, with the algorithm of Braun et al., "Simple and Efficient
+Construction of Static Single Assignment Form": a block is *sealed* once
+all its predecessors are known; reading a variable in a block that
+doesn't define it looks it up in its predecessors, through a phi when
+there are several of them. Phis that turn out to merge a single value
+are removed at the end.
+
+Like `compiler.generate()`, lowering functions are registered by node
+type, and are generator functions yielding the child nodes whose value
+they need, so that deep trees don't hit the recursion limit.
+
+`lower()` returns `$main`, the statements of the module around the
+`def`s: it returns the value of the last top-level expression statement,
+like the `$main` generated from the AST does, or 0. `lower_function()`
+returns a user-defined function (see `functions.py`), whose parameters
+are `param` instructions; it returns 0 when it ends without a `return`.
+"""
+import ast
+from ast import AST
+from collections.abc import Callable, Generator
+from typing import NamedTuple
+
+from .fold import is_pure
+from .functions import parameters
+from .ir import BasicBlock, Function, Instr, link, remove_trivial_phis, trampoline
+from .logic import Stored, comparisons, is_boolean
+from .loops import counted_range
+from .switch import Comparisons, Split, Switch, Table, ladder, match_switch, plan
+from .operators import BINARY_OPS, COMPARE_OPS, operator
+
+# Lowering functions, by node type. Use `register()` to add or replace one.
+LOWERINGS: dict[type, Callable[[AST, "Builder"], Instr | None | Generator]] = {}
+
+
+def register(node_type: type):
+    """Decorator registering a lowering function for `node_type` nodes."""
+
+    def decorator(lowering):
+        LOWERINGS[node_type] = lowering
+        return lowering
+
+    return decorator
+
+
+class Builder:
+    """The function being built, and the SSA state of its variables."""
+
+    def __init__(self, name: str = "$main", params: list[str] = ()):
+        self.func = Function(name, [f"${param}" for param in params])
+        self.block = self.func.new_block()
+        # Value of each variable at the end of the blocks that define it
+        self.definitions: dict[str, dict[BasicBlock, Instr]] = {}
+        # Variables assigned so far, in the order of the source
+        self.declared: set[str] = set()
+        self.sealed: set[BasicBlock] = {self.block}
+        # Phis of unsealed blocks, created before their predecessors are known
+        self.incomplete: dict[BasicBlock, dict[str, Instr]] = {}
+        # Phis waiting for their arguments, with their variable
+        self.pending: list[tuple[str, Instr]] = []
+        # Value returned by the function
+        self.result: Instr | None = None
+        # Number of hidden variables, see `hidden_variable()`
+        self.hidden = 0
+        # Variables assigned in the `if`/`while` statements being lowered
+        self.assigned: list[set[str]] = []
+        # Blocks after the arms of an `if` or around a loop, with the block
+        # before the statement and the variables it assigns: the others have
+        # the value they have there, no phi is needed
+        self.shortcuts: dict[BasicBlock, tuple[BasicBlock, set[str]]] = {}
+
+        for index, param in enumerate(params):
+            value = self.emit("param", imm=index)
+            value.name = param
+            self.declared.add(param)
+            self.write(param, value)
+
+    # --- instructions ---
+    def emit(self, op: str, *args: Instr, imm=None, type="i32") -> Instr:
+        return self.block.append(self.func.new_instr(op, args, imm, type))
+
+    def const(self, n: int) -> Instr:
+        return self.emit("i32.const", imm=n)
+
+    def branch(self, op: str, *args: Instr, targets=()) -> None:
+        self.emit(op, *args, type=None)
+        self.block.instrs[-1].targets = list(targets)
+        for target in dict.fromkeys(targets):
+            link(self.block, target)
+
+    def hidden_variable(self, prefix: str) -> str:
+        """A new variable for compiler-generated code, which can't clash with Python names."""
+        self.hidden += 1
+        name = f".{prefix}{self.hidden}"
+        self.declared.add(name)
+        return name
+
+    def new_block(self, sealed: bool = True) -> BasicBlock:
+        """A new block; unsealed if predecessors may be added to it later."""
+        block = self.func.new_block()
+        if sealed:
+            self.sealed.add(block)
+        return block
+
+    # --- variables ---
+    def write(self, name: str, value: Instr):
+        self.definitions.setdefault(name, {})[self.block] = value
+
+    def read(self, name: str) -> Instr:
+        value = self.lookup(name, self.block)
+        self.complete_phis()
+        return value
+
+    def lookup(self, name: str, block: BasicBlock) -> Instr:
+        definitions = self.definitions.setdefault(name, {})
+        # Blocks with a single predecessor take the value it has
+        path = []
+        while block not in definitions and block in self.sealed:
+            if len(block.preds) == 1:
+                path.append(block)
+                block = block.preds[0]
+            elif block in self.shortcuts and name not in self.shortcuts[block][1]:
+                path.append(block)
+                block = self.shortcuts[block][0]
+            else:
+                break
+
+        if block in definitions:
+            value = definitions[block]
+        elif block not in self.sealed:
+            value = self.phi(block, name)
+            self.incomplete.setdefault(block, {})[name] = value
+        elif not block.preds:
+            # Read before being assigned: locals start at 0
+            value = self.func.new_instr("i32.const", imm=0)
+            value.block = block
+            block.instrs.insert(0, value)
+        else:
+            value = self.phi(block, name)
+            self.pending.append((name, value))
+
+        definitions[block] = value
+        for block in path:
+            definitions[block] = value
+        return value
+
+    def phi(self, block: BasicBlock, name: str) -> Instr:
+        phi = self.func.new_instr("phi")
+        phi.block = block
+        phi.name = name
+        block.instrs.insert(0, phi)
+        return phi
+
+    def complete_phis(self):
+        """Give their arguments to the phis created by `lookup()`."""
+        while self.pending:
+            name, phi = self.pending.pop()
+            phi.args = [self.lookup(name, pred) for pred in phi.block.preds]
+
+    def seal(self, block: BasicBlock):
+        """Declare that all the predecessors of `block` are known."""
+        self.sealed.add(block)
+        for name, phi in self.incomplete.pop(block, {}).items():
+            self.pending.append((name, phi))
+        self.complete_phis()
+
+    def enter(self):
+        """Start lowering the body of an `if` or `while` statement."""
+        self.assigned.append(set())
+
+    def leave(self, header: BasicBlock, *blocks: BasicBlock):
+        """Finish it: `blocks` only merge the variables it assigned since `header`."""
+        assigned = self.assigned.pop()
+        if self.assigned:
+            self.assigned[-1] |= assigned
+        for block in blocks:
+            self.shortcuts[block] = (header, assigned)
+
+    def finish(self) -> Function:
+        result = self.result if self.result is not None else self.const(0)
+        self.branch("return", result)
+        remove_trivial_phis(self.func)
+        return self.func
+
+
+def lower(tree: AST, name: str = "$main") -> Function:
+    """Lower the module `tree` to the IR of a function."""
+    builder = Builder(name)
+    trampoline(tree, lambda node: lower_node(node, builder))
+    return builder.finish()
+
+
+def lower_function(tree: ast.FunctionDef) -> Function:
+    """Lower a function defined by a `def` statement."""
+    builder = Builder("$" + tree.name, parameters(tree))
+    trampoline(tree.body, lambda node: lower_node(node, builder))
+    return builder.finish()
+
+
+def lower_node(node: AST, builder: Builder) -> Instr | None | Generator:
+    lowering = LOWERINGS.get(type(node))
+    if lowering is None:
+        lowering = lookup(type(node))
+    return lowering(node, builder)
+
+
+def lookup(node_type: type):
+    """Find the lowering of a subclass of a registered type (`bool`...)."""
+    for base in node_type.__mro__[1:]:
+        if base in LOWERINGS:
+            return LOWERINGS[base]
+    raise NotImplementedError(f"Unknown node type {node_type.__name__}")
+
+
+@register(ast.Module)
+def lower_module(tree: ast.Module, builder: Builder):
+    for statement in tree.body:
+        if isinstance(statement, ast.FunctionDef):
+            continue  # see `lower_function()`
+        value = yield statement
+        if isinstance(statement, ast.Expr) and value is not None and value.type == "i32":
+            builder.result = value
+
+
+@register(list)
+def lower_list(nodes: list[AST], builder: Builder):
+    for node in nodes:
+        yield node
+
+
+@register(ast.Expr)
+def lower_expr(tree: ast.Expr, builder: Builder):
+    return (yield tree.value)
+
+
+@register(ast.Constant)
+def lower_constant(tree: ast.Constant, builder: Builder):
+    return (yield tree.value)
+
+
+@register(int)
+def lower_int(n: int, builder: Builder) -> Instr:
+    return builder.const(int(n))
+
+
+@register(ast.BinOp)
+def lower_binop(tree: ast.BinOp, builder: Builder):
+    left = yield tree.left
+    right = yield tree.right
+    return builder.emit(operator(BINARY_OPS, tree.op), left, right)
+
+
+@register(ast.UnaryOp)
+def lower_unaryop(tree: ast.UnaryOp, builder: Builder):
+    operand = yield tree.operand
+    match tree.op:
+        case ast.Not():
+            return builder.emit("i32.eqz", operand)
+        case ast.USub():
+            return builder.emit("i32.sub", builder.const(0), operand)
+        case ast.UAdd():
+            return operand
+        case ast.Invert():
+            return builder.emit("i32.xor", operand, builder.const(-1))
+    raise NotImplementedError(f"Unknown operator {tree.op!r}")
+
+
+@register(ast.BoolOp)
+def lower_boolop(tree: ast.BoolOp, builder: Builder):
+    # See `logic.py`: `select` when the next operand can be evaluated
+    # anyway, a conditional block otherwise
+    and_ = isinstance(tree.op, ast.And)
+    value = yield tree.values[0]
+    both_boolean = is_boolean(tree.values[0])
+    for operand in tree.values[1:]:
+        both_boolean = both_boolean and is_boolean(operand)
+        if is_pure(operand):
+            right = yield operand
+            if both_boolean:
+                value = builder.emit("i32.and" if and_ else "i32.or", value, right)
+            elif and_:
+                value = builder.emit("select", right, value, value)
+            else:
+                value = builder.emit("select", value, right, value)
+            continue
+
+        result = builder.hidden_variable("bool")
+        builder.write(result, value)
+        other = builder.new_block()
+        merge = builder.new_block(sealed=False)
+        builder.branch("br_if", value, targets=(other, merge) if and_ else (merge, other))
+        builder.block = other
+        builder.write(result, (yield operand))
+        builder.branch("br", targets=(merge,))
+        builder.seal(merge)
+        builder.block = merge
+        value = builder.read(result)
+    return value
+
+
+@register(Stored)
+def lower_stored(tree: Stored, builder: Builder):
+    value = yield tree.value
+    builder.write(tree.name, value)
+    return value
+
+
+class Condition(NamedTuple):
+    """A branch to `then` when `test` is true, to `else_` otherwise."""
+
+    test: ast.expr
+    then: BasicBlock
+    else_: BasicBlock
+
+
+@register(Condition)
+def lower_condition(tree: Condition, builder: Builder):
+    # The value of `and`/`or` tests is never computed (see `logic.py`):
+    # the blocks their operands branch to must be left unsealed
+    test, then, else_ = tree
+    match test:
+        case ast.UnaryOp(op=ast.Not(), operand=operand):
+            yield Condition(operand, else_, then)
+            return
+        case ast.Compare(ops=ops) if len(ops) > 1:
+            chain = comparisons(test, lambda: builder.hidden_variable("cmp"))
+            yield Condition(chain, then, else_)
+            return
+        case ast.BoolOp(op=op, values=values):
+            for operand in values[:-1]:
+                next_ = builder.new_block()
+                if isinstance(op, ast.And):
+                    yield Condition(operand, next_, else_)
+                else:
+                    yield Condition(operand, then, next_)
+                builder.block = next_
+            yield Condition(values[-1], then, else_)
+            return
+    value = yield test
+    builder.branch("br_if", value, targets=(then, else_))
+
+
+@register(ast.Compare)
+def lower_compare(tree: ast.Compare, builder: Builder):
+    if len(tree.ops) > 1:
+        return (yield comparisons(tree, lambda: builder.hidden_variable("cmp")))
+    left = yield tree.left
+    right = yield tree.comparators[0]
+    return builder.emit(operator(COMPARE_OPS, tree.ops[0]), left, right)
+
+
+@register(ast.Call)
+def lower_call(tree: ast.Call, builder: Builder):
+    # Calls were checked by `functions.definitions()`
+    match tree.func:
+        case ast.Name(id=name):
+            args = []
+            for arg in tree.args:
+                args.append((yield arg))
+            result = None if name == "putn" else "i32"
+            return builder.emit("call", *args, imm="$" + name, type=result)
+        case _:
+            raise ValueError(f"Unknown function {tree.func!r}")
+
+
+@register(ast.Assign)
+def lower_assign(tree: ast.Assign, builder: Builder):
+    assert len(tree.targets) == 1
+    target = tree.targets[0]
+    assert isinstance(target, ast.Name)
+    builder.declared.add(target.id)
+    if builder.assigned:
+        builder.assigned[-1].add(target.id)
+    value = yield tree.value
+    if value.name is None:
+        value.name = target.id
+    builder.write(target.id, value)
+
+
+@register(ast.Name)
+def lower_name(tree: ast.Name, builder: Builder) -> Instr:
+    if tree.id not in builder.declared:
+        raise ValueError(f"Unknown variable {tree.id!r}")
+    return builder.read(tree.id)
+
+
+@register(ast.Return)
+def lower_return(tree: ast.Return, builder: Builder):
+    value = yield (tree.value if tree.value is not None else 0)
+    builder.branch("return", value)
+    # The statements after it are unreachable
+    builder.block = builder.new_block()
+
+
+@register(ast.If)
+def lower_if(tree: ast.If, builder: Builder):
+    switch = ladder(tree)
+    if switch is not None:
+        return (yield switch)
+    header = builder.block
+    then_block = builder.new_block(sealed=False)
+    merge = builder.new_block(sealed=False)
+    else_block = builder.new_block(sealed=False) if tree.orelse else merge
+    yield Condition(tree.test, then_block, else_block)
+    builder.seal(then_block)
+    if tree.orelse:
+        builder.seal(else_block)
+
+    builder.enter()
+    builder.block = then_block
+    yield tree.body
+    builder.branch("br", targets=(merge,))
+
+    if tree.orelse:
+        builder.block = else_block
+        yield tree.orelse
+        builder.branch("br", targets=(merge,))
+
+    builder.leave(header, merge)
+    builder.seal(merge)
+    builder.block = merge
+
+
+@register(ast.Match)
+def lower_match(tree: ast.Match, builder: Builder):
+    return (yield match_switch(tree))
+
+
+@register(Switch)
+def lower_switch(tree: Switch, builder: Builder):
+    # A block for each arm, the default one last, which the dispatch
+    # branches to (see `switch.py`); they have no phis, like `br_table`
+    # targets must
+    subject = yield tree.subject
+    header = builder.block
+    arms = [builder.new_block(sealed=False) for _ in range(len(tree.cases) + 1)]
+    merge = builder.new_block(sealed=False)
+    work = [(plan(tree), builder.block)]
+    while work:
+        step, builder.block = work.pop()
+        match step:
+            case Table(low, table):
+                index = subject
+                if low:
+                    index = builder.emit("i32.sub", subject, builder.const(low))
+                targets = [arms[arm] for arm in table] + [arms[-1]]
+                builder.branch("br_table", index, targets=targets)
+            case Split(pivot, below, above):
+                test = builder.emit("i32.lt_s", subject, builder.const(pivot))
+                blocks = builder.new_block(), builder.new_block()
+                builder.branch("br_if", test, targets=blocks)
+                work += [(above, blocks[1]), (below, blocks[0])]
+            case Comparisons(values):
+                for value, arm in values:
+                    test = builder.emit("i32.eq", subject, builder.const(value))
+                    next_ = builder.new_block()
+                    builder.branch("br_if", test, targets=(arms[arm], next_))
+                    builder.block = next_
+                builder.branch("br", targets=(arms[-1],))
+    for arm in arms:
+        builder.seal(arm)
+
+    builder.enter()
+    bodies = [body for _, body in tree.cases] + [tree.default]
+    for arm, body in zip(arms, bodies):
+        builder.block = arm
+        yield body
+        builder.branch("br", targets=(merge,))
+    builder.leave(header, merge)
+    builder.seal(merge)
+    builder.block = merge
+
+
+@register(ast.While)
+def lower_while(tree: ast.While, builder: Builder):
+    # Rotated loop, like `compiler.generate_while()`: the test is
+    # duplicated, and each iteration ends with the conditional branch
+    header = builder.block
+    body = builder.new_block(sealed=False)
+    exit_ = builder.new_block(sealed=False)
+    yield Condition(tree.test, body, exit_)
+
+    builder.enter()
+    builder.block = body
+    yield tree.body
+    yield Condition(tree.test, body, exit_)
+
+    builder.leave(header, body, exit_)
+    builder.seal(body)
+    builder.seal(exit_)
+    builder.block = exit_
+    yield tree.orelse
+
+
+@register(ast.For)
+def lower_for(tree: ast.For, builder: Builder):
+    # A rotated loop like `lower_while()`'s, see `loops.py`
+    bounds = counted_range(tree)
+    start = yield bounds.start
+    stop = yield bounds.stop
+    step = yield bounds.step
+    if bounds.sign is None:
+        # Python raises ValueError on a zero step, which would never end the
+        # loop; the IR has no `unreachable`, but this division traps on it
+        builder.emit("i32.div_s", builder.const(1), step)
+    counter = builder.hidden_variable("for")
+    builder.write(counter, start)
+    header = builder.block
+    body = builder.new_block(sealed=False)
+    exit_ = builder.new_block(sealed=False)
+    test = range_test(builder, start, stop, step, bounds.sign)
+    builder.branch("br_if", test, targets=(body, exit_))
+
+    builder.enter()
+    builder.block = body
+    name = tree.target.id
+    builder.declared.add(name)
+    builder.assigned[-1] |= {name, counter}
+    value = builder.read(counter)
+    if value.block is body:
+        value.name = name  # the phi of the counter
+    builder.write(name, value)
+    yield tree.body
+    value = builder.emit("i32.add", builder.read(counter), step)
+    builder.write(counter, value)
+    test = range_test(builder, value, stop, step, bounds.sign)
+    builder.branch("br_if", test, targets=(body, exit_))
+
+    builder.leave(header, body, exit_)
+    builder.seal(body)
+    builder.seal(exit_)
+    builder.block = exit_
+    yield tree.orelse
+
+
+def range_test(builder: Builder, value: Instr, stop: Instr, step: Instr, sign: int | None):
+    """Whether the loop goes on with `value`."""
+    if sign is not None:
+        return builder.emit("i32.lt_s" if sign > 0 else "i32.gt_s", value, stop)
+    up = builder.emit("i32.lt_s", value, stop)
+    down = builder.emit("i32.gt_s", value, stop)
+    positive = builder.emit("i32.gt_s", step, builder.const(0))
+    return builder.emit("select", up, down, positive)
@@ -0,0 +1,84 @@
+"""
+Layout of a generated module: imported and defined functions, globals,
+memory and exports.
+
+Every value is an i32, so parameters and locals are only listed by
+name, and results by count. `to_wat()` renders a module as text and
+`binary.encode()` as binary, with the same function numbering (imports
+first, in order).
+"""
+from typing import NamedTuple
+
+from .block import Block
+
+
+class Import(NamedTuple):
+    module: str
+    name: str
+    func: str  # name of the function in the module, e.g. "$putn"
+    params: int = 0
+    results: int = 0
+
+
+class Function(NamedTuple):
+    name: str
+    params: list[str]
+    results: int
+    locals: list[str]
+    body: Block
+
+
+class Global(NamedTuple):
+    name: str
+    value: int = 0  # initial value of this mutable global
+
+
+class Export(NamedTuple):
+    name: str
+    kind: str  # "func" or "memory"
+    ref: str  # "$name" of a function, index of a memory
+
+
+class Module(NamedTuple):
+    imports: list[Import]
+    functions: list[Function]
+    exports: list[Export]
+    globals: list[Global]
+    memory: int | None = None  # initial size in pages, if any
+
+
+def signature(params: int, results: int) -> str:
+    text = " (param" + " i32" * params + ")" if params else ""
+    if results:
+        text += " (result" + " i32" * results + ")"
+    return text
+
+
+def to_wat(module: Module) -> Block:
+    block = Block()
+    block << "(module"
+    block.indent()
+    for imp in module.imports:
+        block << (
+            f'(import "{imp.module}" "{imp.name}"'
+            f" (func {imp.func}{signature(imp.params, imp.results)}))"
+        )
+    if module.memory is not None:
+        block << f"(memory {module.memory})"
+    for glob in module.globals:
+        block << f"(global {glob.name} (mut i32) (i32.const {glob.value}))"
+    for export in module.exports:
+        block << f'(export "{export.name}" ({export.kind} {export.ref}))'
+
+    for func in module.functions:
+        params = "".join(f" (param {param} i32)" for param in func.params)
+        block << f"(func {func.name}{params}{signature(0, func.results)}"
+        block.indent()
+        for local in func.locals:
+            block << f"(local {local} i32)"
+        block << func.body
+        block.dedent()
+        block << ")"
+    block.dedent()
+    block << ")"
+    return block
@@ -0,0 +1,167 @@
+"""
+Long-lived Node workers, to run compiled modules in V8 without paying
+Node's startup for each of them.
+
+A worker reads JSON requests on stdin, one per line, and answers each
+with one JSON line on stdout. Compiled `WebAssembly.Module` objects are
+cached by the SHA-256 of their bytes, so a module already seen by a
+worker is only sent (and compiled) once.
+
+    with NodePool(4) as pool:
+        pool.run(compile_binary(source)).output  # -> values passed to putn()
+"""
+import base64
+import hashlib
+import json
+import os
+import queue
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+# Request:  {"hash": ..., "entry": ..., "wasm": base64, sent if not cached}
+# Response: {"output": [...], "value": ...}, {"error": ...} or {"missing": true}
+# language=javascript
+WORKER = """
+const readline = require("readline");
+
+const MAX_MODULES = 256;
+const modules = new Map();
+let output = [];
+let memory = null;
+const importObject = {
+  env: {
+    js_putn: (n) => { output.push(n); },
+    js_flush: (address, count) => {
+      output.push(...new Int32Array(memory.buffer, address, count));
+    },
+  },
+};
+
+function load(request) {
+  let module = modules.get(request.hash);
+  if (module !== undefined) {
+    modules.delete(request.hash); // move to the end: most recently used
+  } else if (request.wasm !== undefined) {
+    module = new WebAssembly.Module(Buffer.from(request.wasm, "base64"));
+    if (modules.size >= MAX_MODULES) {
+      modules.delete(modules.keys().next().value);
+    }
+  } else {
+    return undefined;
+  }
+  modules.set(request.hash, module);
+  return module;
+}
+
+readline.createInterface({ input: process.stdin }).on("line", (line) => {
+  let response;
+  try {
+    const request = JSON.parse(line);
+    const module = load(request);
+    if (module === undefined) {
+      response = { missing: true };
+    } else {
+      output = [];
+      const instance = new WebAssembly.Instance(module, importObject);
+      memory = instance.exports.memory;
+      const value = instance.exports[request.entry]();
+      response = { output: output, value: value === undefined ? null : value };
+    }
+  } catch (e) {
+    response = { error: String(e) };
+  }
+  process.stdout.write(JSON.stringify(response) + "\\n");
+});
+"""
+
+
+class Execution(NamedTuple):
+    output: list[int]
+    value: int | None
+
+
+class NodeWorker:
+    """One Node process, running one module at a time."""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            ["node", "-e", WORKER],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        # Modules sent to this worker (it may have evicted some since)
+        self.sent: set[str] = set()
+
+    def request(self, message: dict) -> dict:
+        try:
+            self.process.stdin.write(json.dumps(message) + "\n")
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            pass
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"Node worker exited with status {self.process.wait()}")
+        return json.loads(line)
+
+    def run(self, wasm: bytes, entry: str = "exported_main") -> Execution:
+        digest = hashlib.sha256(wasm).hexdigest()
+        message = {"hash": digest, "entry": entry}
+        if digest not in self.sent:
+            message["wasm"] = base64.b64encode(wasm).decode()
+            self.sent.add(digest)
+        response = self.request(message)
+        if response.get("missing"):
+            message["wasm"] = base64.b64encode(wasm).decode()
+            response = self.request(message)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return Execution(response["output"], response["value"])
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self):
+        if self.alive:
+            self.process.stdin.close()
+            self.process.wait()
+        self.process.stdout.close()
+
+
+class NodePool:
+    """A pool of `NodeWorker`, usable from several threads."""
+
+    def __init__(self, size: int | None = None):
+        self.workers = [NodeWorker() for _ in range(size or os.cpu_count() or 1)]
+        self.idle: queue.SimpleQueue[NodeWorker] = queue.SimpleQueue()
+        for worker in self.workers:
+            self.idle.put(worker)
+
+    def run(self, wasm: bytes, entry: str = "exported_main") -> Execution:
+        worker = self.idle.get()
+        try:
+            return worker.run(wasm, entry)
+        finally:
+            if not worker.alive:
+                worker.close()
+                self.workers.remove(worker)
+                worker = NodeWorker()
+                self.workers.append(worker)
+            self.idle.put(worker)
+
+    def map(self, modules, entry: str = "exported_main") -> list[Execution]:
+        """Run `modules` on all the workers, return their executions in order."""
+        with ThreadPoolExecutor(len(self.workers)) as executor:
+            return list(executor.map(lambda wasm: self.run(wasm, entry), modules))
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,29 @@
+"""
+The i32 instructions of Python's arithmetic and comparison operators.
+"""
+import ast
+from ast import AST
+
+BINARY_OPS = {
+    ast.Add: "i32.add",
+    ast.Sub: "i32.sub",
+    ast.Mult: "i32.mul",
+    ast.Div: "i32.div_s",
+    ast.Mod: "i32.rem_s",
+}
+
+COMPARE_OPS = {
+    ast.Eq: "i32.eq",
+    ast.NotEq: "i32.ne",
+    ast.Lt: "i32.lt_s",
+    ast.LtE: "i32.le_s",
+    ast.Gt: "i32.gt_s",
+    ast.GtE: "i32.ge_s",
+}
+
+
+def operator(table: dict, op: AST) -> str:
+    try:
+        return table[type(op)]
+    except KeyError:
+        raise NotImplementedError(f"Unknown operator {op!r}") from None
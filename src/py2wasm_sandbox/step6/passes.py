@@ -0,0 +1,276 @@
+"""
+Optimization passes over the IR (see `ir.py`), and the pass manager.
+
+A pass is a function `(func, stats) -> int` rewriting `func` in place
+and returning the number of changes it made; `register()` makes it
+available by name to `PassManager`:
+
+- fold: evaluate the operations whose arguments are all constants, like
+  `fold.py` does on the AST (after lowering, variables with a constant
+  value are constants too)
+- simplify_cfg: fold branches on constants, remove unreachable blocks,
+  merge a block into its only predecessor when it is that block's only
+  successor
+- cse: replace the operations already computed with the same arguments
+  in a dominating block, or earlier in the same block, by that value
+  (global value numbering over the dominator tree); since variables are
+  SSA values, `a + b` is only reused while `a` and `b` keep their value.
+  The reused value gets a local, set with `local.tee` (see `emit.py`)
+- dead_code: remove the instructions whose value is never used and that
+  have no side effects, including cycles of phis
+"""
+import operator
+from collections import Counter
+from collections.abc import Callable
+
+from .fold import div_s, rem_s, wrap
+from .ir import (
+    EFFECTS,
+    Function,
+    Instr,
+    dominators,
+    remove_trivial_phis,
+    replace_uses,
+    reverse_postorder,
+    verify,
+)
+from .profiling import phase
+
+# Passes, by name. Use `register()` to add or replace one.
+PASSES: dict[str, Callable[[Function, Counter | None], int]] = {}
+
+DEFAULT_PASSES = ("fold", "simplify_cfg", "cse", "dead_code")
+
+# Evaluation of the i32 operations, None when they trap
+EVALUATE = {
+    "i32.add": lambda a, b: wrap(a + b),
+    "i32.sub": lambda a, b: wrap(a - b),
+    "i32.mul": lambda a, b: wrap(a * b),
+    "i32.div_s": div_s,
+    "i32.rem_s": rem_s,
+    "i32.eq": operator.eq,
+    "i32.ne": operator.ne,
+    "i32.lt_s": operator.lt,
+    "i32.le_s": operator.le,
+    "i32.gt_s": operator.gt,
+    "i32.ge_s": operator.ge,
+    "i32.and": operator.and_,
+    "i32.or": operator.or_,
+    "i32.xor": operator.xor,
+    "i32.eqz": lambda a: a == 0,
+    "select": lambda a, b, condition: a if condition else b,
+}
+
+# Operations whose arguments can be swapped
+COMMUTATIVE = {"i32.add", "i32.mul", "i32.eq", "i32.ne", "i32.and", "i32.or", "i32.xor"}
+
+
+def register(name: str):
+    """Decorator registering an IR pass under `name`."""
+
+    def decorator(function):
+        PASSES[name] = function
+        return function
+
+    return decorator
+
+
+class PassManager:
+    """Run passes in order; with `verify`, check the IR after each of them."""
+
+    def __init__(self, passes=DEFAULT_PASSES, verify: bool = False, stats: Counter | None = None):
+        for name in passes:
+            if name not in PASSES:
+                raise ValueError(f"Unknown pass {name!r}")
+        self.passes = list(passes)
+        self.verify = verify
+        self.stats = stats
+
+    def run(self, func: Function) -> Function:
+        if self.verify:
+            verify(func)
+        for name in self.passes:
+            with phase("ir." + name):
+                changes = PASSES[name](func, self.stats)
+            if changes and self.stats is not None:
+                self.stats[name] += changes
+            if self.verify:
+                verify(func)
+        return func
+
+
+@register("fold")
+def fold(func: Function, stats: Counter | None = None) -> int:
+    folded = 0
+    # Instructions become constants in place; blocks are visited in reverse
+    # postorder, so that arguments are folded before their users
+    for block in reverse_postorder(func):
+        for instr in block.instrs:
+            if instr.op not in EVALUATE or any(arg.op != "i32.const" for arg in instr.args):
+                continue
+            value = EVALUATE[instr.op](*(arg.imm for arg in instr.args))
+            if value is not None:
+                instr.op = "i32.const"
+                instr.args = []
+                instr.imm = int(value)
+                folded += 1
+    return folded
+
+
+@register("simplify_cfg")
+def simplify_cfg(func: Function, stats: Counter | None = None) -> int:
+    changes = 0
+    for block in func.blocks:
+        terminator = block.terminator
+        if terminator.op in ("br_if", "br_table") and terminator.args[0].op == "i32.const":
+            index = terminator.args[0].imm
+            if terminator.op == "br_if":
+                taken = terminator.targets[0 if index else 1]
+            elif 0 <= index < len(terminator.targets) - 1:
+                taken = terminator.targets[index]
+            else:
+                taken = terminator.targets[-1]
+            for other in block.succs:
+                if other is not taken:
+                    other.remove_pred(block)
+            terminator.op = "br"
+            terminator.args = []
+            terminator.targets = [taken]
+            changes += 1
+
+    # Branches to a block that only branches on go to its target instead,
+    # unless they would become a second edge to it. Its constants, like the
+    # folded test of a `br_if`, move to the entry block: they are emitted
+    # where they are used anyway
+    for block in func.blocks:
+        terminator = block.terminator
+        if block is func.entry or terminator.op != "br":
+            continue
+        if any(instr.op != "i32.const" for instr in block.instrs[:-1]):
+            continue
+        target = terminator.targets[0]
+        # The targets of `br_table` have no phis (see `emit.py`)
+        if target is block or any(
+            target in pred.succs
+            or pred.succs.count(block) > 1
+            or pred.terminator.op == "br_table"
+            for pred in block.preds
+        ):
+            continue
+        index = target.preds.index(block)
+        for phi in target.phis:
+            phi.args[index : index + 1] = [phi.args[index]] * len(block.preds)
+        target.preds[index : index + 1] = block.preds
+        for pred in block.preds:
+            branch = pred.terminator
+            branch.targets = [target if succ is block else succ for succ in branch.targets]
+        position = sum(1 for instr in func.entry.instrs if instr.op == "param")
+        for instr in block.instrs[:-1]:
+            instr.block = func.entry
+            func.entry.instrs.insert(position, instr)
+        block.preds = []
+        block.instrs.clear()
+        changes += 1
+
+    reachable = set(reverse_postorder(func))
+    for block in func.blocks:
+        if block not in reachable:
+            for succ in block.succs:
+                if succ in reachable:
+                    succ.remove_pred(block)
+            changes += 1
+    func.blocks = [block for block in func.blocks if block in reachable]
+    changes += remove_trivial_phis(func)
+
+    merged = set()
+    for block in func.blocks:
+        if block in merged:
+            continue
+        while True:
+            succs = block.succs
+            if block.terminator.op != "br" or len(succs[0].preds) != 1:
+                break
+            if succs[0] is block or succs[0] is func.entry:
+                break
+            succ = succs[0]
+            # Its phis have a single argument, already replaced by `remove_trivial_phis()`
+            block.instrs.pop()
+            for instr in succ.instrs:
+                block.append(instr)
+            for next_block in succ.succs:
+                next_block.preds = [block if pred is succ else pred for pred in next_block.preds]
+            merged.add(succ)
+            changes += 1
+    func.blocks = [block for block in func.blocks if block not in merged]
+    return changes
+
+
+@register("cse")
+def cse(func: Function, stats: Counter | None = None) -> int:
+    order = reverse_postorder(func)
+    idom = dominators(order)
+    children = {block: [] for block in order}
+    for block in order[1:]:
+        children[idom[block]].append(block)
+
+    # Values computed by the blocks dominating the current one, by key
+    available: dict[tuple, Instr] = {}
+    replacements: dict[Instr, Instr] = {}
+    # Preorder walk of the dominator tree: a block, or the keys it added,
+    # removed once its subtree is done
+    work: list = [order[0]]
+    while work:
+        item = work.pop()
+        if isinstance(item, list):
+            for key in item:
+                del available[key]
+            continue
+        added = []
+        instrs = []
+        for instr in item.instrs:
+            key = value_key(instr, replacements)
+            if key is not None:
+                if key in available:
+                    replacements[instr] = available[key]
+                    continue
+                available[key] = instr
+                added.append(key)
+            instrs.append(instr)
+        item.instrs = instrs
+        work.append(added)
+        work.extend(reversed(children[item]))
+
+    replace_uses(func, replacements)
+    return len(replacements)
+
+
+def value_key(instr: Instr, replacements: dict[Instr, Instr]) -> tuple | None:
+    """What identifies the value of `instr`, None if it can't be reused."""
+    if instr.is_terminator or instr.op in EFFECTS:
+        return None
+    args = tuple(replacements.get(arg, arg) for arg in instr.args)
+    if instr.op in COMMUTATIVE and args[0].id > args[1].id:
+        args = args[::-1]
+    if instr.op == "phi":
+        # Phis are only the same value in the same block
+        return (instr.op, instr.block, args)
+    # A division that would trap has trapped where it was first computed
+    return (instr.op, instr.imm, args)
+
+
+@register("dead_code")
+def dead_code(func: Function, stats: Counter | None = None) -> int:
+    live = set()
+    work = [instr for instr in func.instructions() if instr.is_terminator or instr.has_effects]
+    while work:
+        instr = work.pop()
+        if instr not in live:
+            live.add(instr)
+            work.extend(instr.args)
+
+    removed = 0
+    for block in func.blocks:
+        count = len(block.instrs)
+        block.instrs = [instr for instr in block.instrs if instr in live]
+        removed += count - len(block.instrs)
+    return removed
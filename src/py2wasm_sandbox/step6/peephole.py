@@ -0,0 +1,206 @@
+"""
+Peephole optimizer for the generated instruction stream.
+
+Works on the flattened `(indentation, line)` list of a `Block`, before it
+is rendered, and applies local rewrites until none matches anymore:
+
+- set_get_to_tee: `local.set $x; local.get $x` -> `local.tee $x`
+- get_tee: `local.get $x; local.tee $x` -> `local.get $x`
+- dead_store: `local.set $x` overwritten before any read -> `drop`
+- drop_pure: `local.get`/`i32.const` followed by `drop` -> removed
+- const_eqz: `i32.const n; i32.eqz` -> `i32.const (n == 0)`
+- eq_zero: `i32.const 0; i32.eq` -> `i32.eqz`
+- compare_eqz: `i32.lt_s; i32.eqz` -> `i32.ge_s` (and other comparisons)
+- redundant_test: `i32.eqz; i32.eqz` or `i32.const 0; i32.ne` in front
+  of a conditional branch -> removed
+- eqz_if: `i32.eqz; if A else B end` -> `if B else A end`
+
+`optimize()` counts the rewrites made by each rule.
+"""
+from collections import Counter
+from functools import lru_cache
+
+INVERSE = {
+    "i32.eq": "i32.ne",
+    "i32.ne": "i32.eq",
+    "i32.lt_s": "i32.ge_s",
+    "i32.ge_s": "i32.lt_s",
+    "i32.gt_s": "i32.le_s",
+    "i32.le_s": "i32.gt_s",
+    "i32.lt_u": "i32.ge_u",
+    "i32.ge_u": "i32.lt_u",
+    "i32.gt_u": "i32.le_u",
+    "i32.le_u": "i32.gt_u",
+}
+
+# Instructions that end a straight-line sequence
+CONTROL = {
+    "block", "loop", "if", "else", "end",
+    "br", "br_if", "br_table", "return", "unreachable",
+}  # fmt: skip
+BRANCHES = {"if", "br_if"}
+PURE = {"local.get", "i32.const"}
+
+
+@lru_cache(maxsize=4096)
+def parse(line: str) -> tuple[str, ...]:
+    """Split an instruction line into opcode and immediates, without comments."""
+    return tuple(line.split(";;", 1)[0].split())
+
+
+class Peephole:
+    def __init__(self, code):
+        self.code: list[tuple[int, str]] = list(code)
+        self.stats = Counter()
+
+    def op(self, i: int) -> tuple[str, ...]:
+        if 0 <= i < len(self.code):
+            return parse(self.code[i][1]) or ("",)
+        return ("",)
+
+    def replace(self, i: int, count: int, *lines: str):
+        """Replace `count` instructions at `i` by `lines`, at the indentation of `i`."""
+        indentation = self.code[i][0]
+        self.code[i : i + count] = [(indentation, line) for line in lines]
+
+    def run(self) -> list[tuple[int, str]]:
+        # Rules, by the opcode of the first instruction they can match
+        rules = {
+            "local.set": [self.set_get_to_tee, self.dead_store],
+            "local.get": [self.get_tee, self.drop_pure],
+            "i32.const": [
+                self.drop_pure,
+                self.const_eqz,
+                self.eq_zero,
+                self.redundant_test,
+            ],
+            "i32.eqz": [self.redundant_test, self.eqz_if],
+        }
+        for op in INVERSE:
+            rules[op] = [self.compare_eqz]
+
+        changed = True
+        while changed:
+            changed = False
+            i = 0
+            while i < len(self.code):
+                for rule in rules.get(self.op(i)[0], ()):
+                    if rule(i):
+                        self.stats[rule.__name__] += 1
+                        changed = True
+                        break
+                i += 1
+        return self.code
+
+    # --- rules ---
+    def set_get_to_tee(self, i: int) -> bool:
+        match self.op(i), self.op(i + 1):
+            case ["local.set", x], ["local.get", y] if x == y:
+                self.replace(i, 2, f"local.tee {x}")
+                return True
+        return False
+
+    def get_tee(self, i: int) -> bool:
+        match self.op(i), self.op(i + 1):
+            case ["local.get", x], ["local.tee", y] if x == y:
+                self.replace(i, 2, f"local.get {x}")
+                return True
+        return False
+
+    def dead_store(self, i: int) -> bool:
+        match self.op(i):
+            case ["local.set", x]:
+                pass
+            case _:
+                return False
+
+        for j in range(i + 1, len(self.code)):
+            match self.op(j):
+                case ["local.get", y] if y == x:
+                    return False
+                case ["local.set" | "local.tee", y] if y == x:
+                    self.replace(i, 1, "drop")
+                    return True
+                case [op, *_] if op in CONTROL:
+                    return False
+        return False
+
+    def drop_pure(self, i: int) -> bool:
+        if self.op(i)[0] in PURE and self.op(i + 1) == ("drop",):
+            self.replace(i, 2)
+            return True
+        return False
+
+    def const_eqz(self, i: int) -> bool:
+        match self.op(i), self.op(i + 1):
+            case ["i32.const", n], ["i32.eqz"]:
+                self.replace(i, 2, f"i32.const {int(int(n, 0) == 0)}")
+                return True
+        return False
+
+    def eq_zero(self, i: int) -> bool:
+        match self.op(i), self.op(i + 1):
+            case ["i32.const", "0"], ["i32.eq"]:
+                self.replace(i, 2, "i32.eqz")
+                return True
+        return False
+
+    def compare_eqz(self, i: int) -> bool:
+        match self.op(i), self.op(i + 1):
+            case [op], ["i32.eqz"] if op in INVERSE:
+                self.replace(i, 2, INVERSE[op])
+                return True
+        return False
+
+    def redundant_test(self, i: int) -> bool:
+        # Only the truth of the value matters to a branch
+        if self.op(i + 2)[0] not in BRANCHES:
+            return False
+        match self.op(i), self.op(i + 1):
+            case (["i32.eqz"], ["i32.eqz"]) | (["i32.const", "0"], ["i32.ne"]):
+                self.replace(i, 2)
+                return True
+        return False
+
+    def eqz_if(self, i: int) -> bool:
+        if self.op(i) != ("i32.eqz",) or self.op(i + 1) != ("if",):
+            return False
+        arms = self.find_else_end(i + 1)
+        if arms is None:
+            return False
+
+        else_, end = arms
+        then_arm = self.code[i + 2 : else_]
+        else_arm = self.code[else_ + 1 : end]
+        self.code[i:end] = [
+            self.code[i + 1],
+            *else_arm,
+            self.code[else_],
+            *then_arm,
+        ]
+        return True
+
+    def find_else_end(self, start: int) -> tuple[int, int] | None:
+        """Return the `else` and `end` indexes of the `if` at `start`, if it has an `else`."""
+        depth = 0
+        else_ = None
+        for j in range(start + 1, len(self.code)):
+            op = self.op(j)[0]
+            if op in ("block", "loop", "if"):
+                depth += 1
+            elif op == "else" and depth == 0:
+                else_ = j
+            elif op == "end":
+                if depth == 0:
+                    return (else_, j) if else_ is not None else None
+                depth -= 1
+        return None
+
+
+def optimize(code, stats: Counter | None = None) -> list[tuple[int, str]]:
+    """Rewrite a flattened instruction list, adding rule counts to `stats`."""
+    peephole = Peephole(code)
+    result = peephole.run()
+    if stats is not None:
+        stats.update(peephole.stats)
+    return result
@@ -0,0 +1,121 @@
+"""
+Opt-in instrumentation of the compiler.
+
+The compiler reports each phase (parse, fold, dce, generate...) and, in
+`generate()`, each AST node to the registered hooks, with its wall time
+and its net blocks: the change of `sys.getallocatedblocks()`, that is the
+blocks it allocated minus those it freed. This is not an allocation
+count: temporaries cancel out, and it can be negative. Node figures are
+exclusive of the node's children.
+
+When no hook is registered, phases cost one list check and `generate()`
+doesn't measure nodes.
+
+    with profile() as prof:
+        compile(source)
+    prof.dump("profile.json")
+"""
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+# Callables receiving (kind, name, seconds, net_blocks), kind is "phase" or "node"
+hooks: list = []
+
+# [start time, start blocks, children's time, children's blocks] of the
+# nodes being measured
+_children: list[list] = []
+
+
+def add_hook(hook):
+    hooks.append(hook)
+
+
+def remove_hook(hook):
+    hooks.remove(hook)
+
+
+def emit(kind: str, name: str, seconds: float, net_blocks: int):
+    for hook in hooks:
+        hook(kind, name, seconds, net_blocks)
+
+
+@contextmanager
+def phase(name: str):
+    if not hooks:
+        yield
+        return
+
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        emit("phase", name, seconds, sys.getallocatedblocks() - blocks)
+
+
+@contextmanager
+def measuring_nodes():
+    """Measure nodes in the block; an exception drops the ones left unfinished."""
+    depth = len(_children)
+    try:
+        yield
+    finally:
+        del _children[depth:]
+
+
+def start_node():
+    """Start measuring a node; nodes started meanwhile are its children."""
+    _children.append([time.perf_counter(), sys.getallocatedblocks(), 0.0, 0])
+
+
+def finish_node(name: str):
+    """Report the exclusive cost of the node started last."""
+    start, blocks, child_seconds, child_blocks = _children.pop()
+    seconds = time.perf_counter() - start
+    blocks = sys.getallocatedblocks() - blocks
+    if _children:
+        _children[-1][2] += seconds
+        _children[-1][3] += blocks
+    emit("node", name, seconds - child_seconds, blocks - child_blocks)
+
+
+class Profile:
+    """A hook accumulating totals per phase and per node type."""
+
+    def __init__(self):
+        self.phases: dict[str, dict] = {}
+        self.nodes: dict[str, dict] = {}
+
+    def __call__(self, kind: str, name: str, seconds: float, net_blocks: int):
+        table = self.phases if kind == "phase" else self.nodes
+        entry = table.setdefault(name, {"count": 0, "seconds": 0.0, "net_blocks": 0})
+        entry["count"] += 1
+        entry["seconds"] += seconds
+        entry["net_blocks"] += net_blocks
+
+    def to_dict(self) -> dict:
+        return {"phases": self.phases, "nodes": self.nodes}
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+@contextmanager
+def profile(hook=None):
+    """Profile the compilations run in the block; yields a `Profile`.
+
+    `hook`, if given, is also called for every phase and node.
+    """
+    prof = Profile()
+    registered = [prof] if hook is None else [prof, hook]
+    for h in registered:
+        add_hook(h)
+    try:
+        yield prof
+    finally:
+        for h in registered:
+            remove_hook(h)
@@ -0,0 +1,104 @@
+"""
+In-process execution of compiled modules, with pywasm.
+
+    run(compile_binary(source))  # -> values passed to putn()
+    python_output(source)  # -> the same, running source with Python
+
+Parsed modules are cached by the SHA-256 of their bytes, so running the
+same module again only costs instantiation and execution.
+
+pywasm is a development dependency: it is imported by the first call.
+"""
+import hashlib
+import io
+import struct
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pywasm
+
+MAX_CACHED_MODULES = 128
+
+_modules: "OrderedDict[str, pywasm.core.ModuleDesc]" = OrderedDict()
+
+
+def import_pywasm():
+    try:
+        import pywasm
+    except ImportError:
+        raise ImportError(
+            "Running modules in-process needs pywasm, a development dependency: "
+            "pip install pywasm"
+        ) from None
+    return pywasm
+
+
+def load(wasm: bytes) -> "pywasm.core.ModuleDesc":
+    """Parse `wasm`, or return the cached module."""
+    pywasm = import_pywasm()
+    digest = hashlib.sha256(wasm).hexdigest()
+    module = _modules.get(digest)
+    if module is None:
+        module = pywasm.core.ModuleDesc.from_reader(io.BytesIO(wasm))
+        _modules[digest] = module
+        if len(_modules) > MAX_CACHED_MODULES:
+            _modules.popitem(last=False)
+    else:
+        _modules.move_to_end(digest)
+    return module
+
+
+def host_function(runtime, func_type, func):
+    """Wrap a plain Python function as a pywasm host function."""
+
+    def hostcode(machine, args):
+        result = func(*args)
+        if result is None:
+            return []
+        if isinstance(result, tuple):
+            return list(result)
+        return [result]
+
+    hostcode.__name__ = getattr(func, "__name__", "host")
+    return runtime.allocate_func_host(func_type, hostcode)
+
+
+def python_output(source: str) -> list[int]:
+    """Run `source` with Python, return the values passed to putn, like `run()`."""
+    output = []
+    exec(source, {"putn": lambda value: output.append(int(value))})
+    return output
+
+
+def run(wasm: bytes, imports: dict | None = None, entry: str = "exported_main") -> list[int]:
+    """Run the `entry` export of `wasm`, return the values passed to putn.
+
+    `imports` maps module names to `{name: function}` dicts; they are
+    added to (or override) the default `env.js_putn` and `env.js_flush`
+    (for buffered output, see `layout.py`).
+    """
+    output = []
+    memory = None
+
+    def flush(address, count):
+        output.extend(struct.unpack_from(f"<{count}i", memory.data, address))
+
+    all_imports = {"env": {"js_putn": output.append, "js_flush": flush}}
+    for module_name, functions in (imports or {}).items():
+        all_imports.setdefault(module_name, {}).update(functions)
+
+    module = load(wasm)
+    runtime = import_pywasm().core.Runtime()
+    for imp in module.imps:
+        func = all_imports.get(imp.module, {}).get(imp.name)
+        if func is None:
+            raise ValueError(f"Missing import {imp.module}.{imp.name}")
+        extern = host_function(runtime, module.type[imp.desc], func)
+        runtime.imports.setdefault(imp.module, {})[imp.name] = extern
+
+    instance = runtime.instance(module)
+    if any(export.name == "memory" for export in module.exps):
+        memory = runtime.exported_memory(instance, "memory")
+    runtime.invocate(instance, entry, [])
+    return output
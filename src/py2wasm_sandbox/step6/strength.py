@@ -0,0 +1,172 @@
+"""
+Strength reduction for multiplication, division and modulo by constants.
+
+Works on the flattened instruction list, like the peephole optimizer:
+`i32.const c` directly followed by `i32.mul`, `i32.div_s` or `i32.rem_s`
+means the right operand is the constant `c` and the left one is already
+on the stack. Such pairs are replaced by:
+
+- shifts, for multiplication by a power of two
+- sign-corrected shift sequences, for division and modulo by a power
+  of two
+- a multiplication by a "magic number" (Hacker's Delight, 10-4), for
+  other divisors
+
+The replacements compute exactly what `i32.div_s`/`i32.rem_s` compute;
+divisions that may trap (by 0, or `INT_MIN / -1`) are left alone.
+"""
+from collections import Counter
+
+from .fold import INT_MIN, wrap
+from .peephole import parse
+
+
+def log2(n: int) -> int | None:
+    """Return k if n == 2**k (k >= 1), else None."""
+    if n > 1 and n & (n - 1) == 0:
+        return n.bit_length() - 1
+    return None
+
+
+def magic(d: int) -> tuple[int, int]:
+    """Magic multiplier (as a signed i32) and shift for signed division by d >= 2."""
+    assert 2 <= d < 2**31
+    two31 = 2**31
+    anc = two31 - 1 - two31 % d  # absolute value of nc
+    p = 31
+    q1, r1 = divmod(two31, anc)
+    q2, r2 = divmod(two31, d)
+    while True:
+        p += 1
+        q1, r1 = 2 * q1, 2 * r1
+        if r1 >= anc:
+            q1, r1 = q1 + 1, r1 - anc
+        q2, r2 = 2 * q2, 2 * r2
+        if r2 >= d:
+            q2, r2 = q2 + 1, r2 - d
+        delta = d - r2
+        if not (q1 < delta or (q1 == delta and r1 == 0)):
+            break
+    return wrap(q2 + 1), p - 32
+
+
+def bias(k: int, tmp: str) -> list[str]:
+    """2**k - 1 if the value in `tmp` is negative, 0 otherwise."""
+    return [
+        f"local.get {tmp}",
+        "i32.const 31",
+        "i32.shr_s",
+        f"i32.const {32 - k}",
+        "i32.shr_u",
+    ]
+
+
+def multiply(c: int, tmp) -> list[str] | None:
+    k = log2(c & 0xFFFFFFFF)
+    if k is None:
+        return None
+    return [f"i32.const {k}", "i32.shl"]
+
+
+def divide_positive(d: int, tmp: str) -> list[str]:
+    k = log2(d)
+    if k is not None:
+        # (x + bias) >> k rounds towards zero
+        return [f"local.tee {tmp}", *bias(k, tmp), "i32.add", f"i32.const {k}", "i32.shr_s"]
+
+    m, s = magic(d)
+    code = [
+        f"local.tee {tmp}",
+        "i64.extend_i32_s",
+        f"i64.const {m}",
+        "i64.mul",
+        "i64.const 32",
+        "i64.shr_s",
+        "i32.wrap_i64",
+    ]
+    if m < 0:
+        code += [f"local.get {tmp}", "i32.add"]
+    if s:
+        code += [f"i32.const {s}", "i32.shr_s"]
+    # Add 1 if x is negative, to round towards zero
+    code += [f"local.get {tmp}", "i32.const 31", "i32.shr_u", "i32.add"]
+    return code
+
+
+def divide(c: int, tmp) -> list[str] | None:
+    if c in (0, 1, -1, INT_MIN):
+        return None
+    if c > 0:
+        return divide_positive(c, tmp())
+
+    # x / -d == -(x / d) with truncating division
+    tmp = tmp()
+    return [
+        f"local.set {tmp}",
+        "i32.const 0",
+        f"local.get {tmp}",
+        *divide_positive(-c, tmp),
+        "i32.sub",
+    ]
+
+
+def remainder(c: int, tmp) -> list[str] | None:
+    # The sign of the remainder only depends on the dividend
+    d = abs(c)
+    if d in (0, 1) or d == 2**31:
+        return None
+
+    tmp = tmp()
+    k = log2(d)
+    if k is not None:
+        # x - ((x + bias) & -d)
+        return [
+            f"local.tee {tmp}",
+            f"local.get {tmp}",
+            *bias(k, tmp),
+            "i32.add",
+            f"i32.const {-d}",
+            "i32.and",
+            "i32.sub",
+        ]
+
+    # x - (x / d) * d
+    return [
+        f"local.tee {tmp}",
+        f"local.get {tmp}",
+        *divide_positive(d, tmp),
+        f"i32.const {d}",
+        "i32.mul",
+        "i32.sub",
+    ]
+
+
+LOWERINGS = {
+    "i32.mul": multiply,
+    "i32.div_s": divide,
+    "i32.rem_s": remainder,
+}
+
+
+def reduce_strength(code, temporary, stats: Counter | None = None) -> list[tuple[int, str]]:
+    """Rewrite a flattened instruction list.
+
+    `temporary()` returns the name of a scratch i32 local; it is only
+    called when a replacement needs one.
+    """
+    result = []
+    for indentation, line in code:
+        op = parse(line)
+        if op and op[0] in LOWERINGS and result:
+            match parse(result[-1][1]):
+                case ["i32.const", value]:
+                    lowering = LOWERINGS[op[0]]
+                    replacement = lowering(wrap(int(value, 0)), temporary)
+                    if replacement is not None:
+                        result.pop()
+                        result += [(indentation, line) for line in replacement]
+                        if stats is not None:
+                            stats[lowering.__name__] += 1
+                        continue
+        result.append((indentation, line))
+    return result
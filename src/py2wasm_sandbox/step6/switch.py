@@ -0,0 +1,180 @@
+"""
+Dispatch on an integer: `if`/`elif` ladders and `match` statements.
+
+A ladder whose tests all compare the same variable with constants,
+
+    if x == 0:
+        ...
+    elif x == 1 or x == 2:
+        ...
+    else:
+        ...
+
+runs like the `match` statement on `x` with the patterns `0` and `1 | 2`,
+and the wildcard `_` for the `else` arm. Both are a `Switch`: the arms
+of the values, and the default arm. A value appears in its first arm
+only, like the first test that matches it is the one that runs.
+`match` only supports these patterns, on an integer subject, which is
+evaluated once.
+
+Instead of comparing the subject with each value in turn, `plan()`
+dispatches on it with:
+
+- a `Table` when the values are dense enough: a `br_table` on the
+  subject minus the lowest value, whose default is for the values out
+  of range;
+- a `Split` otherwise, a binary search that tests whether the subject
+  is below the middle value, and dispatches among the lower values or
+  the others;
+- `Comparisons` with each value, when there are only a few left.
+
+Ladders are only compiled this way when they test `MIN_CASES` values at
+least.
+"""
+import ast
+from typing import NamedTuple
+
+from .fold import int_value, wrap
+
+# Values of a ladder below which it is compiled as written
+MIN_CASES = 4
+# Values tested one after the other, at the leaves of a `Split`
+MAX_TESTS = 3
+# Minimum ratio of values to table entries, and maximum number of entries
+MIN_DENSITY = 0.5
+MAX_TABLE = 4096
+
+
+class Switch(NamedTuple):
+    subject: ast.expr
+    # The values of each arm, and its body
+    cases: list[tuple[list[int], list[ast.stmt]]]
+    default: list[ast.stmt]
+
+
+class Table(NamedTuple):
+    low: int
+    # Arm of each value from `low` on: an index in `cases`, or `len(cases)`
+    # for the default arm
+    arms: list[int]
+
+
+class Split(NamedTuple):
+    pivot: int
+    below: "Table | Split | Comparisons"
+    above: "Table | Split | Comparisons"  # the values from `pivot` on
+
+
+class Comparisons(NamedTuple):
+    # (value, arm)
+    values: list[tuple[int, int]]
+
+
+def ladder(tree: ast.If) -> Switch | None:
+    """The `Switch` of an `if`/`elif` ladder, if `tree` is one."""
+    subject = None
+    cases = []
+    seen = set()
+    node = tree
+    while True:
+        tested = tested_values(node.test)
+        if tested is None:
+            return None
+        name, values = tested
+        if subject is None:
+            subject = name
+        elif name != subject:
+            return None
+        values = [value for value in values if value not in seen]
+        seen.update(values)
+        if values:
+            cases.append((values, node.body))
+        match node.orelse:
+            case [ast.If() as next_]:
+                node = next_
+            case orelse:
+                default = orelse
+                break
+    if len(seen) < MIN_CASES:
+        return None
+    return Switch(ast.Name(id=subject, ctx=ast.Load()), cases, default)
+
+
+def tested_values(test: ast.expr) -> tuple[str, list[int]] | None:
+    """(variable, values) when `test` compares a variable with these values."""
+    match test:
+        case ast.Compare(left=ast.Name(id=name), ops=[ast.Eq()], comparators=[other]):
+            pass
+        case ast.Compare(left=other, ops=[ast.Eq()], comparators=[ast.Name(id=name)]):
+            pass
+        case ast.BoolOp(op=ast.Or(), values=operands):
+            found = [tested_values(operand) for operand in operands]
+            if None in found or len({name for name, _ in found}) != 1:
+                return None
+            return found[0][0], [value for _, values in found for value in values]
+        case _:
+            return None
+    value = int_value(other)
+    return None if value is None else (name, [value])
+
+
+def match_switch(tree: ast.Match) -> Switch:
+    """The `Switch` of a `match` statement."""
+    cases = []
+    seen = set()
+    default = []
+    for i, case in enumerate(tree.cases):
+        if case.guard is not None:
+            raise NotImplementedError("Guards in `case` are not supported")
+        if is_wildcard(case.pattern):
+            if i != len(tree.cases) - 1:
+                raise ValueError("Only the last `case` can be `_`")
+            default = case.body
+            break
+        values = [value for value in pattern_values(case.pattern) if value not in seen]
+        seen.update(values)
+        if values:
+            cases.append((values, case.body))
+    return Switch(tree.subject, cases, default)
+
+
+def is_wildcard(pattern: ast.pattern) -> bool:
+    return isinstance(pattern, ast.MatchAs) and pattern.pattern is None and pattern.name is None
+
+
+def pattern_values(pattern: ast.pattern) -> list[int]:
+    match pattern:
+        case ast.MatchValue(value=value) if int_value(value) is not None:
+            return [int_value(value)]
+        case ast.MatchValue(value=ast.UnaryOp(op=ast.USub(), operand=value)) if (
+            int_value(value) is not None
+        ):
+            # Negative literals, when constants are not folded
+            return [wrap(-int_value(value))]
+        case ast.MatchOr(patterns=patterns):
+            return [value for alternative in patterns for value in pattern_values(alternative)]
+    raise NotImplementedError("Only `case` patterns of int literals are supported")
+
+
+def plan(switch: Switch) -> Table | Split | Comparisons:
+    """How to dispatch on the subject of `switch` (see above)."""
+    arm = {value: i for i, (values, _) in enumerate(switch.cases) for value in values}
+    if not arm:
+        return Comparisons([])
+    return plan_values(sorted(arm), arm, len(switch.cases))
+
+
+def plan_values(values: list[int], arm: dict[int, int], default: int):
+    # The depth of the recursion is logarithmic in the number of values
+    span = values[-1] - values[0] + 1
+    if len(values) > MAX_TESTS and span <= MAX_TABLE and len(values) >= MIN_DENSITY * span:
+        low = values[0]
+        return Table(low, [arm.get(low + i, default) for i in range(span)])
+    if len(values) <= MAX_TESTS:
+        return Comparisons([(value, arm[value]) for value in values])
+    middle = len(values) // 2
+    return Split(
+        values[middle],
+        plan_values(values[:middle], arm, default),
+        plan_values(values[middle:], arm, default),
+    )
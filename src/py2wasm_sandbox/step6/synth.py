@@ -0,0 +1,124 @@
+"""
+Synthetic program generator, for benchmarks.
+
+Programs only use what step6 compiles (i32 variables, arithmetic,
+comparisons, `if`/`else`, `while`, `putn()`), always terminate and never
+divide by zero. They end with `0`, the value returned by `$main`.
+"""
+import random
+
+OPERATORS = ["+", "-", "*"]
+COMPARISONS = ["<", "<=", ">", ">=", "==", "!="]
+
+# Loops run up to 10 times: limit their nesting to bound execution time
+MAX_LOOP_NESTING = 3
+
+
+class Synthesizer:
+    def __init__(self, variables: int, chain: int, seed: int):
+        self.variables = [f"v{i}" for i in range(variables)]
+        self.chain = chain
+        self.random = random.Random(seed)
+        self.lines: list[str] = []
+        self.counters = 0
+        self.loop_nesting = 0
+
+    def emit(self, depth: int, line: str):
+        self.lines.append("    " * depth + line)
+
+    def operand(self) -> str:
+        if self.random.random() < 0.3:
+            return str(self.random.randint(1, 100))
+        return self.random.choice(self.variables)
+
+    def expression(self) -> str:
+        terms = [self.operand()]
+        for _ in range(self.chain - 1):
+            if self.random.random() < 0.1:
+                op = self.random.choice(["/", "%"])
+                terms += [op, str(self.random.randint(1, 50))]
+            else:
+                terms += [self.random.choice(OPERATORS), self.operand()]
+        return " ".join(terms)
+
+    def condition(self) -> str:
+        op = self.random.choice(COMPARISONS)
+        return f"{self.random.choice(self.variables)} {op} {self.operand()}"
+
+    def statements(self, count: int, depth: int, max_depth: int, loops: float):
+        """Emit `count` statements (nested ones included) at `depth`."""
+        while count > 0:
+            roll = self.random.random()
+            if depth < max_depth and count > 2 and roll < 0.15:
+                inner = self.random.randint(1, min(count - 1, 8))
+                self.emit(depth, f"if {self.condition()}:")
+                self.statements(inner, depth + 1, max_depth, loops)
+                count -= inner + 1
+            elif (
+                depth < max_depth
+                and count > 3
+                and roll < 0.15 + loops
+                and self.loop_nesting < MAX_LOOP_NESTING
+            ):
+                inner = self.random.randint(1, min(count - 3, 8))
+                self.loop(self.random.randint(1, 10), depth, max_depth, inner, loops)
+                count -= inner + 3
+            elif roll < 0.9:
+                self.emit(depth, f"{self.random.choice(self.variables)} = {self.expression()}")
+                count -= 1
+            else:
+                self.emit(depth, f"putn({self.random.choice(self.variables)})")
+                count -= 1
+
+    def loop(self, trips: int, depth: int, max_depth: int, inner: int, loops: float):
+        """Emit a counted `while` loop (3 statements plus `inner`)."""
+        counter = f"c{self.counters}"
+        self.counters += 1
+        self.emit(depth, f"{counter} = 0")
+        self.emit(depth, f"while {counter} < {trips}:")
+        self.loop_nesting += 1
+        self.statements(inner, depth + 1, max_depth, loops)
+        self.loop_nesting -= 1
+        self.emit(depth + 1, f"{counter} = {counter} + 1")
+
+
+def synthesize(
+    statements: int = 100,
+    depth: int = 3,
+    variables: int = 8,
+    chain: int = 3,
+    loops: float = 0.05,
+    seed: int = 0,
+) -> str:
+    """Return a random program.
+
+    - statements: number of statements, nested ones included
+    - depth: maximum nesting of `if`/`while` (below the tokenizer's 100)
+    - variables: number of variables
+    - chain: number of operands in each expression
+    - loops: probability of starting a `while` loop (1 to 10 iterations)
+    """
+    synthesizer = Synthesizer(variables, chain, seed)
+    for i, variable in enumerate(synthesizer.variables):
+        synthesizer.emit(0, f"{variable} = {i + 1}")
+    synthesizer.statements(statements, 0, depth, loops)
+    synthesizer.emit(0, "0")
+    return "\n".join(synthesizer.lines) + "\n"
+
+
+def kernel(iterations: int = 1000, inner: int = 100) -> str:
+    """A while-heavy kernel: two nested loops doing integer arithmetic."""
+    return f"""
+acc = 0
+i = 0
+while i < {iterations}:
+    j = 0
+    while j < {inner}:
+        acc = (acc * 31 + i * j + 7) % 1000003
+        if acc % 2 == 0:
+            acc = acc / 2
+        j = j + 1
+    i = i + 1
+putn(acc)
+0
+"""
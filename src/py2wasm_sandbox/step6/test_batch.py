@@ -0,0 +1,67 @@
+import os
+
+from .batch import compile_many, main
+from .compiler import compile, compile_binary
+
+SOURCES = [f"putn({i})" for i in range(20)]
+
+
+def test_order():
+    results = compile_many(SOURCES, workers=2, chunksize=3)
+    assert [result.output for result in results] == [compile(source) for source in SOURCES]
+
+
+def test_failures():
+    sources = ["putn(1)", "print(1)", "x = (", "putn(2)"]
+    results = compile_many(sources, workers=2)
+    assert [result.ok for result in results] == [True, False, False, True]
+    assert results[1].error.startswith("ValueError: Unknown function")
+    assert results[2].error.startswith("SyntaxError")
+
+
+class Crash(str):
+    """A source that kills the worker unpickling it."""
+
+    def __reduce__(self):
+        return os._exit, (1,)
+
+
+def test_worker_crash():
+    sources = [*SOURCES[:5], Crash("putn(1)"), *SOURCES[5:10]]
+    results = compile_many(sources, workers=2, chunksize=2)
+    assert [result.ok for result in results] == [True] * 5 + [False] + [True] * 5
+    assert results[5].error.startswith("BrokenProcessPool")
+    assert [result.output for result in results[6:]] == [compile(source) for source in SOURCES[5:10]]
+
+
+def test_stream():
+    results = compile_many(SOURCES, workers=2, stream=True, binary=True)
+    assert next(results).output == compile_binary(SOURCES[0])
+    assert len(list(results)) == len(SOURCES) - 1
+
+
+def test_in_process():
+    results = compile_many(SOURCES[:3], workers=1, fold=False)
+    assert results[0].output == compile(SOURCES[0], fold=False)
+
+
+def test_cli(tmp_path, capsys):
+    (tmp_path / "a.py").write_text("putn(1)")
+    (tmp_path / "b.py").write_text("x = (")
+    out = tmp_path / "out"
+    files = [str(tmp_path / "a.py"), str(tmp_path / "b.py")]
+    status = main(["-j", "2", "-o", str(out), "--binary", *files])
+    assert status == 1
+    assert (out / "a.wasm").read_bytes() == compile_binary("putn(1)")
+    assert not (out / "b.wasm").exists()
+    assert "b.py: SyntaxError" in capsys.readouterr().err
+
+
+def test_cli_directories(tmp_path):
+    for directory in ("x", "y/z"):
+        (tmp_path / directory).mkdir(parents=True)
+        (tmp_path / directory / "a.py").write_text(f"putn({len(directory)})")
+    out = tmp_path / "out"
+    assert main(["-o", str(out), str(tmp_path / "x/a.py"), str(tmp_path / "y/z/a.py")]) == 0
+    assert (out / "x/a.wat").read_text() == compile("putn(1)")
+    assert (out / "y/z/a.wat").read_text() == compile("putn(3)")
@@ -0,0 +1,58 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from .binary import encode_instructions, sleb128, uleb128
+from .compiler import compile, compile_binary
+from .test_step6 import PROG, run_node
+
+# Module for "8", as produced by `wat2wasm` from `compile("8")`
+EIGHT = bytes.fromhex(
+    "0061736d01000000"
+    "01090260017f006000017f"
+    "020f0103656e76076a735f7075746e0000"
+    "03020101"
+    "0711010d6578706f727465645f6d61696e0001"
+    "0a0701050041080f0b"
+)
+
+
+def test_uleb128():
+    assert uleb128(0) == b"\x00"
+    assert uleb128(127) == b"\x7f"
+    assert uleb128(128) == b"\x80\x01"
+    assert uleb128(624485) == b"\xe5\x8e\x26"
+
+
+def test_sleb128():
+    assert sleb128(0) == b"\x00"
+    assert sleb128(63) == b"\x3f"
+    assert sleb128(64) == b"\xc0\x00"
+    assert sleb128(-1) == b"\x7f"
+    assert sleb128(-64) == b"\x40"
+    assert sleb128(-65) == b"\xbf\x7f"
+    assert sleb128(-123456) == b"\xc0\xbb\x78"
+
+
+def test_br_table():
+    # The vector of labels, then the default one
+    assert encode_instructions(["br_table 2 0 1 ;; comment"], {}, {}) == bytes([0x0E, 2, 2, 0, 1])
+
+
+def test_literal():
+    assert compile_binary("8") == EIGHT
+
+
+@pytest.mark.skipif(not shutil.which("wat2wasm"), reason="wat2wasm not installed")
+def test_same_as_wat2wasm(tmp_path):
+    wat = tmp_path / "generated.wat"
+    wasm = tmp_path / "generated.wasm"
+    wat.write_text(compile(PROG))
+    subprocess.check_call(["wat2wasm", "-o", str(wasm), str(wat)])
+    assert compile_binary(PROG) == wasm.read_bytes()
+
+
+def test_run(tmp_path):
+    assert run_node(compile_binary(PROG), tmp_path) == [1, 3]
@@ -0,0 +1,87 @@
+import io
+
+import pytest
+
+from .block import Block
+
+
+def loop(*body) -> Block:
+    block = Block()
+    block << "loop"
+    block.indent()
+    for line in body:
+        block << line
+    block.dedent()
+    block << "end"
+    return block
+
+
+def test_indentation():
+    block = Block(["i32.const 1"])
+    block.indent()
+    block << "i32.const 2"
+    block.indent()
+    block << "drop"
+    block.dedent()
+    block.dedent()
+    block << "drop"
+    assert block.lines == ["i32.const 1", "  i32.const 2", "    drop", "drop"]
+
+
+def test_nested_blocks():
+    inner = loop("br 0")
+    outer = Block(["block"])
+    outer.indent()
+    outer << loop("nop", inner)
+    outer.dedent()
+    outer << "end"
+    assert list(outer.flatten()) == [
+        (0, "block"),
+        (1, "loop"),
+        (2, "nop"),
+        (2, "loop"),
+        (3, "br 0"),
+        (2, "end"),
+        (1, "end"),
+        (0, "end"),
+    ]
+    assert str(outer) == "\n".join(outer.lines)
+
+
+def test_shared_child():
+    # Children are stored by reference: a later change shows everywhere
+    child = Block(["nop"])
+    parent = Block()
+    parent << child
+    parent.indent()
+    parent << child
+    child << "drop"
+    assert parent.lines == ["nop", "drop", "  nop", "  drop"]
+
+
+def test_lshift_errors():
+    block = Block()
+    with pytest.raises(ValueError, match="Unknown type"):
+        block << 1
+    child = Block()
+    child.indent()
+    # A block is added once its indentation is back to 0
+    with pytest.raises(AssertionError):
+        block << child
+
+
+def test_from_flat():
+    block = loop("i32.const 1", loop("br 1"), "drop")
+    flat = list(block.flatten())
+    rebuilt = Block.from_flat(flat)
+    assert list(rebuilt.flatten()) == flat
+    assert rebuilt.indentation == 0
+    assert str(rebuilt) == str(block)
+    assert list(Block.from_flat([]).flatten()) == []
+
+
+def test_write():
+    block = loop("nop")
+    out = io.StringIO()
+    block.write(out)
+    assert out.getvalue() == str(block) == "loop\n  nop\nend"
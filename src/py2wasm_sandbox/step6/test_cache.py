@@ -0,0 +1,63 @@
+import os
+from collections import Counter
+
+import pytest
+
+from .cache import CompileCache
+from .compiler import compile, compile_binary
+from .test_step6 import PROG
+
+
+def test_hit_and_miss(tmp_path):
+    cache = CompileCache(tmp_path)
+    assert cache.compile(PROG) == compile(PROG)
+    assert cache.compile(PROG) == compile(PROG)
+    assert cache.compile(PROG, binary=True) == compile_binary(PROG)
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 0}
+
+
+def test_shared_directory(tmp_path):
+    CompileCache(tmp_path).compile("1 + 2")
+    cache = CompileCache(tmp_path)
+    cache.compile("1 + 2")
+    assert cache.hits == 1
+    assert not list(tmp_path.glob("*/.tmp-*"))
+
+
+def test_key():
+    cache = CompileCache()
+    assert cache.key("1") == cache.key("1")
+    assert cache.key("1") != cache.key("2")
+    assert cache.key("1") != cache.key("1", binary=True)
+    assert cache.key("1", a=1, b=2) == cache.key("1", b=2, a=1)
+    assert cache.key("1", stats=Counter(fold=1)) == cache.key("1")
+    with pytest.raises(TypeError, match="cache key"):
+        cache.key("1", a=object())
+
+
+def test_stats(tmp_path):
+    cache = CompileCache(tmp_path)
+    misses = Counter()
+    cache.compile(PROG, stats=misses)
+    hits = Counter()
+    assert cache.compile(PROG, stats=hits) == compile(PROG)
+    assert misses and not hits
+    assert cache.hits == 1
+
+
+def test_lru_eviction(tmp_path):
+    size = len(compile_binary("1"))
+    cache = CompileCache(tmp_path, max_size=2 * size)
+
+    first = cache.path(cache.key("1", binary=True), binary=True)
+    second = cache.path(cache.key("2", binary=True), binary=True)
+    cache.compile("1", binary=True)
+    cache.compile("2", binary=True)
+    os.utime(first, ns=(0, 0))
+    os.utime(second, ns=(1, 1))
+    cache.compile("1", binary=True)  # the hit makes "2" the least recently used
+    cache.compile("3", binary=True)
+
+    assert cache.evictions == 1
+    assert first.exists()
+    assert not second.exists()
@@ -0,0 +1,48 @@
+import ast
+
+from .compiler import compile, compile_binary
+from .dce import eliminate_dead_code
+from .fold import fold_constants
+from .runtime import run
+from .test_step6 import PROG
+
+
+def eliminated(source: str) -> str:
+    return ast.unparse(eliminate_dead_code(fold_constants(ast.parse(source))))
+
+
+def test_if():
+    assert eliminated("if 1:\n    putn(1)\nelse:\n    putn(2)") == "putn(1)"
+    assert eliminated("if 0:\n    putn(1)\nelse:\n    putn(2)") == "putn(2)"
+    assert eliminated("if 0:\n    putn(1)\nputn(3)") == "putn(3)"
+    assert eliminated("if 2 > 1:\n    putn(1)") == "putn(1)"
+
+
+def test_while():
+    assert eliminated("while 0:\n    putn(1)\nputn(2)") == "putn(2)"
+    assert eliminated("while 1 < 0:\n    putn(1)\nelse:\n    putn(2)") == "putn(2)"
+
+
+def test_unused_variables():
+    prog = """
+x = 1
+y = x + 1
+z = 2
+if 0:
+    putn(z)
+putn(1)
+"""
+    assert eliminated(prog) == "putn(1)"
+    assert "(local" not in compile(prog)
+
+
+def test_assignments_that_may_trap_are_kept():
+    assert eliminated("x = 1 / y") == "x = 1 / y"
+
+
+def test_prog():
+    wat = compile(PROG)
+    assert "if" not in wat.split()
+    assert "else" not in wat.split()
+    assert run(compile_binary(PROG)) == [1, 3]
+    assert len(compile_binary(PROG)) < len(compile_binary(PROG, dce=False))
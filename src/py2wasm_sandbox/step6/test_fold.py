@@ -0,0 +1,88 @@
+import ast
+
+from .compiler import compile, compile_binary
+from .fold import fold_constants
+from .runtime import run
+
+
+def folded(source: str) -> str:
+    return ast.unparse(fold_constants(ast.parse(source)))
+
+
+def test_binary_op():
+    assert folded("(1 + 3*5 - 4/2) % 3") == "2"
+    assert "i32.add" not in compile("putn((1 + 3*5 - 4/2) % 3)")
+
+
+def test_wrap_around():
+    assert folded("2147483647 + 1") == "-2147483648"
+    assert folded("65536 * 65536") == "0"
+    assert folded("4294967295") == "4294967295"  # left to i32.const
+    assert folded("4294967295 + 1") == "0"
+
+
+def test_truncating_division():
+    assert folded("(0 - 7) / 2") == "-3"
+    assert folded("(0 - 7) % 2") == "-1"
+    assert folded("7 % (0 - 2)") == "1"
+    assert folded("(0 - 2147483647 - 1) % (0 - 1)") == "0"
+
+
+def test_traps_are_kept():
+    assert folded("1 / 0") == "1 / 0"
+    assert folded("1 % 0") == "1 % 0"
+    assert folded("(0 - 2147483647 - 1) / (0 - 1)") == "-2147483648 / -1"
+
+
+def test_compare():
+    assert folded("1 < 2") == "1"
+    assert folded("2 <= 1") == "0"
+    assert folded("1 < 2 < 2") == "0"
+    assert folded("x < 2") == "x < 2"
+
+
+def test_unary_and_bool_ops():
+    assert folded("-(2 + 3)") == "-5"
+    assert folded("-(0 - 2147483647 - 1)") == "-2147483648"
+    assert folded("~5") == "-6"
+    assert folded("not 7") == "0"
+    assert folded("-x") == "-x"
+    assert folded("1 and x") == "x"
+    assert folded("0 and putn(x)") == "0"
+    assert folded("x or 0 or y") == "x or y"
+    assert folded("x and 3 and 0 and y") == "x and 0"
+
+
+def test_identities():
+    assert folded("x * 1") == "x"
+    assert folded("1 * x") == "x"
+    assert folded("x + 0") == "x"
+    assert folded("0 + x") == "x"
+    assert folded("x - 0") == "x"
+    assert folded("x / 1") == "x"
+    assert folded("x * 0") == "0"
+    assert folded("(x + 2 * 0) * (y - 0)") == "x * y"
+
+
+def test_side_effects_are_kept():
+    assert folded("putn(x) * 0") == "putn(x) * 0"
+    assert folded("x / y * 0") == "x / y * 0"
+
+
+def test_opt_out():
+    assert "i32.add" in compile("putn(1 + 2)", fold=False)
+    assert "i32.add" not in compile("putn(1 + 2)")
+
+
+def test_same_result():
+    prog = """
+x = 7
+putn((1 + 3*5 - 4/2) % 3)
+putn((0 - 7) / 2 + x * 1)
+putn(2147483647 + 1)
+putn((x + 0) * 0 + (0 - 7) % 2)
+0
+"""
+    expected = [2, 4, -2147483648, -1]
+    assert run(compile_binary(prog, fold=False)) == expected
+    assert run(compile_binary(prog)) == expected
@@ -0,0 +1,127 @@
+import pytest
+
+from .compiler import compile, compile_binary
+from .runtime import run
+from .test_layout import run_wasi
+
+PROG = """
+def square(x):
+    return x * x
+
+def fact(n):
+    if n < 2:
+        return 1
+    return n * fact(n - 1)
+
+def collatz(n):
+    steps = 0
+    while n != 1:
+        if n % 2 == 0:
+            n = n / 2
+        else:
+            n = 3 * n + 1
+        steps = steps + 1
+    return steps
+
+def show(a, b):
+    putn(a - b)
+
+i = 0
+total = 0
+while i < 4:
+    total = total + square(i)
+    show(i, 1)
+    i = i + 1
+putn(total)
+putn(fact(10))
+putn(collatz(27))
+putn(show(5, 2))
+fact(5)
+"""
+EXPECTED = [-1, 0, 1, 2, 14, 3628800, 111, 3, 0]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"ir": True}, {"ir": True, "inline": False}, {"ir": True, "passes": ()}],
+)
+def test_run(options):
+    wasm = compile_binary(PROG, **options)
+    assert run(wasm) == EXPECTED
+    assert run(compile_binary(PROG, output="buffer", **options)) == EXPECTED
+
+
+def test_module():
+    wat = compile(PROG)
+    assert "(func $fact (param $n i32) (result i32)" in wat
+    assert "(func $collatz (param $n i32) (result i32)" in wat
+    # Each function has its own locals
+    assert "(local $steps i32)" in wat.split("(func $collatz")[1]
+    assert "(local $steps i32)" not in wat.split("(func $collatz")[0]
+
+
+def test_wasi(tmp_path):
+    assert run_wasi(compile_binary(PROG, target="wasi"), tmp_path) == EXPECTED
+
+
+def test_scopes():
+    # Functions only see their parameters and their own variables
+    prog = """
+def f(x):
+    x = x + 1
+    return x
+
+x = 10
+putn(f(1))
+putn(x)
+0
+"""
+    for options in ({}, {"ir": True}):
+        assert run(compile_binary(prog, **options)) == [2, 10]
+        with pytest.raises(ValueError, match="Unknown variable"):
+            compile("def f():\n    return x\nx = 1\nf()", **options)
+
+
+def test_call_in_loop():
+    # The value of `v` comes from a call in the loop: the call is made in
+    # each iteration, not once on the edge leaving the loop
+    prog = """
+def f():
+    putn(1)
+    return 0
+
+def one(x):
+    return x
+
+v = one(1)
+for c in range(v % 5, 6, 3):
+    w = f() >= 7
+putn(w)
+0
+"""
+    for options in (
+        {},
+        {"ir": True},
+        {"ir": True, "inline": False},
+        {"ir": True, "inline": False, "unroll": False},
+    ):
+        assert run(compile_binary(prog, **options)) == [1, 1, 0]
+
+
+def test_errors():
+    with pytest.raises(ValueError, match="Unknown function 'g'"):
+        compile("def f():\n    return g()\n0")
+    with pytest.raises(ValueError, match=r"f\(\) takes 1 arguments, got 2"):
+        compile("def f(x):\n    return x\nf(1, 2)")
+    with pytest.raises(ValueError, match=r"putn\(\) takes 1 arguments, got 0"):
+        compile("putn()\n0")
+    with pytest.raises(ValueError, match="defined twice"):
+        compile("def f():\n    return 1\ndef f():\n    return 2\n0")
+    with pytest.raises(ValueError, match="reserved"):
+        compile("def main():\n    return 1\n0")
+    with pytest.raises(ValueError, match="Nested functions"):
+        compile("def f():\n    def g():\n        return 1\n    return 2\n0")
+    with pytest.raises(ValueError, match="positional parameters"):
+        compile("def f(x=1):\n    return x\n0")
+    with pytest.raises(ValueError, match="'return' outside function"):
+        compile("return 1")
@@ -0,0 +1,93 @@
+import ast
+from collections import Counter
+
+from .compiler import compile, compile_binary
+from .functions import definitions
+from .inline import inline_calls, remove_unused
+from .ir import verify
+from .lower import lower, lower_function
+from .passes import PassManager
+from .runtime import run
+
+PROG = """
+def clamp(x, lo, hi):
+    if x < lo:
+        return lo
+    if x > hi:
+        return hi
+    return x
+
+def square(x):
+    return x * x
+
+def mix(x):
+    return square(x) - clamp(x, 2, 5)
+
+def fact(n):
+    if n < 2:
+        return 1
+    return n * fact(n - 1)
+
+i = 0
+while i < 8:
+    putn(mix(i))
+    i = i + 1
+putn(fact(5))
+0
+"""
+
+
+def lowered(source: str):
+    tree = ast.parse(source)
+    funcs = [lower(tree)] + [lower_function(node) for node in definitions(tree).values()]
+    manager = PassManager(verify=True)
+    for func in funcs:
+        manager.run(func)
+    return funcs
+
+
+def calls(func) -> list[str]:
+    return [instr.imm for instr in func.instructions() if instr.op == "call"]
+
+
+def test_inline():
+    funcs = lowered(PROG)
+    stats = Counter()
+    changed = inline_calls(funcs, stats=stats)
+    main, clamp, square, mix, fact = funcs
+    for func in funcs:
+        verify(func)
+    # `mix` is a leaf once `square` and `clamp` are inlined in it
+    assert calls(mix) == []
+    assert sorted(calls(main)) == ["$fact", "$putn", "$putn"]
+    # Recursive functions aren't
+    assert calls(fact) == ["$fact"]
+    assert changed == {main, mix}
+    assert stats["inline"] == 3
+
+    assert [func.name for func in remove_unused(funcs)] == ["$main", "$fact"]
+
+
+def test_budget():
+    funcs = lowered(PROG)
+    inline_calls(funcs, budget=-1)
+    main, clamp, square, mix, fact = funcs
+    # Only `square` is smaller than the call it replaces
+    assert calls(mix) == ["$clamp"]
+    assert sorted(calls(main)) == ["$fact", "$mix", "$putn", "$putn"]
+
+
+def test_same_output():
+    expected = [-2, -1, 2, 6, 12, 20, 31, 44, 120]
+    assert run(compile_binary(PROG)) == expected
+    assert run(compile_binary(PROG, ir=True)) == expected
+    assert run(compile_binary(PROG, ir=True, inline=False)) == expected
+
+
+def test_module():
+    stats = Counter()
+    wat = compile(PROG, ir=True, unroll=False, stats=stats)
+    assert stats["inline"] == 3
+    assert "(func $mix" not in wat and "(func $square" not in wat
+    assert "(func $fact" in wat
+    assert "(func $mix" in compile(PROG, ir=True, inline=False)
@@ -0,0 +1,226 @@
+import ast
+import time
+from collections import Counter
+
+import pytest
+
+from .compiler import compile, compile_binary, compile_tree
+from .emit import emit
+from .ir import dump, verify
+from .lower import lower
+from .passes import DEFAULT_PASSES, PASSES, PassManager, register
+from .runtime import run
+from .synth import synthesize
+from .test_step6 import PROG, chain
+
+LOOP = """
+x = 1
+while x < 10:
+    x = x + 1
+putn(x)
+x
+"""
+
+
+def lowered(source: str):
+    func = lower(ast.parse(source))
+    verify(func)
+    return func
+
+
+def test_dump():
+    assert dump(lowered(LOOP)) == """\
+func $main() -> i32
+block0:
+  %0 = i32.const 1  ; x
+  %1 = i32.const 10
+  %2 = i32.lt_s %0, %1
+  br_if %2, block1, block2
+block1:  ; preds: block0, block1
+  %4 = phi [%0, block0], [%6, block1]  ; x
+  %5 = i32.const 1
+  %6 = i32.add %4, %5  ; x
+  %7 = i32.const 10
+  %8 = i32.lt_s %6, %7
+  br_if %8, block1, block2
+block2:  ; preds: block0, block1
+  %10 = phi [%0, block0], [%6, block1]  ; x
+  call $putn(%10)
+  return %10"""
+
+
+def test_verify():
+    func = lowered(LOOP)
+    block = func.blocks[1]
+    add = block.instrs[2]
+    block.instrs[1], block.instrs[2] = add, block.instrs[1]
+    with pytest.raises(ValueError, match="doesn't dominate"):
+        verify(func)
+
+    func = lowered(LOOP)
+    func.blocks[0].instrs.pop()
+    with pytest.raises(ValueError, match="doesn't end with a terminator"):
+        verify(func)
+
+    func = lowered(LOOP)
+    func.blocks[2].preds.pop()
+    with pytest.raises(ValueError, match="arguments for 1 predecessors"):
+        verify(func)
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        PROG,
+        LOOP,
+        # Phis assigned in a cycle
+        "a = 1\nb = 2\ni = 0\nwhile i < 3:\n    t = a\n    a = b\n    b = t\n"
+        "    putn(a)\n    i = i + 1\nputn(b)\n0",
+        # Read before being assigned on some path: locals start at 0
+        "i = 0\nwhile i < 3:\n    if i == 1:\n        y = 5\n    putn(y)\n    y = y + 1\n"
+        "    i = i + 1\n0",
+        "a = 3\nb = 4\nif a < b:\n    a = b\nelse:\n    b = a\nputn(a + b)\nputn(a / 2 + b % 3)\n0",
+        "i = 0\nn = 0\nwhile i < 4:\n    j = 0\n    while j < i:\n        n = n + j\n"
+        "        j = j + 1\n    i = i + 1\nputn(n)\nn",
+    ],
+)
+def test_same_output(source):
+    expected = run(compile_binary(source))
+    assert run(compile_binary(source, ir=True)) == expected
+    assert run(compile_binary(source, ir=True, passes=())) == expected
+    assert run(compile_binary(source, ir=True, output="buffer")) == expected
+
+
+def test_synthesized():
+    for seed in range(3):
+        source = synthesize(statements=100, depth=5, seed=seed)
+        assert run(compile_binary(source, ir=True)) == run(compile_binary(source))
+
+
+def test_nested_return():
+    # After simplify_cfg, the end of `$main` is inside the first `if`:
+    # its result is passed to the layout through `$.result`
+    source = """
+i = 0
+while i < 2:
+    i = i + 1
+if i == 2:
+    if i > 1:
+        putn(1)
+    else:
+        putn(2)
+else:
+    while 1:
+        putn(3)
+7
+"""
+    body, lctx = emit(PassManager(verify=True).run(lowered(source)))
+    assert "result" in str(body)
+    assert run(compile_binary(source, ir=True, output="buffer")) == [1]
+
+
+def test_phi_argument_effects():
+    # `v` is computed from a division that traps in the last iteration:
+    # not after the loop, on the edge leaving it
+    source = """
+n = 0
+k = 0
+while k < 3:
+    n = n + 2
+    k = k + 1
+y = 3
+i = 0
+while i < n:
+    v = 100 / y + 1
+    y = y - 1
+    i = i + 1
+putn(v)
+0
+"""
+    for options in ({}, {"ir": True}, {"ir": True, "unroll": False}):
+        with pytest.raises(ZeroDivisionError):
+            run(compile_binary(source, **options))
+
+
+def test_passes():
+    stats = Counter()
+    func = PassManager(verify=True, stats=stats).run(lowered(PROG))
+    # The `if` statements were folded by the AST passes, the loop guard by the IR ones
+    assert [block.terminator.op for block in func.blocks] == ["br", "br_if", "return"]
+    assert stats["fold"] and stats["simplify_cfg"] and stats["cse"]
+    assert "i32.lt_s" in compile(PROG, ir=True, passes=(), unroll=False)
+
+    with pytest.raises(ValueError, match="Unknown pass"):
+        PassManager(["nope"])
+
+
+def test_jump_threading():
+    # The second test is folded: the loop branches back without going through its block
+    source = "i = 0\nj = 9\nwhile i < 5 and j > 2:\n    i = i + 1\nputn(i)\n0"
+    func = PassManager(verify=True).run(lowered(source))
+    assert [block.terminator.op for block in func.blocks] == ["br", "br_if", "return"]
+    assert "if" not in compile(source, ir=True).split()
+
+
+def test_cse():
+    source = """
+i = 0
+while i < 3:
+    putn(i * 3 + 1)
+    c = i * 3 + 1
+    if c > 2:
+        putn(c + i * 3)
+    i = i + 2
+    putn(i * 3 + 1)
+0
+"""
+    without = [name for name in DEFAULT_PASSES if name != "cse"]
+    before = len(list(PassManager(without).run(lowered(source)).instructions()))
+    after = len(list(PassManager(verify=True).run(lowered(source)).instructions()))
+    assert after < before
+
+    # Once per iteration, and once more after `i` changes
+    wat = compile(source, ir=True, unroll=False)
+    assert wat.count("i32.mul") == 2
+    assert compile(source, ir=True, passes=without, unroll=False).count("i32.mul") == 4
+    # Stored where it is first used, not by the flat peephole pass
+    assert "local.tee" in compile(source, ir=True, peephole=False, unroll=False)
+    assert run(compile_binary(source, ir=True)) == run(compile_binary(source))
+
+
+def test_register():
+    calls = []
+
+    @register("test_count_blocks")
+    def count_blocks(func, stats):
+        calls.append(len(func.blocks))
+        return 0
+
+    try:
+        compile(LOOP, ir=True, passes=["test_count_blocks"], unroll=False)
+    finally:
+        del PASSES["test_count_blocks"]
+    assert calls == [3]
+
+
+def test_errors():
+    with pytest.raises(ValueError, match="Unknown variable"):
+        compile("putn(x)", ir=True)
+    with pytest.raises(ValueError, match="Unknown function"):
+        compile("print(1)", ir=True)
+    with pytest.raises(NotImplementedError, match="Unknown node type"):
+        compile("pass\n0", ir=True)
+
+
+def test_deep_expression():
+    # Lowering and emission run under the default recursion limit too
+    start = time.perf_counter()
+    wat = compile_tree(chain(10_000), ir=True, passes=())
+    small = time.perf_counter() - start
+    assert wat.count("i32.add") == 9_999
+
+    start = time.perf_counter()
+    wat = compile_tree(chain(100_000), ir=True, passes=())
+    large = time.perf_counter() - start
+    assert wat.count("i32.add") == 99_999
+    assert large < 30 * small
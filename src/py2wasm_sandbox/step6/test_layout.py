@@ -0,0 +1,134 @@
+import struct
+import subprocess
+from pathlib import Path
+
+import pytest
+import pywasm
+
+from .compiler import compile, compile_binary
+from .layout import BUFFER_CAPACITY, TEXT_CAPACITY
+from .node import NodeWorker
+from .runtime import host_function, load, run
+from .test_step6 import PROG, run_node
+
+RUN_WASI = Path(__file__).parents[3] / "javascript" / "run_wasi.js"
+
+# More values than the buffer holds, to flush it when full and at exit
+MANY = f"""
+i = 0
+while i < {BUFFER_CAPACITY + 10}:
+    putn(i - 5)
+    i = i + 1
+0
+"""
+
+
+def test_buffer():
+    assert run(compile_binary(PROG, output="buffer")) == [1, 3]
+    assert run(compile_binary("0", output="buffer")) == []
+
+
+def test_text():
+    wat = compile(PROG, output="buffer")
+    assert '(import "env" "js_flush" (func $.js_flush (param i32 i32)))' in wat
+    assert '(export "memory" (memory 0))' in wat
+    assert "js_putn" not in wat
+
+
+def test_flushes(tmp_path):
+    expected = [i - 5 for i in range(BUFFER_CAPACITY + 10)]
+    wasm = compile_binary(MANY, output="buffer")
+    assert run_node(wasm, tmp_path) == expected
+    worker = NodeWorker()
+    try:
+        assert worker.run(wasm).output == expected
+    finally:
+        worker.close()
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError, match="Unknown output mode"):
+        compile("0", output="print")
+
+
+def run_wasi(wasm: bytes, directory: Path) -> list[int]:
+    (directory / "generated.wasm").write_bytes(wasm)
+    output = subprocess.check_output(
+        ["node", str(RUN_WASI), str(directory / "generated.wasm")], stderr=subprocess.DEVNULL
+    )
+    return [int(line) for line in output.split()]
+
+
+def test_wasi(tmp_path):
+    prog = """
+x = 0 - 2147483647
+putn(x - 1)
+putn(x)
+putn(0)
+putn(7)
+putn(1234567890)
+0
+"""
+    assert run_wasi(compile_binary(prog, target="wasi"), tmp_path) == [
+        -2147483648, -2147483647, 0, 7, 1234567890
+    ]
+    assert run_wasi(compile_binary(PROG, target="wasi"), tmp_path) == [1, 3]
+
+
+def test_wasi_flushes(tmp_path):
+    # Lines of 12 bytes, for twice the buffer
+    count = 2 * TEXT_CAPACITY // 12
+    prog = f"""
+i = 0
+while i < {count}:
+    putn(i - 2147483647)
+    i = i + 1
+0
+"""
+    output = run_wasi(compile_binary(prog, target="wasi"), tmp_path)
+    assert output == [i - 2147483647 for i in range(count)]
+
+
+def run_short_writes(wasm: bytes, chunk: int, errno: int = 0) -> bytes:
+    """Run a "wasi" module whose `fd_write` writes `chunk` bytes at most, and returns `errno`."""
+    written = bytearray()
+    memory = None
+
+    def fd_write(fd, iovs, count, nwritten):
+        base, length = struct.unpack_from("<II", memory.data, iovs)
+        size = min(length, chunk)
+        written.extend(memory.data[base : base + size])
+        struct.pack_into("<I", memory.data, nwritten, size)
+        return errno
+
+    module = load(wasm)
+    runtime = pywasm.core.Runtime()
+    [imp] = module.imps
+    extern = host_function(runtime, module.type[imp.desc], fd_write)
+    runtime.imports.setdefault(imp.module, {})[imp.name] = extern
+    instance = runtime.instance(module)
+    memory = runtime.exported_memory(instance, "memory")
+    runtime.invocate(instance, "_start", [])
+    return bytes(written)
+
+
+def test_wasi_short_writes():
+    wasm = compile_binary("i = 0\nwhile i < 1000:\n    putn(i)\n    i = i + 1\n0", target="wasi")
+    expected = "".join(f"{i}\n" for i in range(1000)).encode()
+    assert run_short_writes(wasm, chunk=7) == expected
+    assert run_short_writes(wasm, chunk=1 << 20) == expected
+    # pywasm reports `unreachable` as an AssertionError
+    with pytest.raises(AssertionError):
+        run_short_writes(wasm, chunk=7, errno=8)
+
+
+def test_wasi_text():
+    wat = compile(PROG, target="wasi")
+    assert '(import "wasi_snapshot_preview1" "fd_write"' in wat
+    assert '(export "_start" (func $_start))' in wat
+    assert "exported_main" not in wat
+
+
+def test_unknown_target():
+    with pytest.raises(ValueError, match="Unknown target"):
+        compile("0", target="wasm64")
@@ -0,0 +1,129 @@
+from collections import Counter
+
+from .compiler import compile, compile_binary
+from .liveness import allocate_locals, liveness, successors
+from .peephole import parse
+from .runtime import run
+from .synth import synthesize
+
+
+def flat(text: str) -> list[tuple[int, str]]:
+    return [(0, line.strip()) for line in text.strip().splitlines()]
+
+
+def test_successors():
+    ops = [parse(line) for _, line in flat("""
+        block
+        i32.const 1
+        br_if 0
+        loop
+        br 0
+        end
+        end
+        return
+    """)]
+    assert successors(ops) == [(1,), (2,), (6, 3), (4,), (3,), (6,), (7,), (8,)]
+
+
+def test_if_else():
+    ops = [parse(line) for _, line in flat("""
+        i32.const 1
+        if
+        nop
+        else
+        nop
+        end
+    """)]
+    assert successors(ops)[1] == (2, 4)
+    assert successors(ops)[3] == (5,)
+
+
+def test_loop_liveness():
+    ops = [parse(line) for _, line in flat("""
+        i32.const 0
+        local.set $i
+        loop
+        local.get $i
+        i32.const 1
+        i32.add
+        local.tee $i
+        br_if 0
+        end
+    """)]
+    live_in, live_out = liveness(ops, {"$i": 0})
+    assert live_out[1] == 1  # read in the loop
+    assert live_in[0] == 0
+    assert live_out[6] == 1  # read again after the back edge
+
+
+def test_share():
+    code, slots = allocate_locals(flat("""
+        i32.const 1
+        local.set $a
+        local.get $a
+        call $putn
+        i32.const 2
+        local.set $b
+        local.get $b
+        call $putn
+    """))
+    assert slots == {"$a": "$a", "$b": "$a"}
+    assert ("0", "local.set $b") not in code
+
+
+def test_interfere():
+    _, slots = allocate_locals(flat("""
+        i32.const 1
+        local.set $a
+        i32.const 2
+        local.set $b
+        local.get $a
+        local.get $b
+        i32.add
+        call $putn
+    """))
+    assert slots == {"$a": "$a", "$b": "$b"}
+
+
+def test_copy():
+    stats = Counter()
+    code, slots = allocate_locals(flat("""
+        i32.const 1
+        local.set $a
+        local.get $a
+        local.set $b
+        local.get $b
+        call $putn
+    """), stats)
+    assert slots["$b"] == "$a"
+    assert [line for _, line in code] == ["i32.const 1", "local.set $a", "local.get $a", "call $putn"]
+    assert stats == {"allocate_locals": 1, "coalesced_copies": 1}
+
+
+def test_zero_initialized():
+    # $z may be read before being written: it keeps its own, zeroed, local
+    _, slots = allocate_locals(flat("""
+        i32.const 1
+        local.set $a
+        local.get $a
+        if
+        i32.const 2
+        local.set $z
+        end
+        local.get $z
+        call $putn
+    """))
+    assert slots["$z"] == "$z"
+
+
+def test_fewer_locals():
+    source = synthesize(statements=300, variables=50, loops=0.2)
+    before = compile(source, allocate=False).count("(local ")
+    after = compile(source).count("(local ")
+    assert after < before
+
+
+def test_same_result():
+    for seed in range(5):
+        source = synthesize(statements=300, variables=20, loops=0.2, seed=seed)
+        assert run(compile_binary(source)) == run(compile_binary(source, allocate=False))
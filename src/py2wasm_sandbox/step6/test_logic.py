@@ -0,0 +1,88 @@
+import pytest
+
+from .compiler import compile, compile_binary
+from .runtime import python_output, run
+
+PROG = """
+def f(x):
+    putn(x * 100)
+    return x
+
+for a in range(-1, 3):
+    for b in range(-1, 3):
+        putn(a and b)
+        putn(a or b)
+        putn(not a)
+        putn(-a + ~b)
+        putn(a < b < 2)
+        putn(a < f(b) <= 1 != a)
+        putn(f(a) or f(b) or 5)
+        putn(a == b and a != 0 or b)
+        if a and b:
+            putn(11)
+        if a or f(b):
+            putn(12)
+        else:
+            putn(13)
+        if not (a and not b) or a < b < 1:
+            putn(14)
+        if 0 <= a < f(b) < 3:
+            putn(15)
+        i = 0
+        while i < 3 and not (i == b or a < 0):
+            putn(i)
+            i = i + 1
+        putn(i)
+0
+"""
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"ir": True}, {"ir": True, "passes": ()}, {"fold": False, "peephole": False}],
+)
+def test_same_as_python(options):
+    assert run(compile_binary(PROG, **options)) == python_output(PROG)
+
+
+def test_chained_comparison():
+    # The middle operand is evaluated once, the last one only if needed
+    source = """
+def f(x):
+    putn(x)
+    return x
+
+putn(1 < f(2) < f(3))
+putn(1 < f(0) < f(3))
+if 1 < f(2) < f(3):
+    putn(9)
+0
+"""
+    for options in ({}, {"ir": True}):
+        assert run(compile_binary(source, **options)) == [2, 3, 1, 0, 0, 2, 3, 9]
+
+
+def function(body: str) -> str:
+    return f"def g(x, y):\n    {body}\nputn(g(3, 4))\n0"
+
+
+@pytest.mark.parametrize("options", [{}, {"ir": True, "inline": False}])
+def test_branches(options):
+    # Loop guards branch on each comparison, without computing `and`
+    loop = "while x < 5 and y > x:\n        x = x + 1\n    return x"
+    wat = compile(function(loop), **options)
+    assert "i32.and" not in wat and "select" not in wat
+    assert run(compile_binary(function(loop), **options)) == [4]
+
+    # Elsewhere, `select` picks the value of `and`/`or` when both operands
+    # can be evaluated, and `if` only evaluates the second one when needed
+    wat = compile(function("return (x and y + 1) + (x or y / x)"), **options)
+    assert wat.count("select") == 1 and "if" in wat
+    wat = compile(function("return 0 < x < y"), **options)
+    assert "i32.and" in wat and "br_if" not in wat
+
+
+def test_rotated_loop():
+    # Each `and` operand of the test is a `br_if`, before the loop and at its end
+    wat = compile(function("while x < 5 and y > x:\n        x = x + 1\n    return x"))
+    assert wat.count("br_if") == 4
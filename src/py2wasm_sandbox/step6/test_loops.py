@@ -0,0 +1,96 @@
+import pytest
+
+from .compiler import compile, compile_binary
+from .runtime import python_output, run
+
+PROG = """
+total = 0
+for i in range(10):
+    total = total + i
+putn(total)
+putn(i)
+n = 5
+for j in range(n, 0, 0 - 2):
+    putn(j)
+    n = 100
+s = 3
+for k in range(1, 20, s):
+    putn(k)
+    k = 50
+    s = 1
+putn(k)
+for m in range(5, 5):
+    putn(99)
+else:
+    putn(7)
+for a in range(3):
+    for a in range(a):
+        putn(a)
+d = 0 - 1
+for q in range(3, 0, d):
+    putn(q)
+putn(q)
+0
+"""
+
+
+@pytest.mark.parametrize(
+    "options", [{}, {"ir": True}, {"ir": True, "passes": ()}, {"fold": False, "dce": False}]
+)
+def test_same_as_python(options):
+    assert run(compile_binary(PROG, **options)) == python_output(PROG)
+
+
+def test_zero_step():
+    # Python raises ValueError; the loop would never end
+    source = """
+def f(x):
+    return x
+
+s = f(0)
+for i in range(0, 5, s):
+    putn(i)
+0
+"""
+    for options in ({}, {"ir": True}, {"ir": True, "inline": False}):
+        with pytest.raises(Exception):
+            run(compile_binary(source, **options))
+        assert run(compile_binary(source.replace("f(0)", "f(2)"), **options)) == [0, 2, 4]
+
+
+def test_counted_loop():
+    source = "t = 0\nfor i in range(1000):\n    t = t + i\nputn(t)\n0"
+    for options in ({}, {"ir": True}):
+        wat = compile(source, unroll=False, **options)
+        # One test before the loop, one per iteration; the counter is the variable
+        assert wat.count("i32.lt_s") + wat.count("i32.ge_s") <= 2
+        assert "select" not in wat
+        # The loop variable and the hidden counter share a local
+        assert ("(local $i " in wat) + ("(local $.for" in wat) == 1
+
+    # The sign of a variable step is only known at runtime
+    wat = compile("s = 2\nfor i in range(0, 10, s - 1):\n    putn(i)\n0")
+    assert "select" in wat
+
+
+def test_bounds_evaluated_once():
+    source = """
+def bound(n):
+    putn(n)
+    return n
+
+for i in range(bound(1), bound(4), bound(2)):
+    putn(i * 10)
+0
+"""
+    for options in ({}, {"ir": True}, {"ir": True, "inline": False}):
+        assert run(compile_binary(source, **options)) == [1, 4, 2, 10, 30]
+
+
+def test_errors():
+    with pytest.raises(ValueError, match="must not be zero"):
+        compile("for i in range(0, 3, 0):\n    putn(i)\n0")
+    with pytest.raises(NotImplementedError, match="range"):
+        compile("for i in 3:\n    putn(i)\n0")
+    with pytest.raises(ValueError, match="Unknown function 'range'"):
+        compile("x = range(3)\n0")
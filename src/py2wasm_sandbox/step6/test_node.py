@@ -0,0 +1,54 @@
+import hashlib
+
+import pytest
+
+from .compiler import compile_binary
+from .node import NodePool, NodeWorker
+from .test_step6 import PROG
+
+SOURCES = [f"putn({i})\n{i * 2}" for i in range(20)]
+
+
+@pytest.fixture
+def worker():
+    worker = NodeWorker()
+    yield worker
+    worker.close()
+
+
+def test_run(worker):
+    wasm = compile_binary(PROG)
+    assert worker.run(wasm) == ([1, 3], 0)
+    # Cached by the worker: not sent again
+    assert worker.run(wasm) == ([1, 3], 0)
+
+
+def test_evicted(worker):
+    wasm = compile_binary(PROG)
+    # As if sent before, then evicted from the worker's cache
+    worker.sent.add(hashlib.sha256(wasm).hexdigest())
+    assert worker.run(wasm).output == [1, 3]
+
+
+def test_errors(worker):
+    with pytest.raises(RuntimeError, match="CompileError"):
+        worker.run(b"\0asm")
+    with pytest.raises(RuntimeError, match="not a function"):
+        worker.run(compile_binary(PROG), "missing")
+    assert worker.run(compile_binary(PROG)).output == [1, 3]
+
+
+def test_pool():
+    modules = [compile_binary(source) for source in SOURCES]
+    with NodePool(3) as pool:
+        executions = pool.map(modules)
+        assert [execution.output for execution in executions] == [[i] for i in range(20)]
+        assert [execution.value for execution in executions] == [i * 2 for i in range(20)]
+
+
+def test_pool_restarts_workers():
+    with NodePool(1) as pool:
+        pool.workers[0].process.kill()
+        with pytest.raises(RuntimeError, match="exited"):
+            pool.run(compile_binary(PROG))
+        assert pool.run(compile_binary(PROG)).output == [1, 3]
@@ -0,0 +1,84 @@
+from collections import Counter
+
+from .compiler import compile, compile_binary
+from .peephole import optimize
+from .runtime import run
+
+
+def rewrite(*lines: str) -> tuple[list[str], Counter]:
+    stats = Counter()
+    code = optimize([(0, line) for line in lines], stats)
+    return [line for _, line in code], stats
+
+
+def test_set_get_to_tee():
+    code, stats = rewrite("i32.const 1", "local.set $x", "local.get $x", "call $putn")
+    assert code == ["i32.const 1", "local.tee $x", "call $putn"]
+    assert stats == {"set_get_to_tee": 1}
+
+
+def test_dead_store():
+    code, stats = rewrite("i32.const 1", "local.set $x", "i32.const 2", "local.set $x")
+    assert code == ["i32.const 2", "local.set $x"]
+    assert stats == {"dead_store": 1, "drop_pure": 1}
+
+
+def test_store_before_branch_is_kept():
+    code, _ = rewrite("i32.const 1", "local.set $x", "loop", "i32.const 2", "local.set $x", "end")
+    assert code[:2] == ["i32.const 1", "local.set $x"]
+
+
+def test_comparisons():
+    assert rewrite("local.get $x", "i32.const 0", "i32.eq")[0] == ["local.get $x", "i32.eqz"]
+    assert rewrite("i32.lt_s", "i32.eqz")[0] == ["i32.ge_s"]
+    assert rewrite("i32.const 0", "i32.eqz")[0] == ["i32.const 1"]
+    assert rewrite("i32.const 0", "i32.ne", "br_if 0")[0] == ["br_if 0"]
+    assert rewrite("i32.eqz", "i32.eqz", "if", "end")[0] == ["if", "end"]
+    assert rewrite("i32.eqz", "i32.eqz")[0] == ["i32.eqz", "i32.eqz"]
+
+
+def test_eqz_if():
+    code, stats = rewrite(
+        "local.get $x", "i32.eqz", "if", "i32.const 1", "call $putn",
+        "else", "i32.const 2", "call $putn", "end",
+    )  # fmt: skip
+    assert code == [
+        "local.get $x", "if", "i32.const 2", "call $putn",
+        "else", "i32.const 1", "call $putn", "end",
+    ]  # fmt: skip
+    assert stats == {"eqz_if": 1}
+
+
+def test_eqz_if_without_else():
+    code, _ = rewrite("local.get $x", "i32.eqz", "if", "nop", "end")
+    assert code == ["local.get $x", "i32.eqz", "if", "nop", "end"]
+
+
+def test_stats():
+    stats = Counter()
+    compile("x = 1\nputn(x)\nx = 2\nx = 3\nputn(x)", stats=stats)
+    assert stats == {"set_get_to_tee": 2, "dead_store": 1, "drop_pure": 1}
+
+
+def test_opt_out():
+    assert "local.tee" in compile("x = 1\nputn(x)")
+    assert "local.tee" not in compile("x = 1\nputn(x)", peephole=False)
+
+
+def test_same_result():
+    prog = """
+x = 3
+x = 4
+putn(x)
+i = 0
+while i < 5:
+    if i == 2:
+        putn(i)
+    else:
+        putn(0 - i)
+    i = i + 1
+0
+"""
+    expected = [4, 0, -1, 2, -3, -4]
+    assert run(compile_binary(prog, peephole=False)) == expected
+    assert run(compile_binary(prog)) == expected
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from . import profiling
+from .compiler import compile, compile_binary
+from .profiling import profile
+from .test_step6 import PROG
+
+
+def test_phases():
+    with profile() as prof:
+        compile(PROG)
+    assert list(prof.phases) == [
+        "parse", "fold", "dce", "unroll", "functions", "generate", "strength", "peephole", "allocate",
+        "layout", "render",
+    ]  # fmt: skip
+    assert all(entry["count"] == 1 for entry in prof.phases.values())
+
+    with profile() as prof:
+        compile_binary(PROG, peephole=False)
+    assert "encode" in prof.phases
+    assert "peephole" not in prof.phases
+
+
+def test_nodes():
+    with profile() as prof:
+        compile("x = 1\nx = x + 2\nputn(x)", fold=False)
+    assert prof.nodes["Assign"]["count"] == 2
+    assert prof.nodes["BinOp"]["count"] == 1
+    assert prof.nodes["Name"]["count"] == 2
+    assert prof.nodes["Call"]["count"] == 1
+    total = sum(entry["seconds"] for entry in prof.nodes.values())
+    assert total <= prof.phases["generate"]["seconds"]
+
+
+def test_error():
+    # The nodes interrupted by the error are not counted in the next run
+    with profile():
+        with pytest.raises(ValueError):
+            compile("x = 1\nputn(y)", fold=False)
+    assert not profiling._children
+    with profile() as prof:
+        compile("putn(1)")
+    assert prof.nodes["Call"]["count"] == 1
+    assert set(prof.nodes["Call"]) == {"count", "seconds", "net_blocks"}
+
+
+def test_hook():
+    events = []
+    with profile(lambda *event: events.append(event)):
+        compile("putn(1)")
+    assert ("phase", "parse") in [event[:2] for event in events]
+    assert ("node", "Call") in [event[:2] for event in events]
+    assert not profiling.hooks
+
+
+def test_disabled(capsys):
+    compile(PROG)
+    assert not profiling.hooks
+    assert capsys.readouterr().out == ""
+
+
+def test_dump(tmp_path):
+    with profile() as prof:
+        compile(PROG, unroll=False)
+    prof.dump(tmp_path / "profile.json")
+    data = json.loads((tmp_path / "profile.json").read_text())
+    assert data["phases"]["parse"]["count"] == 1
+    assert data["nodes"]["While"]["count"] == 1
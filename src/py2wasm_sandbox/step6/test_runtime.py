@@ -0,0 +1,45 @@
+import pytest
+
+from . import runtime
+from .compiler import compile_binary
+from .runtime import load, run
+from .test_step6 import PROG, run_node
+
+
+def test_run():
+    assert run(compile_binary(PROG)) == [1, 3]
+
+
+def test_same_as_node(tmp_path):
+    prog = """
+x = 0 - 7
+putn(x / 2)
+putn(x % 3)
+putn(x * 100000 * 100000)
+0
+"""
+    wasm = compile_binary(prog)
+    assert run(wasm) == run_node(wasm, tmp_path)
+
+
+def test_imports():
+    seen = []
+    assert run(compile_binary("putn(42)\n0"), {"env": {"js_putn": seen.append}}) == []
+    assert seen == [42]
+
+
+def test_missing_import():
+    with pytest.raises(ValueError, match="Missing import env.js_putn"):
+        run(compile_binary("0"), {"env": {"js_putn": None}})
+
+
+def test_module_cache(monkeypatch):
+    monkeypatch.setattr(runtime, "_modules", type(runtime._modules)())
+    monkeypatch.setattr(runtime, "MAX_CACHED_MODULES", 2)
+    first = compile_binary("putn(1)\n0")
+    assert load(first) is load(first)
+    load(compile_binary("putn(2)\n0"))
+    load(compile_binary("putn(3)\n0"))
+    assert len(runtime._modules) == 2
+    # Evicted, parsed again, and still runs
+    assert run(first) == [1]
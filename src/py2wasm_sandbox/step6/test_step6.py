@@ -1,9 +1,13 @@
+import ast
 import subprocess
+import time
 from pathlib import Path
 
-import pywasm
+import pytest
 
-from .compiler import compile
+from .block import Block
+from .compiler import GENERATORS, compile, compile_binary, compile_tree, register
+from .runtime import run
 
 # language=python
 PROG = """
@@ -28,26 +32,124 @@ const fs = require("fs");
 const bytes = fs.readFileSync(__dirname + "/generated.wasm");
 
 let exported_main = null; // function will be set later
+let memory = null; // exported by modules with buffered output
 
 let importObject = {
   env: {
     js_putn: function (n) {
       console.log(n);
     },
+    js_flush: function (address, count) {
+      const values = new Int32Array(memory.buffer, address, count);
+      if (count) console.log(values.join("\\n"));
+    },
   },
 };
 
 (async () => {
   let obj = await WebAssembly.instantiate(new Uint8Array(bytes), importObject);
-  ({ exported_main: exported_main } = obj.instance.exports);
+  ({ exported_main: exported_main, memory: memory } = obj.instance.exports);
   exported_main();
 })();
 """
 
 
+def run_node(wasm: bytes, directory: Path) -> list[int]:
+    """Run `wasm` with the JS harness above, return the values passed to putn."""
+    (directory / "generated.wasm").write_bytes(wasm)
+    (directory / "generated.js").write_text(JS)
+    output = subprocess.check_output(["node", str(directory / "generated.js")])
+    return [int(line) for line in output.split()]
+
+
 def test_prog():
-    wat = compile(PROG)
-    Path("tmp/generated.wat").write_text(wat)
-    subprocess.check_call(["wat2wasm", "-o", "tmp/generated.wasm", "tmp/generated.wat"])
-    Path("tmp/generated.js").write_text(JS)
-    subprocess.check_call(["node", "tmp/generated.js"])
+    assert run(compile_binary(PROG)) == [1, 3]
+
+
+def test_while():
+    prog = """
+i = 0
+while i < 3:
+    putn(i)
+    i = i + 1
+while i < 3:
+    putn(100)
+0
+"""
+    assert run(compile_binary(prog)) == [0, 1, 2]
+
+
+def test_while_else():
+    # The `else` arm runs when the loop ends, and when it doesn't run at all
+    prog = """
+def f(x):
+    return x
+
+n = f(3)
+i = 0
+while i < n:
+    putn(i)
+    i = i + 1
+else:
+    putn(77)
+while i < n:
+    putn(100)
+else:
+    putn(i)
+0
+"""
+    for options in ({}, {"ir": True}, {"ir": True, "inline": False}):
+        assert run(compile_binary(prog, **options)) == [0, 1, 2, 77, 3]
+
+
+def test_register(monkeypatch):
+    monkeypatch.setattr("py2wasm_sandbox.step6.compiler.GENERATORS", dict(GENERATORS))
+
+    @register(ast.Pass)
+    def generate_pass(tree, lctx):
+        return Block(["nop"])
+
+    assert "nop" in compile("pass\n0")
+
+
+def test_unknown_node():
+    with pytest.raises(NotImplementedError, match="Unknown node type Pass"):
+        compile("pass\n0")
+
+
+def test_bool():
+    assert run(compile_binary("putn(True)\n0")) == [1]
+
+
+def chain(terms: int) -> ast.Module:
+    """`a = 1; putn(a + a + ... + a); 0`, built directly: `ast.parse()`
+    itself recurses once per term."""
+    expr = ast.Name("a", ast.Load())
+    for _ in range(terms - 1):
+        expr = ast.BinOp(expr, ast.Add(), ast.Name("a", ast.Load()))
+    call = ast.Call(ast.Name("putn", ast.Load()), [expr], [])
+    return ast.Module(
+        [
+            ast.Assign([ast.Name("a", ast.Store())], ast.Constant(1)),
+            ast.Expr(call),
+            ast.Expr(ast.Constant(0)),
+        ],
+        [],
+    )
+
+
+def test_deep_expression():
+    # Runs under the default recursion limit, in linear time
+    start = time.perf_counter()
+    wat = compile_tree(chain(10_000))
+    small = time.perf_counter() - start
+    assert wat.count("i32.add") == 9_999
+
+    start = time.perf_counter()
+    wat = compile_tree(chain(100_000))
+    large = time.perf_counter() - start
+    assert wat.count("i32.add") == 99_999
+    assert large < 30 * small
+
+    source = "a = 3\nputn(" + " + ".join(["a"] * 300) + ")\n0"
+    assert run(compile_binary(source)) == [900]
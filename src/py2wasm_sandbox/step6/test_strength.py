@@ -0,0 +1,113 @@
+import random
+
+import pytest
+
+from .compiler import compile, compile_binary
+from .fold import INT_MIN, div_s, rem_s, wrap
+from .strength import divide, magic, multiply, remainder
+from .test_step6 import run_node
+
+DIVISORS = [2, 3, 5, 6, 7, 8, 10, 16, 25, 100, 125, 641, 1 << 20, 2**31 - 1]
+DIVISORS += [-d for d in DIVISORS]
+VALUES = [0, 1, -1, 2, -2, 7, -7, 100, -100, 2**31 - 1, INT_MIN, INT_MIN + 1]
+VALUES += random.Random(0).sample(range(INT_MIN, 2**31), 200)
+
+
+def execute(code: list[str], x: int) -> int:
+    """Evaluate an instruction sequence with `x` on the stack."""
+    stack = [x]
+    local = None
+    for line in code:
+        op, *args = line.split()
+        match op:
+            case "i32.const" | "i64.const":
+                stack.append(int(args[0]))
+            case "local.get":
+                stack.append(local)
+            case "local.set":
+                local = stack.pop()
+            case "local.tee":
+                local = stack[-1]
+            case "i64.extend_i32_s" | "i32.wrap_i64":
+                stack.append(wrap(stack.pop()))
+            case _:
+                b, a = stack.pop(), stack.pop()
+                match op:
+                    case "i32.add":
+                        stack.append(wrap(a + b))
+                    case "i32.sub":
+                        stack.append(wrap(a - b))
+                    case "i32.mul":
+                        stack.append(wrap(a * b))
+                    case "i64.mul":
+                        stack.append(a * b)  # no overflow for i32 operands
+                    case "i32.and":
+                        stack.append(wrap(a & b))
+                    case "i32.shl":
+                        stack.append(wrap(a << b))
+                    case "i32.shr_s" | "i64.shr_s":
+                        stack.append(a >> b)
+                    case "i32.shr_u":
+                        stack.append((a & 0xFFFFFFFF) >> b)
+                    case _:
+                        raise NotImplementedError(op)
+    assert len(stack) == 1
+    return wrap(stack[0])
+
+
+def test_magic():
+    assert magic(3) == (0x55555556, 0)
+    assert magic(5) == (0x66666667, 1)
+    assert magic(7) == (wrap(0x92492493), 2)
+
+
+@pytest.mark.parametrize("d", DIVISORS)
+def test_divide(d):
+    code = divide(d, lambda: "$t")
+    for x in VALUES:
+        assert execute(code, x) == div_s(x, d), x
+
+
+@pytest.mark.parametrize("d", DIVISORS)
+def test_remainder(d):
+    code = remainder(d, lambda: "$t")
+    for x in VALUES:
+        assert execute(code, x) == rem_s(x, d), x
+
+
+def test_multiply():
+    for c in (2, 8, 1 << 20, INT_MIN):
+        code = multiply(c, None)
+        for x in VALUES:
+            assert execute(code, x) == wrap(x * c)
+    assert multiply(6, None) is None
+
+
+def test_traps_are_kept():
+    assert divide(0, None) is None
+    assert divide(-1, None) is None
+    assert divide(INT_MIN, None) is None
+    assert remainder(0, None) is None
+    assert "i32.div_s" in compile("x = 1\nputn(x / 0)")
+
+
+def test_no_division_left():
+    wat = compile("x = 1\nputn(x / 7 + x % 8 + x * 16)")
+    assert "i32.div_s" not in wat
+    assert "i32.rem_s" not in wat
+    assert "i32.mul" not in wat
+    assert "i32.div_s" in compile("x = 1\nputn(x / 7)", strength=False)
+
+
+def test_differential(tmp_path):
+    """Run the reduced code in a real engine, against the i32.div_s/rem_s it replaces."""
+    xs = VALUES[:40]
+    lines = []
+    for d in DIVISORS:
+        for x in xs:
+            lines += [f"x = {x & 0xFFFFFFFF}", f"putn(x / {d & 0xFFFFFFFF})"]
+            lines += [f"putn(x % {d & 0xFFFFFFFF})"]
+    prog = "\n".join(lines) + "\n0\n"
+    expected = [f(x, d) for d in DIVISORS for x in xs for f in (div_s, rem_s)]
+    assert "i32.div_s" not in compile(prog)
+    assert run_node(compile_binary(prog), tmp_path) == expected
@@ -0,0 +1,116 @@
+import ast
+
+import pytest
+
+from .compiler import compile, compile_binary
+from .runtime import python_output, run
+from .switch import Split, Table, Comparisons, ladder, match_switch, plan
+
+PROG = """
+def kind(x):
+    match x:
+        case 0:
+            return 10
+        case 1 | 2:
+            return 20
+        case 3:
+            return 30
+        case 5:
+            return 50
+        case -7:
+            return 70
+        case _:
+            return 0
+
+def sparse(x):
+    if x == 1:
+        r = 1
+    elif x == 10 or 11 == x:
+        r = 2
+    elif x == 100:
+        r = 3
+    elif x == 1000:
+        r = 4
+    elif x == 100:
+        r = 6
+    else:
+        r = 7
+    return r
+
+def dense(x):
+    t = 0
+    match x * 2:
+        case 2:
+            t = 1
+        case 4:
+            t = 2
+        case 6 | 10:
+            t = 3
+        case 8:
+            putn(8)
+    return t
+
+i = -10
+while i < 12:
+    putn(kind(i) + sparse(i) + dense(i))
+    i = i + 1
+putn(sparse(10) + sparse(100) * 10 + sparse(1000) * 100)
+0
+"""
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"ir": True}, {"ir": True, "inline": False}, {"ir": True, "passes": ()}, {"fold": False}],
+)
+def test_same_as_python(options):
+    assert run(compile_binary(PROG, **options)) == python_output(PROG)
+
+
+def switch(source: str):
+    (tree,) = ast.parse(source).body
+    return ladder(tree) if isinstance(tree, ast.If) else match_switch(tree)
+
+
+def test_plan():
+    dense = switch("match x:\n case 3: a\n case 4 | 6: b\n case 7: c\n case _: d")
+    assert plan(dense) == Table(3, [0, 1, 3, 1, 2])
+
+    sparse = "if x == 1: a\nelif x == 10: b\nelif x == 100: c\nelif x == 1000: d\nelif x == 10000: e"
+    assert plan(switch(sparse)) == Split(
+        100, Comparisons([(1, 0), (10, 1)]), Comparisons([(100, 2), (1000, 3), (10000, 4)])
+    )
+
+    # Short ladders, or ladders that test something else, are left alone
+    assert switch("if x == 1: a\nelif x == 2: b\nelif x == 3: c") is None
+    assert switch("if x == 1: a\nelif x == 2: b\nelif y == 3: c\nelif x == 4: d") is None
+    assert switch("if x == 1: a\nelif x < 2: b\nelif x == 3: c\nelif x == 4: d") is None
+
+
+@pytest.mark.parametrize("options", [{}, {"ir": True}])
+def test_br_table(options):
+    source = """
+def f(x):
+    if x == 0:
+        return 5
+    elif x == 1:
+        return 7
+    elif x == 2 or x == 3:
+        return 9
+    elif x == 5:
+        return 11
+    return 0
+
+putn(f(3) + f(4) + f(5) + f(9))
+0
+"""
+    wat = compile(source, inline=False, **options)
+    assert "br_table" in wat and "i32.eq" not in wat
+    assert run(compile_binary(source, inline=False, **options)) == [20]
+
+
+def test_errors():
+    with pytest.raises(NotImplementedError, match="int literals"):
+        compile("x = 1\nmatch x:\n    case y:\n        putn(y)\n0")
+    with pytest.raises(NotImplementedError, match="Guards"):
+        compile("x = 1\nmatch x:\n    case 1 if x:\n        putn(x)\n0")
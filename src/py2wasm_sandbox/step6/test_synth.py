@@ -0,0 +1,30 @@
+import ast
+
+from .bench_suite import compare, count_statements
+from .compiler import compile_binary
+from .runtime import run
+from .synth import kernel, synthesize
+
+
+def test_synthesize():
+    source = synthesize(statements=200, depth=4, variables=5, chain=4, loops=0.2)
+    assert source == synthesize(statements=200, depth=4, variables=5, chain=4, loops=0.2)
+    assert count_statements(source) == 200 + 5 + 1  # initializations, final 0
+    assert max(len(line) - len(line.lstrip()) for line in source.splitlines()) <= 4 * 4
+    assert any(isinstance(node, ast.While) for node in ast.walk(ast.parse(source)))
+
+
+def test_run():
+    for seed in range(3):
+        source = synthesize(statements=100, loops=0.2, seed=seed)
+        run(compile_binary(source))
+    assert run(compile_binary(kernel(10, 10))) == [153652]
+
+
+def test_compare():
+    def results(seconds):
+        return {"results": {"a": {"compile_seconds": seconds, "statements_per_second": 10 / seconds}}}
+
+    baseline, same, slower = results(1.0), results(1.05), results(2.0)
+    assert compare(baseline, same, 0.1) == []
+    assert len(compare(baseline, slower, 0.1)) == 2
@@ -0,0 +1,180 @@
+import ast
+from collections import Counter
+
+import pytest
+
+from .compiler import compile, compile_binary
+from .runtime import python_output, run
+from .unroll import trip_count, unroll_loops
+
+PROG = """
+i = 0
+while i < 10:
+    putn(i)
+    i = i + 1
+putn(i)
+j = 20
+while j >= 3:
+    putn(j)
+    j = j - 3
+else:
+    putn(0 - j)
+k = 7
+while k != 1:
+    k = k - 2
+    putn(k * 10)
+n = 0
+while n < 40:
+    a = n * 3 + 1
+    b = a % 7
+    c = a * b + n
+    putn(c % 11 + b * 2 - a)
+    n = n + 1
+putn(n)
+t = 0
+for x in range(3, 30, 2):
+    for y in range(4):
+        t = t + x * y
+    putn(t)
+putn(x)
+for z in range(0, 103):
+    t = (t * 7 + z) % 1009
+    u = t * z + 1
+    putn(u % 13 + t - z * 2)
+putn(z)
+for w in range(10, 0, 0 - 1):
+    putn(w)
+    w = w * 2
+    putn(w)
+0
+"""
+
+
+def unrolled(source: str, factor: int = 4) -> tuple[Counter, Counter]:
+    """(statistics, node types) of `source` after unrolling."""
+    stats = Counter()
+    tree = unroll_loops(ast.parse(source), factor, stats)
+    return stats, Counter(type(node).__name__ for node in ast.walk(tree))
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {},
+        {"ir": True},
+        {"unroll_factor": 2},
+        {"unroll_factor": 3, "ir": True},
+        {"unroll_factor": 1},
+        {"fold": False, "dce": False},
+    ],
+)
+def test_same_as_python(options):
+    assert run(compile_binary(PROG, **options)) == python_output(PROG)
+
+
+def test_full():
+    stats, nodes = unrolled("i = 0\nwhile i < 10:\n    putn(i)\n    i = i + 1\n0")
+    assert stats["unroll"] == 1
+    assert nodes["While"] == 0 and nodes["Call"] == 10
+
+    stats, nodes = unrolled("for i in range(5):\n    for j in range(3):\n        putn(i * j)\n0")
+    # Inner loops first, then their copies in the outer loop
+    assert stats["unroll"] == 2
+    assert nodes["For"] == 0 and nodes["Call"] == 15
+
+
+def test_partial():
+    source = "i = 0\nwhile i < 1003:\n    putn(i * 3 + 1)\n    i = i + 1\n0"
+    stats, nodes = unrolled(source)
+    assert stats["unroll"] == 1
+    # Four copies in the first loop, one in the remainder loop
+    assert nodes["While"] == 2 and nodes["Call"] == 5
+    stats, nodes = unrolled(source, factor=1)
+    assert not stats and nodes["While"] == 1
+
+    # The copies of a `for` body that assigns its variable can't step it
+    _, nodes = unrolled("for i in range(1000):\n    putn(i)")
+    assert nodes["For"] == 2 and nodes["Expr"] == 5
+    _, nodes = unrolled("for i in range(1000):\n    i = i * 2\n    putn(i)\n0")
+    assert nodes["For"] == 1
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        # Not a constant start, bound or step
+        "i = getn()\nwhile i < 10:\n    i = i + 1\n0",
+        "i = 0\nn = getn()\nwhile i < n:\n    i = i + 1\n0",
+        "i = 0\ns = getn()\nwhile i < 10:\n    i = i + s\n0",
+        # Assigned again in the body, or assigned in a loop between
+        "i = 0\nwhile i < 10:\n    i = i + 1\n    if i == 5:\n        i = 8\n0",
+        "i = 0\nwhile i < 10:\n    i = i + 1\n    i = i + 1\n0",
+        "i = 0\nif getn():\n    i = 5\nwhile i < 10:\n    i = i + 1\n0",
+        # Never ends, or ends by wrapping around
+        "i = 0\nwhile i != 9:\n    i = i + 2\n0",
+        "i = 0\nwhile i >= 0:\n    i = i + 1\n0",
+        "i = 2147483640\nwhile i <= 2147483647:\n    i = i + 1\n0",
+        # A variable bound is only evaluated at runtime
+        "n = getn()\nfor i in range(n):\n    putn(i)\n0",
+        # No iterations: the variable isn't assigned
+        "for c in range(2, -2, 3):\n    putn(c)\n0",
+    ],
+)
+def test_not_unrolled(source):
+    stats, _ = unrolled(source)
+    assert not stats
+
+
+def test_no_iterations():
+    # Not unrolled: like the loop, the `else` reads `c` as it was before it
+    source = """
+s = 0
+for c in range(2, -2, 3):
+    s = s + 1
+else:
+    putn(c)
+c = 5
+for c in range(0):
+    s = s + 1
+putn(c)
+0
+"""
+    for options in ({}, {"ir": True}, {"unroll": False}):
+        assert run(compile_binary(source, **options)) == [0, 5]
+
+
+def test_while_else():
+    # The `else` arm runs once, after the copies or the loops
+    source = "i = 0\nwhile i < {n}:\n    putn(i)\n    i = i + 1\nelse:\n    putn(99)\n0"
+    for n in (3, 100):
+        expected = python_output(source.format(n=n))
+        for options in ({}, {"ir": True}, {"unroll": False}, {"unroll": False, "ir": True}):
+            assert run(compile_binary(source.format(n=n), **options)) == expected
+
+
+def test_trip_count():
+    assert trip_count(0, 10, 1, ast.Lt()) == 10
+    assert trip_count(0, 10, 3, ast.Lt()) == 4
+    assert trip_count(0, 10, 3, ast.LtE()) == 4
+    assert trip_count(0, 9, 3, ast.LtE()) == 4
+    assert trip_count(12, 10, 1, ast.Lt()) == 0
+    assert trip_count(20, 3, -3, ast.GtE()) == 6
+    assert trip_count(20, 3, -3, ast.Gt()) == 6
+    assert trip_count(7, 1, -2, ast.NotEq()) == 3
+    assert trip_count(0, 9, 2, ast.NotEq()) is None
+    # Moving away from the bound, or no step
+    assert trip_count(0, 10, -1, ast.Lt()) is None
+    assert trip_count(0, 10, 0, ast.Lt()) is None
+    # The variable would wrap around after the last iteration
+    assert trip_count(2**31 - 10, 2**31 - 1, 1, ast.LtE()) is None
+    assert trip_count(2**31 - 10, 2**31 - 1, 1, ast.Lt()) == 9
+
+
+def test_options():
+    source = "i = 0\nwhile i < 10:\n    putn(i)\n    i = i + 1\n0"
+    stats = Counter()
+    wat = compile(source, stats=stats)
+    assert stats["unroll"] == 1 and "loop" not in wat.split()
+    stats = Counter()
+    wat = compile(source, unroll=False, stats=stats)
+    assert not stats["unroll"] and "loop" in wat.split()
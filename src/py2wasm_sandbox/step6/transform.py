@@ -0,0 +1,76 @@
+"""
+Non-recursive AST transformer, for the passes that run on deep trees.
+
+`Transformer` works like `ast.NodeTransformer` whose `visit_*` methods
+all start with `self.generic_visit(node)`: children are transformed
+first, then the node is passed to its `visit_<class>` method, whose
+result replaces it (`None` removes it, a list is spliced into the
+parent's list). Nodes are collected with an explicit stack, so the
+depth of the tree doesn't matter.
+
+Contexts and operators (`ast.Load`, `ast.Add`...) are not visited.
+"""
+import ast
+
+# Nodes without children, shared between their parents by `ast.parse()`
+LEAVES = (ast.expr_context, ast.boolop, ast.operator, ast.unaryop, ast.cmpop)
+
+
+class Transformer:
+    # Don't descend into expressions, for passes that only rewrite statements
+    statements_only = False
+
+    def visit(self, tree: ast.AST):
+        skip = (ast.expr, *LEAVES) if self.statements_only else LEAVES
+        # Parents come before their children, in `order`
+        order = []
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            for field in node._fields:
+                value = getattr(node, field, None)
+                if isinstance(value, list):
+                    stack.extend(
+                        item
+                        for item in value
+                        if isinstance(item, ast.AST) and not isinstance(item, skip)
+                    )
+                elif isinstance(value, ast.AST) and not isinstance(value, skip):
+                    stack.append(value)
+
+        # Transformed nodes, by id of the original; `order` keeps the
+        # originals alive, so ids are not reused
+        results = {}
+        methods = {}
+        for node in reversed(order):
+            replace_children(node, results)
+            node_type = type(node)
+            if node_type not in methods:
+                methods[node_type] = getattr(self, "visit_" + node_type.__name__, None)
+            method = methods[node_type]
+            results[id(node)] = node if method is None else method(node)
+        return results[id(tree)]
+
+
+def replace_children(node: ast.AST, results: dict):
+    for field in node._fields:
+        old = getattr(node, field, None)
+        if isinstance(old, list):
+            new = []
+            for item in old:
+                if isinstance(item, ast.AST):
+                    item = results.pop(id(item), item)
+                    if item is None:
+                        continue
+                    if not isinstance(item, ast.AST):
+                        new.extend(item)
+                        continue
+                new.append(item)
+            old[:] = new
+        elif isinstance(old, ast.AST) and id(old) in results:
+            new_node = results.pop(id(old))
+            if new_node is None:
+                delattr(node, field)
+            else:
+                setattr(node, field, new_node)
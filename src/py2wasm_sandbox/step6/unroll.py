@@ -0,0 +1,224 @@
+"""
+Unrolling of loops with a constant trip count.
+
+A `while` loop runs a known number of times when its test compares a
+variable with a constant (`<`, `<=`, `>`, `>=` or `!=`), the variable is
+assigned a constant by a previous statement of the same block, and the
+body assigns it once, by adding (or subtracting) a constant in a
+statement of its own:
+
+    i = 0
+    while i < 10:
+        ...
+        i = i + 1
+
+A `for` loop over a `range()` with constant bounds does too. The counts
+are those of the i32 instructions the loops compile to: loops whose
+variable would wrap around are left alone.
+
+A loop whose body, repeated for each iteration, fits in `UNROLL_BUDGET`
+AST nodes is replaced by the copies. Otherwise, when `factor` copies of
+its body fit, it is unrolled by `factor`: a first loop runs that many
+copies per iteration for as long as they all run, then the original
+loop runs the remaining iterations. The copies of a `for` body set its
+variable to their value of the counter, and the loop is only unrolled
+partially when the body doesn't assign the variable.
+"""
+import ast
+import copy
+
+from .fold import int_value, wrap
+from .loops import counted_range
+
+# Maximum number of AST nodes in the copies of a body
+UNROLL_BUDGET = 256
+# Default number of copies per iteration of a partially unrolled loop
+UNROLL_FACTOR = 4
+
+INT_MAX = 2**31 - 1
+INT_MIN = -(2**31)
+
+
+def unroll_loops(tree: ast.AST, factor: int = UNROLL_FACTOR, stats=None) -> ast.AST:
+    """Unroll the loops of `tree` with a constant trip count, in place."""
+    # Lists of statements, parents before their children
+    lists = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        for field in ("body", "orelse", "cases"):
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                if field != "cases":
+                    lists.append(value)
+                stack.extend(value)
+    # Inner loops first: the outer ones copy them unrolled
+    for statements in reversed(lists):
+        statements[:] = unroll_list(statements, factor, stats)
+    return tree
+
+
+def unroll_list(statements: list[ast.stmt], factor: int, stats) -> list[ast.stmt]:
+    result = []
+    # Variables holding a constant, assigned by the previous statements
+    known: dict[str, int] = {}
+    for statement in statements:
+        unrolled = None
+        if isinstance(statement, ast.While):
+            unrolled = unroll_while(statement, known, factor)
+        elif isinstance(statement, ast.For):
+            unrolled = unroll_for(statement, factor)
+        if unrolled is None:
+            result.append(statement)
+        else:
+            result.extend(unrolled)
+            if stats is not None:
+                stats["unroll"] += 1
+
+        for name in assigned(statement):
+            known.pop(name, None)
+        match statement:
+            case ast.Assign(targets=[ast.Name(id=name)], value=value) if (
+                int_value(value) is not None
+            ):
+                known[name] = int_value(value)
+    return result
+
+
+def unroll_while(tree: ast.While, known: dict[str, int], factor: int) -> list[ast.stmt] | None:
+    match tree.test:
+        case ast.Compare(left=ast.Name(id=name), ops=[op], comparators=[bound]):
+            pass
+        case _:
+            return None
+    stop = int_value(bound)
+    if stop is None or name not in known:
+        return None
+    step = increment(tree.body, name)
+    if step is None:
+        return None
+    start = known[name]
+    trips = trip_count(start, stop, step, op)
+    if trips is None:
+        return None
+
+    size = count_nodes(tree.body)
+    if trips * size <= UNROLL_BUDGET:
+        return [*copies(tree.body, trips), *tree.orelse]
+    if factor < 2 or factor * size > UNROLL_BUDGET or trips < 2 * factor:
+        return None
+    # Each iteration of the first loop runs `factor` of the original ones
+    end = start + trips // factor * factor * step
+    first = ast.While(
+        ast.Compare(ast.Name(id=name, ctx=ast.Load()), [ast.NotEq()], [ast.Constant(end)]),
+        copies(tree.body, factor),
+        [],
+    )
+    return [first, tree]
+
+
+def unroll_for(tree: ast.For, factor: int) -> list[ast.stmt] | None:
+    try:
+        bounds = counted_range(tree)
+    except (NotImplementedError, ValueError):
+        return None  # reported when it is compiled
+    start, stop, step = (int_value(bound) for bound in bounds[:3])
+    if start is None or stop is None or step is None:
+        return None
+    trips = len(range(start, stop, step))
+    # Without iterations, the loop keeps the variable's value, or declares it
+    if trips == 0:
+        return None
+    if not INT_MIN <= start + trips * step <= INT_MAX:
+        return None
+
+    name = tree.target.id
+    size = count_nodes(tree.body) + 1
+    if trips * size <= UNROLL_BUDGET:
+        statements = []
+        for trip in range(trips):
+            statements.append(assign(name, ast.Constant(start + trip * step)))
+            statements.extend(copy.deepcopy(tree.body))
+        return [*statements, *tree.orelse]
+    if factor < 2 or factor * size > UNROLL_BUDGET or trips < 2 * factor:
+        return None
+    if name in {target for statement in tree.body for target in assigned(statement)}:
+        return None
+    # The copies after the first one step the variable themselves
+    body = copy.deepcopy(tree.body)
+    for _ in range(factor - 1):
+        body.append(assign(name, add(name, step)))
+        body.extend(copy.deepcopy(tree.body))
+    end = start + trips // factor * factor * step
+    first = ast.For(tree.target, range_call(start, end, factor * step), body, [])
+    rest = ast.For(tree.target, range_call(end, stop, step), tree.body, tree.orelse)
+    return [first, rest]
+
+
+def trip_count(start: int, stop: int, step: int, op: ast.cmpop) -> int | None:
+    """How many times `while i <op> stop: i = i + step` runs from `start`, without wrapping around."""
+    if step == 0:
+        return None
+    match op:
+        case ast.Lt() if step > 0:
+            trips = max(0, -((start - stop) // step))
+        case ast.LtE() if step > 0:
+            trips = max(0, (stop - start) // step + 1)
+        case ast.Gt() if step < 0:
+            trips = max(0, -((stop - start) // -step))
+        case ast.GtE() if step < 0:
+            trips = max(0, (start - stop) // -step + 1)
+        case ast.NotEq() if (stop - start) % step == 0 and (stop - start) // step >= 0:
+            trips = (stop - start) // step
+        case _:
+            return None
+    # The value of the variable after the loop
+    if not INT_MIN <= start + trips * step <= INT_MAX:
+        return None
+    return trips
+
+
+def increment(body: list[ast.stmt], name: str) -> int | None:
+    """The constant `body` adds to `name`, if it is its only assignment to it."""
+    steps = []
+    for statement in body:
+        match statement:
+            case ast.Assign(
+                targets=[ast.Name(id=target)],
+                value=ast.BinOp(left=ast.Name(id=left), op=ast.Add() | ast.Sub() as op, right=right),
+            ) if target == name and left == name and int_value(right) is not None:
+                step = int_value(right)
+                steps.append(step if isinstance(op, ast.Add) else wrap(-step))
+                continue
+        if name in assigned(statement):
+            return None
+    return steps[0] if len(steps) == 1 else None
+
+
+def assigned(statement: ast.stmt) -> set[str]:
+    return {
+        node.id
+        for node in ast.walk(statement)
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)
+    }
+
+
+def count_nodes(body: list[ast.stmt]) -> int:
+    return sum(1 for statement in body for _ in ast.walk(statement))
+
+
+def copies(body: list[ast.stmt], count: int) -> list[ast.stmt]:
+    return [statement for _ in range(count) for statement in copy.deepcopy(body)]
+
+
+def assign(name: str, value: ast.expr) -> ast.Assign:
+    return ast.Assign([ast.Name(id=name, ctx=ast.Store())], value)
+
+
+def add(name: str, step: int) -> ast.BinOp:
+    return ast.BinOp(ast.Name(id=name, ctx=ast.Load()), ast.Add(), ast.Constant(step))
+
+
+def range_call(start: int, stop: int, step: int) -> ast.Call:
+    args = [ast.Constant(start), ast.Constant(stop), ast.Constant(step)]
+    return ast.Call(ast.Name(id="range", ctx=ast.Load()), args, [])
@@ -0,0 +1,43 @@
+(module
+  (import "env" "js_putn" (func $putn (param i32)))  (export "exported_main" (func $main))
+  (func $main (result i32)
+    (local $a i32)
+    (local $b i32)
+
+    i32.const 1
+    call $putn
+
+    i32.const 1
+    i32.const 2
+    i32.add
+    i32.const 3
+    i32.add
+    local.set $a
+
+    local.get $a
+    call $putn
+
+    local.get $a
+    i32.const 1
+    i32.add
+    local.set $b
+
+    local.get $b
+    i32.const 2
+    i32.add
+    local.set $b
+
+    local.get $b
+    call $putn
+
+    local.get $a
+    local.get $b
+    i32.const 2
+    i32.mul
+    i32.add
+    call $putn
+
+    local.get $b
+    return
+  )
+)
\ No newline at end of file